@@ -0,0 +1,70 @@
+"""
+Benchmark of the dask mode of netcdf_modifier.modify_conc against the eager
+mode on a synthetic CAMx concentration file, with 1, 2, 4, ... workers up to
+the number of CPUs. Every run writes its netCDF file, and the outputs of the
+dask runs are checked to be identical to the eager one.
+
+Run it from the repository root:
+    $ python -m benchmarks.bench_dask --species 50 --rows 200 --cols 200 --scheduler threads
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import xarray as xr
+
+from netcdf_modifier import netcdf_modifier
+from benchmarks.synthetic import camx_conc
+
+def run_conc(directory, output, **kwargs):
+    nc_modify = netcdf_modifier(directory, **kwargs)
+    start = time.perf_counter()
+    new_ds, _ = nc_modify.modify_conc("conc.nc", 0, 10, 0, 20, 0, 2, [5,150], [10,150], [0,5])
+    nc_modify.to_netcdf(new_ds, directory, output)
+    return time.perf_counter() - start
+
+def worker_counts(maximum):
+    counts = [1]
+    while counts[-1]*2<=maximum:
+        counts.append(counts[-1]*2)
+    if counts[-1]!=maximum:
+        counts.append(maximum)
+    return counts
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the dask mode of modify_conc against the eager mode')
+    parser.add_argument("--hours", type=int, default=24, help='number of time steps')
+    parser.add_argument("--layers", type=int, default=10, help='number of layers')
+    parser.add_argument("--rows", type=int, default=200, help='number of rows')
+    parser.add_argument("--cols", type=int, default=200, help='number of columns')
+    parser.add_argument("--species", type=int, default=50, help='number of species')
+    parser.add_argument("--timechunk", type=int, default=1, help='number of hours per dask chunk')
+    parser.add_argument(
+        "--scheduler", type=str, default="threads", choices=["threads", "processes"],
+        help='dask scheduler'
+    )
+    parser.add_argument("--maxworkers", type=int, default=os.cpu_count(), help='largest number of workers')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        camx_conc(args.hours, args.layers, args.rows, args.cols, args.species).to_netcdf(f"{directory}/conc.nc")
+        print(f"grid (TSTEP, LAY, ROW, COL) = ({args.hours}, {args.layers}, {args.rows}, {args.cols}), "
+              f"{args.species} species, {os.path.getsize(f'{directory}/conc.nc')/2**20:.0f} MiB")
+
+        eager_time = run_conc(directory, "eager.nc")
+        print(f"eager            : {eager_time:10.4f} s")
+        with xr.open_dataset(f"{directory}/eager.nc") as eager:
+            for workers in worker_counts(args.maxworkers):
+                dask_time = run_conc(
+                    directory,
+                    f"dask{workers}.nc",
+                    dask_scheduler=args.scheduler,
+                    dask_workers=workers,
+                    dask_chunks={"TSTEP": args.timechunk},
+                )
+                with xr.open_dataset(f"{directory}/dask{workers}.nc") as out:
+                    for variable in eager.variables:
+                        np.testing.assert_array_equal(eager[variable].values, out[variable].values)
+                print(f"dask, {workers:3d} workers: {dask_time:10.4f} s ({eager_time/dask_time:.2f}x)")
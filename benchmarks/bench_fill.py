@@ -0,0 +1,58 @@
+"""
+Benchmark of the broadcast fill engine (fill_with_mean) against the former
+per-(t, z) assignment loops on a synthetic CAMx concentration dataset.
+
+Run it from the repository root:
+    $ python -m benchmarks.bench_fill --species 50 --rows 60 --cols 80
+"""
+import argparse
+import time
+
+import numpy as np
+
+from netcdf_modifier import fill_with_mean
+from benchmarks.synthetic import camx_conc
+
+EXCLUDED_VARIABLE = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
+
+def fill_with_loops(new_ds, mean_ds, excluded_variable):
+    # the fill loops netcdf_modifier used before fill_with_mean
+    for variable in new_ds.variables:
+        if variable not in excluded_variable:
+            for z in range(new_ds.sizes["LAY"]):
+                for t in range(new_ds[variable].shape[0]):
+                    new_ds[variable][t,z,:,:] = mean_ds[variable][t]
+
+def time_fill(fill, ds, mean_ds, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        new_ds = ds.copy(deep=True)
+        start = time.perf_counter()
+        fill(new_ds, mean_ds, EXCLUDED_VARIABLE)
+        best = min(best, time.perf_counter() - start)
+    return best, new_ds
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the fill engine against the per-(t, z) loops')
+    parser.add_argument("--hours", type=int, default=24, help='number of time steps')
+    parser.add_argument("--layers", type=int, default=10, help='number of layers')
+    parser.add_argument("--rows", type=int, default=60, help='number of rows')
+    parser.add_argument("--cols", type=int, default=80, help='number of columns')
+    parser.add_argument("--species", type=int, default=50, help='number of species')
+    parser.add_argument("--repeat", type=int, default=3, help='number of repetitions, the best one is reported')
+    args = parser.parse_args()
+
+    ds = camx_conc(args.hours, args.layers, args.rows, args.cols, args.species)
+    mean_ds = ds.mean(dim=["ROW", "COL", "LAY"])
+
+    loop_time, loop_ds = time_fill(fill_with_loops, ds, mean_ds, args.repeat)
+    fill_time, fill_ds = time_fill(fill_with_mean, ds, mean_ds, args.repeat)
+
+    for variable in ds.variables:
+        np.testing.assert_array_equal(loop_ds[variable].values, fill_ds[variable].values)
+
+    print(f"grid (TSTEP, LAY, ROW, COL) = ({args.hours}, {args.layers}, {args.rows}, {args.cols}), "
+          f"{args.species} species")
+    print(f"per-(t, z) loops : {loop_time:10.4f} s")
+    print(f"fill_with_mean   : {fill_time:10.4f} s")
+    print(f"speedup          : {loop_time/fill_time:10.1f}x")
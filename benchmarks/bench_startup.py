@@ -0,0 +1,72 @@
+"""
+Benchmark of the start-up time of the command line scripts: how long
+`--help`, a missing argument and an invalid argument take, in a new
+Python process each time. These never need numpy, xarray or netCDF4, so
+they should take well under --target milliseconds (100 ms by default);
+the time of an empty Python process is printed for reference.
+
+It also checks that importing each script does not import the heavy
+libraries, and exits with status 1 if a case is above --target or a
+script imports one of them.
+
+Run it from the repository root:
+    $ python -m benchmarks.bench_startup --repeat 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SCRIPTS = ["modify_conc_netcdf.py", "modify_all_netcdf.py", "modify_batch_netcdf.py", "ingest_zarr.py"]
+HEAVY_MODULES = ["numpy", "xarray", "pandas", "netCDF4", "dask", "openpyxl", "pyarrow"]
+CASES = {
+    "help": ["--help"],
+    "missing": ["-d", "."],
+    "invalid": ["-d", ".", "-ra", "20,fifty"],
+}
+
+def run_time(command, repeat):
+    # median and best wall time in milliseconds of running command repeat times
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter()-start)*1e3)
+    return statistics.median(times), min(times)
+
+def heavy_imports(script):
+    # heavy libraries imported by importing script as a module
+    code = (
+        f"import sys; import {os.path.splitext(script)[0]}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return [module for module in output.strip().split(",") if module]
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the start-up time of the command line scripts')
+    parser.add_argument("--repeat", type=int, default=10, help='number of runs of each case, the median is compared')
+    parser.add_argument("--target", type=float, default=100, help='start-up time goal in milliseconds')
+    args = parser.parse_args()
+
+    python, _ = run_time([sys.executable, "-c", "pass"], args.repeat)
+    print(f"empty python process: {python:.1f} ms")
+    print(f"{'script':<24} {'case':<8} {'median ms':>10} {'best ms':>9}")
+    failures = 0
+    for script in SCRIPTS:
+        for case, argv in CASES.items():
+            median, best = run_time([sys.executable, script]+argv, args.repeat)
+            flag = "ABOVE TARGET" if median>args.target else ""
+            failures += median>args.target
+            print(f"{script:<24} {case:<8} {median:10.1f} {best:9.1f} {flag}")
+    for script in SCRIPTS:
+        modules = heavy_imports(script)
+        if modules:
+            failures += 1
+            print(f"{script} imports {', '.join(modules)}")
+
+    if failures:
+        print(f"{failures} case(s) above {args.target:.0f} ms or with heavy imports")
+        sys.exit(1)
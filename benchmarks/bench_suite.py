@@ -0,0 +1,209 @@
+"""
+Benchmark suite of netcdf_modifier on a synthetic day of CAMx inputs (conc,
+kv, met 2D and met 3D files). It times every method and the whole
+modify_all_netcdf.py flow, and reports their throughput (cells/s and MB/s
+of the variables they modify), the peak resident memory of the process
+and how much it grew above the memory at the start of the case.
+
+The results can be saved as a baseline JSON file, and compared with a
+saved baseline: a case is flagged as a regression when its time or its
+memory growth is more than --tolerance above the baseline (and, for the
+memory, more than --memoryfloor MiB), and the script then exits with
+status 1. The memory of the process is sampled every 10 ms, and includes
+the pages of memory mapped files, so short peaks may be missed.
+
+Run it from the repository root:
+    $ python -m benchmarks.bench_suite --species 50 --rows 60 --cols 80 --save baseline.json
+    $ python -m benchmarks.bench_suite --species 50 --rows 60 --cols 80 --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import xarray as xr
+
+from modify_all_netcdf import modify_all
+from netcdf_modifier import netcdf_modifier
+from profiler import StageProfiler, rss_bytes
+from benchmarks.synthetic import write_camx_inputs
+
+EXCLUDED_VARIABLE = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
+
+def windows(NumLayer, NumRow, NumColumn):
+    # clipping and averaging windows that scale with the grid
+    return {
+        "clip": [0, max(NumRow//6, 1), 0, max(NumColumn//4, 1), 0, max(NumLayer//5, 1)],
+        "rows": [NumRow//12, max(NumRow//2, NumRow//12+1)],
+        "cols": [NumColumn//8, max(NumColumn//2, NumColumn//8+1)],
+        "layers": [0, max(NumLayer//2, 1)],
+    }
+
+def data_size(directory, FileName):
+    # number of cells and bytes of the variables that the methods modify
+    with xr.open_dataset(f"{directory}/{FileName}") as ds:
+        variables = [ds[variable] for variable in ds.data_vars if variable not in EXCLUDED_VARIABLE]
+        return sum(var.size for var in variables), sum(var.nbytes for var in variables)
+
+def run_case(case, directory, files, window, output):
+    # runs one case on a new netcdf_modifier with its own profiler, and
+    # returns its time, the peak resident memory during it and the growth
+    # of that peak above the memory at its start
+    profiler = StageProfiler()
+    nc_modify = netcdf_modifier(directory, profiler=profiler)
+    clip, rows, cols, layers = window["clip"], window["rows"], window["cols"], window["layers"]
+    inputs = {}
+    if case=="modify_met_3d":
+        inputs["met2d"], _ = nc_modify.modify_met_2d(files["met2d"], *clip[:4], rows, cols)
+    if case in ["to_excel", "to_netcdf"]:
+        inputs["conc"] = nc_modify.modify_conc(files["conc"], *clip, rows, cols, layers)
+
+    rss = rss_bytes()/2**20
+    start = time.perf_counter()
+    if case=="modify_conc":
+        nc_modify.modify_conc(files["conc"], *clip, rows, cols, layers)
+    elif case=="modify_met_kv":
+        nc_modify.modify_met_kv(files["kv"], *clip)
+    elif case=="modify_met_2d":
+        nc_modify.modify_met_2d(files["met2d"], *clip[:4], rows, cols)
+    elif case=="modify_met_3d":
+        nc_modify.modify_met_3d(inputs["met2d"], files["met3d"], *clip, rows, cols, layers)
+    elif case=="to_excel":
+        nc_modify.to_excel(inputs["conc"][1], output, "conc.xlsx")
+    elif case=="to_netcdf":
+        nc_modify.to_netcdf(inputs["conc"][0], output, "conc.nc")
+    else:
+        modify_all(
+            directory, files["conc"], files["kv"], files["met2d"], files["met3d"],
+            *clip, rows, cols, layers, output, "all", profiler=profiler,
+        )
+    seconds = time.perf_counter() - start
+    profiler.close()
+
+    report = profiler.report()
+    if case=="modify_all":
+        peak = report["peak_rss_mib"]
+    else:
+        peak = report["stages"][case]["total"]["peak_rss_mib"]
+    return seconds, peak, max(peak-rss, 0.)
+
+def run_suite(directory, files, window, repeat):
+    # the cells and bytes processed by each case, the sizes of its inputs
+    sizes = {name: data_size(directory, FileName) for name, FileName in files.items()}
+    cases = {
+        "modify_conc": sizes["conc"],
+        "modify_met_kv": sizes["kv"],
+        "modify_met_2d": sizes["met2d"],
+        "modify_met_3d": sizes["met3d"],
+        "to_excel": sizes["conc"],
+        "to_netcdf": sizes["conc"],
+        "modify_all": tuple(np.sum(list(sizes.values()), axis=0).tolist()),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as output:
+        for case, (cells, nbytes) in cases.items():
+            # the best time of repeat runs, and the largest memory
+            runs = [run_case(case, directory, files, window, output) for _ in range(repeat)]
+            seconds = min(run[0] for run in runs)
+            results[case] = {
+                "seconds": seconds,
+                "cells_per_s": cells/seconds,
+                "mb_per_s": nbytes/1e6/seconds,
+                "peak_rss_mib": max(run[1] for run in runs),
+                "growth_mib": max(run[2] for run in runs),
+            }
+    return results
+
+def compare(results, baseline, tolerance, floor):
+    # returns the lines of the comparison table and the number of regressions
+    lines = [f"{'case':<14} {'time':>10} {'baseline':>10} {'ratio':>7} {'grow MiB':>9} {'baseline':>9}"]
+    regressions = 0
+    for case, result in results.items():
+        if case not in baseline:
+            lines.append(f"{case:<14} {result['seconds']:10.4f} {'-':>10}")
+            continue
+        time_ratio = result["seconds"]/baseline[case]["seconds"]
+        memory_growth = result["growth_mib"]-baseline[case]["growth_mib"]
+        flags = []
+        if time_ratio>1+tolerance:
+            flags.append("TIME REGRESSION")
+        if memory_growth>max(tolerance*baseline[case]["growth_mib"], floor):
+            flags.append("MEMORY REGRESSION")
+        regressions += len(flags)
+        lines.append(
+            f"{case:<14} {result['seconds']:10.4f} {baseline[case]['seconds']:10.4f} {time_ratio:7.2f} "
+            f"{result['growth_mib']:9.1f} {baseline[case]['growth_mib']:9.1f} {' '.join(flags)}"
+        )
+    return lines, regressions
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the netcdf_modifier methods and modify_all on synthetic CAMx files')
+    parser.add_argument("--layers", type=int, default=10, help='number of layers')
+    parser.add_argument("--rows", type=int, default=60, help='number of rows')
+    parser.add_argument("--cols", type=int, default=80, help='number of columns')
+    parser.add_argument("--species", type=int, default=50, help='number of species')
+    parser.add_argument(
+        "--format", type=str, default="NETCDF4", choices=["NETCDF4", "NETCDF4_CLASSIC", "NETCDF3_64BIT"],
+        help='format of the synthetic input files'
+    )
+    parser.add_argument("--repeat", type=int, default=3, help='number of repetitions, the best time is reported')
+    parser.add_argument("--save", type=str, default=None, help='JSON file where the results are saved as a baseline')
+    parser.add_argument("--baseline", type=str, default=None, help='JSON file of a saved baseline to compare with')
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25,
+        help='relative increase of time or memory growth above the baseline that is flagged as a regression'
+    )
+    parser.add_argument(
+        "--memoryfloor", type=float, default=16,
+        help='increase of memory growth in MiB below which it is not flagged as a regression'
+    )
+    args = parser.parse_args()
+
+    config = {
+        "layers": args.layers,
+        "rows": args.rows,
+        "cols": args.cols,
+        "species": args.species,
+        "format": args.format,
+        "repeat": args.repeat,
+    }
+    machine = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "xarray": xr.__version__,
+    }
+    window = windows(args.layers, args.rows, args.cols)
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_camx_inputs(directory, args.layers, args.rows, args.cols, args.species, args.format)
+        print(f"grid (LAY, ROW, COL) = ({args.layers}, {args.rows}, {args.cols}), {args.species} species, "
+              f"{args.format}")
+        results = run_suite(directory, files, window, args.repeat)
+
+    print(f"{'case':<14} {'time (s)':>10} {'Mcells/s':>10} {'MB/s':>10} {'peak MiB':>9} {'grow MiB':>9}")
+    for case, result in results.items():
+        print(f"{case:<14} {result['seconds']:10.4f} {result['cells_per_s']/1e6:10.1f} "
+              f"{result['mb_per_s']:10.1f} {result['peak_rss_mib']:9.1f} {result['growth_mib']:9.1f}")
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump({"config": config, "machine": machine, "results": results}, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["config"]!=config:
+            print(f"warning: the baseline was run with {baseline['config']}")
+        if baseline["machine"]!=machine:
+            print(f"warning: the baseline was run on {baseline['machine']}")
+        lines, regressions = compare(results, baseline["results"], args.tolerance, args.memoryfloor)
+        print()
+        print("\n".join(lines))
+        if regressions:
+            print(f"{regressions} regression(s) above {args.tolerance:.0%} of the baseline")
+            sys.exit(1)
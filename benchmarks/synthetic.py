@@ -0,0 +1,142 @@
+import numpy as np
+import xarray as xr
+
+def camx_grid(
+    NumTime:int,
+    NumLayer:int,
+    NumRow:int,
+    NumColumn:int,
+    NumVariable:int=1,
+    seed:int=0,
+) -> xr.Dataset:
+    """
+    This function creates the coordinate and metadata variables that every
+    CAMx netCDF file carries (X, Y, layer, TFLAG, ETFLAG, longitude,
+    latitude, topo and z) on a synthetic grid.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (NumTime, NumLayer, NumRow, NumColumn)
+
+    tflag = np.zeros((NumTime, NumVariable, 2), dtype=np.int32)
+    tflag[:, :, 0] = 2019204
+    tflag[:, :, 1] = (np.arange(NumTime) % 24 * 10000)[:, np.newaxis]
+
+    ds = xr.Dataset()
+    ds["X"] = ("COL", np.arange(NumColumn, dtype=np.float64) * 4000.)
+    ds["Y"] = ("ROW", np.arange(NumRow, dtype=np.float64) * 4000.)
+    ds["layer"] = ("LAY", np.arange(1, NumLayer+1, dtype=np.int32))
+    ds["TFLAG"] = (("TSTEP", "VAR", "DATE-TIME"), tflag)
+    ds["ETFLAG"] = (("TSTEP", "VAR", "DATE-TIME"), tflag + [0, 10000])
+    ds["longitude"] = (("ROW", "COL"), -100. + rng.random((NumRow, NumColumn)))
+    ds["latitude"] = (("ROW", "COL"), 30. + rng.random((NumRow, NumColumn)))
+    ds["topo"] = (("ROW", "COL"), rng.random((NumRow, NumColumn), dtype=np.float32) * 500)
+    ds["z"] = (
+        ("TSTEP", "LAY", "ROW", "COL"),
+        np.cumsum(rng.random(shape, dtype=np.float32) * 100 + 20, axis=1),
+    )
+    ds.attrs["NCOLS"] = NumColumn
+    ds.attrs["NROWS"] = NumRow
+    ds.attrs["NLAYS"] = NumLayer
+    return ds
+
+def camx_conc(
+    NumTime:int=24,
+    NumLayer:int=10,
+    NumRow:int=60,
+    NumColumn:int=80,
+    NumSpecies:int=50,
+    seed:int=0,
+) -> xr.Dataset:
+    """
+    This function creates a synthetic CAMx average concentration dataset
+    with NumSpecies float32 species named SPEC0, SPEC1, ...
+    """
+    rng = np.random.default_rng(seed)
+    ds = camx_grid(NumTime, NumLayer, NumRow, NumColumn, NumSpecies, seed)
+    shape = (NumTime, NumLayer, NumRow, NumColumn)
+    for i in range(NumSpecies):
+        ds[f"SPEC{i}"] = (("TSTEP", "LAY", "ROW", "COL"), rng.random(shape, dtype=np.float32))
+    return ds
+
+# variables of the CAMx met files that netcdf_modifier handles by name
+MET2D_VARIABLES = ["snowewd", "snowage", "tcloudod", "preciprate", "cloudtop", "pblwrf", "pblcmaq", "pblysu", "sfctemp"]
+MET3D_VARIABLES = ["cloudwater", "rainwater", "grplwater", "cloudod", "uwind", "vwind", "tempk", "press", "humidity"]
+
+def camx_kv(
+    NumTime:int=25,
+    NumLayer:int=10,
+    NumRow:int=60,
+    NumColumn:int=80,
+    seed:int=0,
+) -> xr.Dataset:
+    """
+    This function creates a synthetic CAMx vertical diffusivity dataset
+    with the float32 variable kv.
+    """
+    rng = np.random.default_rng(seed)
+    ds = camx_grid(NumTime, NumLayer, NumRow, NumColumn, 1, seed)
+    shape = (NumTime, NumLayer, NumRow, NumColumn)
+    ds["kv"] = (("TSTEP", "LAY", "ROW", "COL"), rng.random(shape, dtype=np.float32) * 100)
+    return ds
+
+def camx_met2d(
+    NumTime:int=25,
+    NumRow:int=60,
+    NumColumn:int=80,
+    seed:int=0,
+) -> xr.Dataset:
+    """
+    This function creates a synthetic CAMx 2D met dataset (one layer) with
+    the float32 variables of MET2D_VARIABLES, the PBL heights between 0
+    and 3000 m.
+    """
+    rng = np.random.default_rng(seed)
+    ds = camx_grid(NumTime, 1, NumRow, NumColumn, len(MET2D_VARIABLES), seed)
+    shape = (NumTime, 1, NumRow, NumColumn)
+    for variable in MET2D_VARIABLES:
+        ds[variable] = (("TSTEP", "LAY", "ROW", "COL"), rng.random(shape, dtype=np.float32) * 3000)
+    return ds
+
+def camx_met3d(
+    NumTime:int=25,
+    NumLayer:int=10,
+    NumRow:int=60,
+    NumColumn:int=80,
+    seed:int=0,
+) -> xr.Dataset:
+    """
+    This function creates a synthetic CAMx 3D met dataset with the float32
+    variables of MET3D_VARIABLES and the layer heights z.
+    """
+    rng = np.random.default_rng(seed)
+    ds = camx_grid(NumTime, NumLayer, NumRow, NumColumn, len(MET3D_VARIABLES), seed)
+    shape = (NumTime, NumLayer, NumRow, NumColumn)
+    for variable in MET3D_VARIABLES:
+        ds[variable] = (("TSTEP", "LAY", "ROW", "COL"), rng.random(shape, dtype=np.float32))
+    return ds
+
+def write_camx_inputs(
+    directory:str,
+    NumLayer:int=10,
+    NumRow:int=60,
+    NumColumn:int=80,
+    NumSpecies:int=50,
+    Format:str="NETCDF4",
+    seed:int=0,
+) -> dict:
+    """
+    This function writes a synthetic day of CAMx inputs to directory: the
+    24 hour conc file and the 25 hour kv, met 2D and met 3D files, and
+    returns their file names as {"conc": ..., "kv": ..., "met2d": ...,
+    "met3d": ...}.
+    """
+    files = {"conc": "conc.nc", "kv": "kv.nc", "met2d": "met2d.nc", "met3d": "met3d.nc"}
+    datasets = {
+        "conc": camx_conc(24, NumLayer, NumRow, NumColumn, NumSpecies, seed),
+        "kv": camx_kv(25, NumLayer, NumRow, NumColumn, seed+1),
+        "met2d": camx_met2d(25, NumRow, NumColumn, seed+2),
+        "met3d": camx_met3d(25, NumLayer, NumRow, NumColumn, seed+3),
+    }
+    for name, ds in datasets.items():
+        ds.to_netcdf(f"{directory}/{files[name]}", format=Format)
+    return files
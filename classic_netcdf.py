@@ -0,0 +1,174 @@
+import os
+import numpy as np
+import xarray as xr
+from xarray.backends import BackendArray
+from xarray.core import indexing
+
+# tags and types of the classic netCDF format (CDF-1 and CDF-2)
+NC_DIMENSION = 10
+NC_VARIABLE = 11
+NC_ATTRIBUTE = 12
+NC_TYPES = {
+    1: np.dtype("i1"),
+    2: np.dtype("S1"),
+    3: np.dtype(">i2"),
+    4: np.dtype(">i4"),
+    5: np.dtype(">f4"),
+    6: np.dtype(">f8"),
+}
+
+def is_classic_netcdf(path:str) -> bool:
+    """
+    Returns True if the file at path is a classic (CDF-1) or 64-bit offset
+    (CDF-2) netCDF file, whose variables are contiguous arrays at fixed
+    offsets.
+    """
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(4) in [b"CDF\x01", b"CDF\x02"]
+
+class _HeaderReader:
+    # reads the big-endian header of a classic netCDF file from a buffer
+    def __init__(self, buffer, version:int) -> None:
+        self.buffer = buffer
+        self.position = 4
+        self.version = version
+        pass
+
+    def integer(self) -> int:
+        value = int.from_bytes(self.buffer[self.position:self.position+4], "big")
+        self.position += 4
+        return value
+
+    def offset(self) -> int:
+        size = 4 if self.version==1 else 8
+        value = int.from_bytes(self.buffer[self.position:self.position+size], "big")
+        self.position += size
+        return value
+
+    def padded(self, size:int) -> bytes:
+        value = bytes(self.buffer[self.position:self.position+size])
+        self.position += -(-size//4)*4
+        return value
+
+    def name(self) -> str:
+        return self.padded(self.integer()).decode("utf-8")
+
+    def list_of(self, tag:int, read) -> list:
+        found = self.integer()
+        count = self.integer()
+        if found==0:
+            return []
+        if found!=tag:
+            raise ValueError(f"unexpected tag {found} in the netCDF header")
+        return [read() for _ in range(count)]
+
+    def attribute(self):
+        name = self.name()
+        dtype = NC_TYPES[self.integer()]
+        count = self.integer()
+        raw = self.padded(count*dtype.itemsize)
+        if dtype.kind=="S":
+            return name, raw.rstrip(b"\x00").decode("utf-8", errors="replace")
+        values = np.frombuffer(raw, dtype=dtype).astype(dtype.newbyteorder("="))
+        # single values are scalars, like netCDF4 returns them
+        return name, values[0] if count==1 else values
+
+    def dimension(self):
+        return self.name(), self.integer()
+
+    def variable(self):
+        name = self.name()
+        dimids = [self.integer() for _ in range(self.integer())]
+        attrs = dict(self.list_of(NC_ATTRIBUTE, self.attribute))
+        dtype = NC_TYPES[self.integer()]
+        vsize = self.integer()
+        begin = self.offset()
+        return {"name": name, "dimids": dimids, "attrs": attrs, "dtype": dtype, "vsize": vsize, "begin": begin}
+
+class MemmapArray(BackendArray):
+    """
+    A variable of a classic netCDF file seen through a memory map. Indexing
+    it slices a strided view of the map and only copies the selected values,
+    so only the pages of the file that hold them are read.
+    """
+    def __init__(self, memmap:np.memmap, shape:tuple, dtype:np.dtype, begin:int, strides:tuple) -> None:
+        self.memmap = memmap
+        self.shape = shape
+        self.dtype = dtype.newbyteorder("=") if dtype.kind!="S" else dtype
+        self.view = np.ndarray(shape, dtype=dtype, buffer=memmap, offset=begin, strides=strides)
+        pass
+
+    def __getitem__(self, key):
+        return indexing.explicit_indexing_adapter(
+            key, self.shape, indexing.IndexingSupport.BASIC, self._getitem,
+        )
+
+    def _getitem(self, key):
+        # the only copy: the selected values, in the native byte order
+        return np.array(self.view[key], dtype=self.dtype)
+
+def open_classic_dataset(path:str) -> xr.Dataset:
+    """
+    Opens a classic or 64-bit offset netCDF file through a read-only
+    memory map, without netCDF4 or HDF5, and decodes it like
+    xr.open_dataset does.
+    ...
+    Parameters
+    ----------
+    path : str
+        path of the netCDF file, see is_classic_netcdf
+
+    Returns
+    -------
+    xr.Dataset
+        that is lazy: the values are read from the memory map when they
+        are indexed or loaded.
+
+    Caveat
+    -------
+    The record (unlimited) dimension is kept in encoding["unlimited_dims"]
+    so it stays unlimited when the dataset is written again. The memory map
+    is released when the dataset and its arrays are garbage collected.
+    """
+    memmap = np.memmap(path, dtype=np.uint8, mode="r")
+    magic = bytes(memmap[:4])
+    if magic not in [b"CDF\x01", b"CDF\x02"]:
+        raise ValueError(f"{path} is not a classic or 64-bit offset netCDF file")
+    header = _HeaderReader(memmap, magic[3])
+    numrecs = header.integer()
+    dimensions = header.list_of(NC_DIMENSION, header.dimension)
+    attrs = dict(header.list_of(NC_ATTRIBUTE, header.attribute))
+    variables = header.list_of(NC_VARIABLE, header.variable)
+
+    record_dim = next((name for name, size in dimensions if size==0), None)
+    for variable in variables:
+        variable["record"] = bool(variable["dimids"]) and dimensions[variable["dimids"][0]][1]==0
+    records = [variable for variable in variables if variable["record"]]
+    if len(records)==1:
+        # a single record variable is not padded
+        variable = records[0]
+        recsize = variable["dtype"].itemsize*int(np.prod([dimensions[i][1] for i in variable["dimids"][1:]]))
+    else:
+        recsize = sum(variable["vsize"] for variable in records)
+
+    raw = {}
+    for variable in variables:
+        dims = tuple(dimensions[i][0] for i in variable["dimids"])
+        shape = tuple(numrecs if dimensions[i][1]==0 else dimensions[i][1] for i in variable["dimids"])
+        # C-contiguous strides, except that the records are recsize apart
+        strides = []
+        stride = variable["dtype"].itemsize
+        for size in reversed(shape):
+            strides.insert(0, stride)
+            stride *= size
+        if variable["record"]:
+            strides[0] = recsize
+        data = MemmapArray(memmap, shape, variable["dtype"], variable["begin"], tuple(strides))
+        raw[variable["name"]] = xr.Variable(dims, indexing.LazilyIndexedArray(data), variable["attrs"])
+
+    ds = xr.decode_cf(xr.Dataset(raw, attrs=attrs))
+    ds.encoding["source"] = path
+    ds.encoding["unlimited_dims"] = {record_dim} if record_dim is not None else set()
+    return ds
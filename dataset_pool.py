@@ -0,0 +1,113 @@
+from collections import OrderedDict
+import os
+import threading
+
+class DatasetPool:
+    """
+    Least recently used pool of open datasets, keyed by the path of the
+    file and the way it is opened, so that repeated requests on the same
+    files skip opening them and decoding their metadata.
+    ...
+    Parameters
+    ----------
+    max_size : int
+        largest number of open datasets kept in the pool
+
+    Example
+    -------
+    pool = DatasetPool(8)
+    nc_modify = netcdf_modifier("../inputs", dataset_pool=pool)
+
+    Caveat
+    -------
+    A dataset is reopened when the size or the modification time of its
+    file changed. A dataset that is still in use when it is evicted is only
+    closed once it is released. When two requests open the same file at
+    the same time, the second dataset is closed and the first one shared.
+    """
+    def __init__(self, max_size:int=8) -> None:
+        if (max_size<1):
+            raise ValueError("max_size must be at least one.")
+        self.max_size = max_size
+        self.datasets = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # dataset id -> [dataset, number of users, closed once released]
+        self._users = {}
+        pass
+
+    def acquire(self, path:str, mode, opener):
+        """
+        Returns the dataset of path opened in mode, opening it with
+        opener() if it is not in the pool. Every acquire must be followed
+        by a release of the dataset.
+        """
+        stat = os.stat(path)
+        key = (os.path.realpath(path), mode)
+        with self._lock:
+            entry = self.datasets.get(key)
+            if entry is not None and entry[1]==(stat.st_size, stat.st_mtime_ns):
+                self.datasets.move_to_end(key)
+                self.hits += 1
+                self._users[id(entry[0])][1] += 1
+                return entry[0]
+            if entry is not None:
+                # the file changed since it was opened
+                self._discard(key)
+            self.misses += 1
+        # opened outside the lock so other requests are not blocked
+        ds = opener()
+        duplicate = None
+        with self._lock:
+            entry = self.datasets.get(key)
+            if entry is not None and entry[1]==(stat.st_size, stat.st_mtime_ns):
+                # another request opened the same file in the meantime, its
+                # dataset is shared and this one closed
+                self._users[id(entry[0])][1] += 1
+                duplicate, ds = ds, entry[0]
+            else:
+                if entry is not None:
+                    self._discard(key)
+                self.datasets[key] = (ds, (stat.st_size, stat.st_mtime_ns))
+                self._users[id(ds)] = [ds, 1, False]
+                while len(self.datasets)>self.max_size:
+                    self._discard(next(iter(self.datasets)))
+        if duplicate is not None:
+            duplicate.close()
+        return ds
+
+    def release(self, ds) -> None:
+        """
+        Gives back a dataset returned by acquire, and closes it if it was
+        evicted in the meantime and nobody else uses it.
+        """
+        with self._lock:
+            users = self._users.get(id(ds))
+            if users is None:
+                return
+            users[1] -= 1
+            if users[1]==0 and users[2]:
+                del self._users[id(ds)]
+                users[0].close()
+        pass
+
+    def _discard(self, key) -> None:
+        # removes key from the pool, closing its dataset if it is not used
+        ds, _ = self.datasets.pop(key)
+        users = self._users[id(ds)]
+        if users[1]==0:
+            del self._users[id(ds)]
+            ds.close()
+        else:
+            users[2] = True
+        pass
+
+    def close(self) -> None:
+        """
+        Closes every dataset of the pool that is not in use.
+        """
+        with self._lock:
+            for key in list(self.datasets):
+                self._discard(key)
+        pass
@@ -0,0 +1,93 @@
+from script_arguments import date_range, glob_dates
+import argparse
+import os
+import time
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Convert the CAMx files of many days into one Zarr store')
+    parser.add_argument(
+        "-d", "--directory",
+        type=str, required=True,
+        help='directory where the input files are, the store is written there too'
+    )
+    parser.add_argument(
+        "-f", "--filename",
+        type=str, required=True,
+        help='input filename with a {date} placeholder for the YYYYMMDD day'
+    )
+    parser.add_argument(
+        "-st", "--store",
+        type=str, required=True,
+        help='name of the Zarr store, e.g. conc.201907.zarr'
+    )
+    parser.add_argument(
+        "-sd", "--startdate",
+        type=str,
+        help='first day as YYYYMMDD, the days are found from the files in the directory '+
+        'if it is not given'
+    )
+    parser.add_argument(
+        "-ed", "--enddate",
+        type=str,
+        help='last day (included) as YYYYMMDD'
+    )
+    parser.add_argument(
+        "-tc", "--timechunk",
+        type=int, default=24,
+        help='number of hours per chunk of the store'
+    )
+    parser.add_argument(
+        "-ts", "--tilesize",
+        type=int, default=64,
+        help='number of rows and columns per chunk of the store'
+    )
+    parser.add_argument(
+        "-cl", "--compression",
+        type=int, choices=range(10), default=5,
+        help='Blosc lz4 level of the chunks from 1 to 9, or 0 for none'
+    )
+    parser.add_argument(
+        "-ow", "--overwrite",
+        action="store_true",
+        help='write the store again from the first day, instead of appending the new days'
+    )
+    return parser
+
+def main(argv:list=None) -> None:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if "{date}" not in args.filename:
+        parser.error("--filename must contain a {date} placeholder")
+    if (args.startdate is None)!=(args.enddate is None):
+        parser.error("--startdate and --enddate must be given together")
+    if args.startdate is None:
+        dates = glob_dates(args.directory, args.filename)
+    else:
+        dates = date_range(args.startdate, args.enddate)
+    filenames = [args.filename.format(date=date) for date in dates]
+    missing = [name for name in filenames if not os.path.isfile(os.path.join(args.directory, name))]
+    if not filenames:
+        parser.error("no day to ingest")
+    if missing:
+        parser.error("the input files do not exist: "+", ".join(missing))
+
+    # the libraries of the modifier are only imported once the arguments are valid
+    from netcdf_modifier import netcdf_modifier
+
+    start = time.perf_counter()
+    nc_modify = netcdf_modifier(args.directory)
+    appended = nc_modify.ingest_zarr(
+        filenames,
+        args.store,
+        {"TSTEP": args.timechunk, "ROW": args.tilesize, "COL": args.tilesize},
+        args.compression,
+        args.overwrite,
+    )
+    print(
+        f"{len(appended)} of {len(filenames)} files appended to {os.path.join(args.directory, args.store)} "
+        f"in {time.perf_counter()-start:.1f} s"
+    )
+
+if __name__=="__main__":
+    main()
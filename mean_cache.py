@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import xarray as xr
+
+class MeanCache:
+    """
+    On-disk cache of the window means of netcdf_modifier, one compressed
+    .npz file per key. A key is the hash of the input file identity (path,
+    size and modification time) and of the averaging window, so changing
+    the clip extent of a run still hits the cache, while a modified input
+    file misses it.
+    ...
+    Parameters
+    ----------
+    directory : str
+        directory where the cached means are kept
+    max_bytes : int
+        once the cache is bigger than this, the least recently used
+        entries are removed
+
+    Caveat
+    -------
+    The last use of an entry is its modification time, which is updated on
+    every hit.
+    """
+    def __init__(self, directory:str, max_bytes:int=2**30) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        pass
+
+    def key(self, FilePath:str, Kind:str, Window:dict) -> str:
+        """
+        Returns the key of the means of kind Kind (e.g. "conc") of the file
+        at FilePath over the slices of Window.
+        """
+        stat = os.stat(FilePath)
+        identity = {
+            "file": os.path.abspath(FilePath),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "kind": Kind,
+            "window": {dim: [index.start, index.stop] for dim, index in sorted(Window.items())},
+        }
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key:str) -> str:
+        return os.path.join(self.directory, key+".npz")
+
+    def get(self, key:str):
+        """
+        Returns the dictionary of datasets stored under key, or None.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as npz:
+                dims = json.loads(str(npz["__dims__"]))
+                datasets = {}
+                for name, variable in (entry.split("|", 1) for entry in dims):
+                    datasets.setdefault(name, {})[variable] = (dims[f"{name}|{variable}"], npz[f"{name}|{variable}"])
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return {name: xr.Dataset(variables) for name, variables in datasets.items()}
+
+    def put(self, key:str, Datasets:dict) -> None:
+        """
+        Stores the dictionary of datasets Datasets under key, then removes
+        the least recently used entries above max_bytes.
+        """
+        arrays = {}
+        dims = {}
+        for name, ds in Datasets.items():
+            for variable in ds.variables:
+                arrays[f"{name}|{variable}"] = ds.variables[variable].values
+                dims[f"{name}|{variable}"] = list(ds.variables[variable].dims)
+        arrays["__dims__"] = np.array(json.dumps(dims))
+
+        # write to a temporary file first so a reader never sees half an entry
+        path = self._path(key)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(temporary, path)
+        self.evict()
+        pass
+
+    def evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total<=self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+        pass
+
+    def size(self) -> int:
+        return sum(
+            entry.stat().st_size for entry in os.scandir(self.directory)
+            if entry.name.endswith(".npz")
+        )
@@ -1,8 +1,258 @@
-from netcdf_modifier import *
+from script_arguments import add_window_arguments, index_list, pattern_list
+from typing import TYPE_CHECKING
 import argparse
+import os
 
+if TYPE_CHECKING:
+    from dataset_pool import DatasetPool
+    from netcdf_modifier import netcdf_modifier
+    from profiler import StageProfiler
 
-if __name__=="__main__":
+def modify_all(
+    directory:str,
+    fnameconc:str,
+    fnamekv:str,
+    fnamemet2d:str,
+    fnamemet3d:str,
+    rowstart:int,
+    rowend:int,
+    colstart:int,
+    colend:int,
+    laystart:int,
+    layend:int,
+    rowindexavg:list,
+    columnindexavg:list,
+    layerindexavg:list,
+    outputdir:str,
+    outputname:str,
+    stream:bool=False,
+    timechunk:int=1,
+    parallel:bool=False,
+    windowindex:bool=False,
+    meancache:str=None,
+    meancachesize:float=1024,
+    dask:str=None,
+    daskworkers:int=None,
+    outputformat:str=None,
+    compression:int=None,
+    downcast:bool=False,
+    summaryformat:str="sheets",
+    memorymap:bool=True,
+    profiler:"StageProfiler"=None,
+    smoothvariables:list=None,
+    smoothwindow:int=3,
+    smoothhours:tuple=(1, 12),
+    rulemeans:bool=True,
+    datasetpool:"DatasetPool"=None,
+    compact:bool=False,
+    species:list=None,
+    excludespecies:list=None,
+) -> "netcdf_modifier":
+    """
+    This function modifies the conc, kv, met 2D and met 3D files of one day
+    and writes the netCDF and excel files to outputdir, each named
+    outputname followed by _conc, _kv, _met2d or _met3d.
+
+    The steps are run as a TaskGraph: only met 3D depends on another step
+    (met 2D), and every excel/netCDF write is a task of its own. With
+    parallel, the tasks run on a pool of threads, so the conc, kv and
+    met 2D -> met 3D chains and the writes overlap; otherwise they run one
+    after the other in the calling thread.
+
+    With dask ("threads", "processes" or "synchronous"), the kv, met and
+    (unless stream) conc files are opened with dask chunks of timechunk
+    hours and processed as dask graphs on that scheduler.
+
+    outputformat, compression and downcast set the encoding of the output
+    netCDF files (see netcdf_encoding), except the one written by stream.
+    With outputformat "UAMIV", they are CAMx binary files named .bin, with
+    the headers and variable names of the CAMx conc, kv and met files (see
+    write_uamiv).
+
+    summaryformat is "sheets" for the excel files with one sheet per
+    species, or "parquet", "csv" or "xlsx" for one long table per file
+    written on a background thread (see netcdf_modifier.to_summary).
+
+    With memorymap, the NETCDF3 input files are read through a memory
+    map (see classic_netcdf). With profiler, the stages of every step are
+    recorded in it.
+
+    smoothvariables are the variables of the conc, met 2D and met 3D files
+    whose hours smoothhours[0] to smoothhours[1] (excluded) are replaced by
+    the mean of the smoothwindow hours ending at each hour (see
+    smooth_in_time). The conc file can not be smoothed with stream.
+
+    With rulemeans (the default), the met variables that are reset to
+    constants (see MET2D_RULES and MET3D_RULES) are still read and
+    averaged for the met excel files. Without it, they are neither read
+    nor averaged, and are not in the met excel files.
+
+    With datasetpool, the input files are taken from that pool of open
+    datasets (see modify_server.py). With compact, the filled variables
+    are kept as their (TSTEP, LAY) profiles instead of full grids (see
+    netcdf_modifier).
+
+    species and excludespecies select the species of the conc file (see
+    select_species); the others are dropped when it is opened. The met
+    files keep every variable.
+    """
+    # ----------------------------------------------------------------------
+    # Error checking
+    if (stream and smoothvariables):
+        raise ValueError("smoothvariables can not be used with stream")
+    # -----------------------------------------------------------------------
+    from netcdf_modifier import MeanCache, netcdf_modifier
+    from task_graph import InlineExecutor, TaskGraph, TaskResult
+    from concurrent.futures import ThreadPoolExecutor
+
+    mean_cache = None
+    if meancache is not None:
+        mean_cache = MeanCache(meancache, int(meancachesize*2**20))
+    nc_modify = netcdf_modifier(
+        directory,
+        mean_cache=mean_cache,
+        dask_scheduler=dask,
+        dask_workers=daskworkers,
+        dask_chunks={"TSTEP": timechunk},
+        memory_map=memorymap,
+        profiler=profiler,
+        dataset_pool=datasetpool,
+        compact=compact,
+        species=species,
+        exclude_species=excludespecies,
+    )
+    netcdf_options = {"Format": outputformat, "Compression": compression, "Downcast": downcast}
+    extension = ".bin" if outputformat=="UAMIV" else ".nc"
+    smooth_options = {"SmoothVariables": smoothvariables, "SmoothWindow": smoothwindow, "SmoothHours": smoothhours}
+    graph = TaskGraph()
+
+    def add_means(name, result, suffix):
+        if summaryformat=="sheets":
+            graph.add(name, nc_modify.to_excel, result, outputdir, outputname+suffix+".xlsx")
+        else:
+            graph.add(
+                name, nc_modify.to_summary, result, outputdir, outputname+suffix+"."+summaryformat, summaryformat,
+            )
+
+    if stream:
+        graph.add(
+            "conc",
+            nc_modify.modify_conc_stream,
+            fnameconc,
+            rowstart,
+            rowend,
+            colstart,
+            colend,
+            laystart,
+            layend,
+            rowindexavg,
+            columnindexavg,
+            layerindexavg,
+            outputdir,
+            outputname+"_conc.nc",
+            timechunk,
+        )
+        add_means("conc_excel", TaskResult("conc"), "_conc")
+    else:
+        graph.add(
+            "conc",
+            nc_modify.modify_conc,
+            fnameconc,
+            rowstart,
+            rowend,
+            colstart,
+            colend,
+            laystart,
+            layend,
+            rowindexavg,
+            columnindexavg,
+            layerindexavg,
+            windowindex,
+            **smooth_options,
+        )
+        add_means("conc_excel", TaskResult("conc", 1), "_conc")
+        graph.add("conc_netcdf", nc_modify.to_netcdf, TaskResult("conc", 0), outputdir, outputname+"_conc"+extension, **netcdf_options)
+
+    graph.add(
+        "kv",
+        nc_modify.modify_met_kv,
+        fnamekv,
+        rowstart,
+        rowend,
+        colstart,
+        colend,
+        laystart,
+        layend,
+    )
+    graph.add("kv_netcdf", nc_modify.to_netcdf, TaskResult("kv"), outputdir, outputname+"_kv"+extension, **netcdf_options)
+
+    graph.add(
+        "met2d",
+        nc_modify.modify_met_2d,
+        fnamemet2d,
+        rowstart,
+        rowend,
+        colstart,
+        colend,
+        rowindexavg,
+        columnindexavg,
+        WindowIndex=windowindex,
+        KeepRuleMeans=rulemeans,
+        **smooth_options,
+    )
+    add_means("met2d_excel", TaskResult("met2d", 1), "_met2d")
+    graph.add("met2d_netcdf", nc_modify.to_netcdf, TaskResult("met2d", 0), outputdir, outputname+"_met2d"+extension, **netcdf_options)
+
+    graph.add(
+        "met3d",
+        nc_modify.modify_met_3d,
+        TaskResult("met2d", 0),
+        fnamemet3d,
+        rowstart,
+        rowend,
+        colstart,
+        colend,
+        laystart,
+        layend,
+        rowindexavg,
+        columnindexavg,
+        layerindexavg,
+        windowindex,
+        KeepRuleMeans=rulemeans,
+        **smooth_options,
+    )
+    add_means("met3d_excel", TaskResult("met3d", 1), "_met3d")
+    graph.add("met3d_netcdf", nc_modify.to_netcdf, TaskResult("met3d", 0), outputdir, outputname+"_met3d"+extension, **netcdf_options)
+
+    with (ThreadPoolExecutor(max_workers=len(graph.tasks)) if parallel else InlineExecutor()) as executor:
+        graph.run(executor)
+    nc_modify.wait_summaries()
+
+    return nc_modify
+
+def modify_all_outputs(
+    outputname:str,
+    stream:bool=False,
+    outputformat:str=None,
+    summaryformat:str="sheets",
+) -> list:
+    """
+    Returns the names of the files that modify_all writes to outputdir
+    with these arguments.
+    """
+    extension = ".bin" if outputformat=="UAMIV" else ".nc"
+    means = ".xlsx" if summaryformat=="sheets" else "."+summaryformat
+    return [
+        outputname+"_conc"+means,
+        outputname+"_conc"+(".nc" if stream else extension),
+        outputname+"_kv"+extension,
+        outputname+"_met2d"+means,
+        outputname+"_met2d"+extension,
+        outputname+"_met3d"+means,
+        outputname+"_met3d"+extension,
+    ]
+
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='Process netCDF concentration file')
     parser.add_argument(
         "-d", "--directory",
@@ -29,113 +279,180 @@ if __name__=="__main__":
         type=str, required=True,
         help='input met 3D filename'
     )
+    add_window_arguments(parser)
     parser.add_argument(
-        "-rs", "--rowstart",
-        type=int, required=True,
-        help='starting index for the row where you want to clip the netCDF file'
+        "-od", "--outputdir",
+        type=str, required=True,
+        help='output directory'
     )
     parser.add_argument(
-        "-re", "--rowend",
-        type=int, required=True,
-        help='ending index for the row where you want to clip the netCDF file'
+        "-on", "--outputname",
+        type=str, required=True,
+        help='output filename'
     )
     parser.add_argument(
-        "-cs", "--colstart",
-        type=int, required=True,
-        help='starting index for the column where you want to clip the netCDF file'
+        "-s", "--stream",
+        action="store_true",
+        help='process the concentration file one variable and a few hours at a time '+
+        'to bound the memory usage'
     )
     parser.add_argument(
-        "-ce", "--colend",
-        type=int, required=True,
-        help='ending index for the column where you want to clip the netCDF file'
+        "-tc", "--timechunk",
+        type=int, default=1,
+        help='number of hours processed at a time in the streaming mode, or per dask '+
+        'chunk in the dask mode'
     )
     parser.add_argument(
-        "-ls", "--laystart",
-        type=int, required=True,
-        help='starting index for the layer where you want to clip the netCDF file'
+        "-dk", "--dask",
+        type=str, choices=["threads", "processes", "synchronous"],
+        help='open the input files with dask chunks of --timechunk hours and run the '+
+        'means, the fill and the writes as dask graphs on this local scheduler'
     )
     parser.add_argument(
-        "-le", "--layend",
-        type=int, required=True,
-        help='ending index for the layer where you want to clip the netCDF file'
+        "-dw", "--daskworkers",
+        type=int,
+        help='number of threads or processes of the dask scheduler (default is the '+
+        'number of CPUs)'
     )
     parser.add_argument(
-        "-ra", "--rowindexavg",
-        type=str, required=True,
-        help='range of row indecies in a form of comma separated string containing two '+
-        'integers where you want to take an average of concentration values'
+        "-p", "--parallel",
+        action="store_true",
+        help='run the conc, kv and met 2D -> met 3D steps and the file writes '+
+        'at the same time on threads'
     )
     parser.add_argument(
-        "-ca", "--columnindexavg",
-        type=str, required=True,
-        help='range of column indecies in a form of comma separated string '+ 
-        'containing two integers where you want to take an average of concentration values'
+        "-wi", "--windowindex",
+        action="store_true",
+        help='take the window means from a summed-area table index of each input '+
+        'file, built next to the file the first time (useful when trying many '+
+        'averaging windows on the same file)'
     )
     parser.add_argument(
-        "-la", "--layerindexavg",
-        type=str, required=True,
-        help='range of layer indecies in a form of comma separated string containing '+ 
-        'two integers where you want to take an average of concentration values'
+        "-mc", "--meancache",
+        type=str,
+        help='directory of a cache of the window means, so a later run with the same '+
+        'input files and averaging windows skips reading and averaging them'
     )
     parser.add_argument(
-        "-od", "--outputdir",
-        type=str, required=True,
-        help='output directory'
+        "-mcs", "--meancachesize",
+        type=float, default=1024,
+        help='size limit of the mean cache in MiB, the least recently used means are '+
+        'removed above it'
     )
     parser.add_argument(
-        "-on", "--outputname",
-        type=str, required=True,
-        help='output filename'
+        "-cp", "--compact",
+        action="store_true",
+        help='keep the filled variables as their (hour, layer) means broadcast over the rows '+
+        'and columns instead of full grids, and write them one hour at a time'
     )
-
-    args = parser.parse_args()
-    
-    nc_modify = netcdf_modifier(args.directory)
-    
-    new_conc_netcdf, excel_dict_conc = nc_modify.modify_conc(
-        args.fnameconc,
-        args.rowstart,
-        args.rowend,
-        args.colstart,
-        args.colend,
-        args.laystart,
-        args.layend,
-        [int(i) for i in args.rowindexavg.split(',')],
-        [int(i) for i in args.columnindexavg.split(',')],
-        [int(i) for i in args.layerindexavg.split(',')],
+    parser.add_argument(
+        "-sp", "--species",
+        type=pattern_list,
+        help='comma separated species to keep in the conc file, as names, patterns (e.g. "SOA*") '+
+        'or groups (e.g. "@ozone", see species_selection.py); the others are never read'
     )
-
-    nc_modify.to_excel(excel_dict_conc, args.outputdir, args.outputname+"_conc.xlsx")
-    nc_modify.to_netcdf(new_conc_netcdf, args.outputdir, args.outputname+"_conc.nc")
-
-
-    new_kv_netcdf = nc_modify.modify_met_kv(
-        args.fnamekv,
-        args.rowstart,
-        args.rowend,
-        args.colstart,
-        args.colend,
-        args.laystart,
-        args.layend,
+    parser.add_argument(
+        "-xs", "--excludespecies",
+        type=pattern_list,
+        help='comma separated species to drop from the conc file, as names, patterns or groups'
     )
-
-    nc_modify.to_netcdf(new_kv_netcdf, args.outputdir, args.outputname+"_kv.nc")
-
-    new_met2d_netcdf, excel_dict_met2d = nc_modify.modify_met_2d(
-        args.fnamemet2d,
-        args.rowstart,
-        args.rowend,
-        args.colstart,
-        args.colend,
-        [int(i) for i in args.rowindexavg.split(',')],
-        [int(i) for i in args.columnindexavg.split(',')],
+    parser.add_argument(
+        "-nm", "--nomemorymap",
+        action="store_true",
+        help='read NETCDF3 input files with netCDF4 instead of through a memory map'
+    )
+    parser.add_argument(
+        "-of", "--outputformat",
+        type=str, choices=["NETCDF4", "NETCDF4_CLASSIC", "NETCDF3_64BIT", "UAMIV"],
+        help='format of the output netCDF files (NETCDF4 by default, whatever the input format, '+
+        'with the compression of NETCDF4 input files), '+
+        'or UAMIV for CAMx binary files with a .bin extension'
     )
+    parser.add_argument(
+        "-cl", "--compression",
+        type=int, choices=range(10),
+        help='zlib level (1 to 9) of the output netCDF files, with one chunk per hour and '+
+        'layer; the filled values are constant over rows and columns so they compress well'
+    )
+    parser.add_argument(
+        "-dc", "--downcast",
+        action="store_true",
+        help='write float64 and int64 variables as float32 and int32 when no value changes'
+    )
+    parser.add_argument(
+        "-sf", "--summaryformat",
+        type=str, default="sheets", choices=["sheets", "parquet", "csv", "xlsx"],
+        help='format of the tables of window means: "sheets" is an excel file with one '+
+        'sheet per species, the others are a single long table (species, hour, layer, '+
+        'value) written on a background thread'
+    )
+    parser.add_argument(
+        "-sv", "--smoothvariables",
+        type=str,
+        help='variables (of any of the files) to smooth in time, separated by commas: each hour of --smoothhours '+
+        'is replaced by the mean of the --smoothwindow hours ending at it'
+    )
+    parser.add_argument(
+        "-sw", "--smoothwindow",
+        type=int, default=3,
+        help='number of hours of the smoothing window'
+    )
+    parser.add_argument(
+        "-sh", "--smoothhours",
+        type=index_list, default="1,12",
+        help='first hour smoothed and hour after the last hour smoothed, separated by a comma'
+    )
+    parser.add_argument(
+        "-rm", "--norulemeans",
+        action="store_true",
+        help='neither read nor average the met variables that are reset to constants (the snow, '+
+        'cloud and precipitation variables and u wind), which are then not in the excel files'
+    )
+    parser.add_argument(
+        "-pr", "--profile",
+        type=str,
+        help='JSON file where the time and peak memory of each stage of each step, and the '+
+        'fill time of each variable, are written'
+    )
+    parser.add_argument(
+        "-pd", "--profiledump",
+        type=str,
+        help='file where a cProfile dump of the run is written, to read with pstats '+
+        '(only the main thread is profiled, so the steps run with --parallel are not)'
+    )
+    parser.add_argument(
+        "-io", "--ioreport",
+        action="store_true",
+        help='print how many bytes were read from each input file versus its size, and '+
+        'written to each output file with its compression ratio'
+    )
+    return parser
 
-    nc_modify.to_excel(excel_dict_met2d, args.outputdir, args.outputname+"_met2d.xlsx")
-    nc_modify.to_netcdf(new_met2d_netcdf, args.outputdir, args.outputname+"_met2d.nc")
+def main(argv:list=None) -> None:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.stream and args.smoothvariables is not None:
+        parser.error("--smoothvariables can not be used with --stream")
+    if args.outputformat=="UAMIV" and (args.compression or args.downcast):
+        parser.error("--compression and --downcast can not be used with --outputformat UAMIV")
+    for name in ["fnameconc", "fnamekv", "fnamemet2d", "fnamemet3d"]:
+        path = os.path.join(args.directory, getattr(args, name))
+        if not os.path.exists(path):
+            parser.error(f"the input file {path} does not exist")
 
-    new_met3d_netcdf, excel_dict_met3d = nc_modify.modify_met_3d(
-        new_met2d_netcdf,
+    profile = None
+    if args.profiledump is not None:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+    from profiler import StageProfiler
+    profiler = StageProfiler() if args.profile is not None else None
+    
+    nc_modify = modify_all(
+        args.directory,
+        args.fnameconc,
+        args.fnamekv,
+        args.fnamemet2d,
         args.fnamemet3d,
         args.rowstart,
         args.rowend,
@@ -143,10 +460,45 @@ if __name__=="__main__":
         args.colend,
         args.laystart,
         args.layend,
-        [int(i) for i in args.rowindexavg.split(',')],
-        [int(i) for i in args.columnindexavg.split(',')],
-        [int(i) for i in args.layerindexavg.split(',')],
+        args.rowindexavg,
+        args.columnindexavg,
+        args.layerindexavg,
+        args.outputdir,
+        args.outputname,
+        args.stream,
+        args.timechunk,
+        args.parallel,
+        args.windowindex,
+        args.meancache,
+        args.meancachesize,
+        args.dask,
+        args.daskworkers,
+        args.outputformat,
+        args.compression,
+        args.downcast,
+        args.summaryformat,
+        not args.nomemorymap,
+        profiler,
+        args.smoothvariables.split(',') if args.smoothvariables is not None else None,
+        args.smoothwindow,
+        tuple(args.smoothhours),
+        not args.norulemeans,
+        compact=args.compact,
+        species=args.species,
+        excludespecies=args.excludespecies,
     )
 
-    nc_modify.to_excel(excel_dict_met3d, args.outputdir, args.outputname+"_met3d.xlsx")
-    nc_modify.to_netcdf(new_met3d_netcdf, args.outputdir, args.outputname+"_met3d.nc")
+    if profile is not None:
+        profile.disable()
+        profile.dump_stats(args.profiledump)
+    if profiler is not None:
+        profiler.close()
+        profiler.write_json(args.profile)
+
+    if args.ioreport:
+        nc_modify.print_read_report()
+        nc_modify.print_write_report()
+    nc_modify.print_cache_report()
+
+if __name__=="__main__":
+    main()
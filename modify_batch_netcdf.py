@@ -0,0 +1,316 @@
+from script_arguments import add_window_arguments, date_range, glob_dates, shard_spec
+from contextlib import nullcontext
+from typing import TYPE_CHECKING
+import argparse
+import json
+import os
+import re
+import time
+import traceback
+
+if TYPE_CHECKING:
+    from shard_claims import ClaimDirectory
+
+# the arguments of add_window_arguments, which a site of --sites sets
+WINDOW_ARGUMENTS = [
+    "rowstart", "rowend", "colstart", "colend", "laystart", "layend",
+    "rowindexavg", "columnindexavg", "layerindexavg",
+]
+
+def load_sites(path:str) -> dict:
+    """
+    Returns the sites of the JSON file at path, an object that maps each
+    site name to the window arguments (see WINDOW_ARGUMENTS) it sets, e.g.
+    {"bakersfield": {"rowindexavg": [20, 50], "columnindexavg": [30, 60]}}.
+    ...
+    Raises
+    ------
+    ValueError
+        if a site is not an object of window arguments, or its name can not
+        be part of a filename
+    """
+    with open(path) as f:
+        sites = json.load(f)
+    if not isinstance(sites, dict) or not sites:
+        raise ValueError(f"{path} must be a non-empty object of sites")
+    for site, window in sites.items():
+        if not re.fullmatch(r"[\w.-]+", site):
+            raise ValueError(f"the site name '{site}' must only have letters, digits, '_', '-' and '.'")
+        if not isinstance(window, dict) or set(window)-set(WINDOW_ARGUMENTS):
+            raise ValueError(f"the site {site} must only set "+", ".join(WINDOW_ARGUMENTS))
+    return sites
+
+def run_day(date:str, kwargs:dict, site:str=None, claims:"ClaimDirectory"=None) -> dict:
+    """
+    Runs modify_all for one day, or for one site of a day. The filename
+    arguments of kwargs and the output name are templates formatted with
+    the day and the site. Returns the timing and the outcome of the day
+    instead of raising, so one bad day does not stop the batch.
+
+    With claims, the day is "skipped" if its manifest is valid and
+    "claimed" if another job holds its lock. Otherwise the lock is held
+    while it runs and its manifest is written once every output is
+    written (see ClaimDirectory).
+    """
+    from modify_all_netcdf import modify_all, modify_all_outputs
+
+    day_kwargs = dict(kwargs)
+    for key in ["fnameconc", "fnamekv", "fnamemet2d", "fnamemet3d", "outputname"]:
+        day_kwargs[key] = kwargs[key].format(date=date, site=site)
+    name = day_kwargs["outputname"].replace(os.sep, "_")
+
+    start = time.perf_counter()
+    status = "done"
+    error = None
+    token = None
+    if claims is not None:
+        if claims.is_done(name):
+            status = "skipped"
+        else:
+            token = claims.claim(name)
+            if token is None:
+                status = "claimed"
+    if status=="done":
+        try:
+            with claims.heartbeat(name, token) if token is not None else nullcontext():
+                modify_all(**day_kwargs)
+            if token is not None:
+                outputs = modify_all_outputs(day_kwargs["outputname"], day_kwargs["stream"])
+                inputs = [day_kwargs[key] for key in ["fnameconc", "fnamekv", "fnamemet2d", "fnamemet3d"]]
+                claims.complete(
+                    name,
+                    token,
+                    [os.path.join(day_kwargs["outputdir"], output) for output in outputs],
+                    [os.path.join(day_kwargs["directory"], path) for path in inputs],
+                    {"date": date, "site": site, "seconds": time.perf_counter() - start},
+                )
+        except Exception:
+            status = "failed"
+            error = traceback.format_exc()
+        finally:
+            if token is not None:
+                claims.release(name, token)
+    return {
+        "date": date,
+        "site": site,
+        "status": status,
+        "success": status!="failed",
+        "seconds": time.perf_counter() - start,
+        "error": error,
+    }
+
+def run_batch(items:list, workers:int, claims:"ClaimDirectory"=None) -> list:
+    """
+    Runs run_day for every (date, site, kwargs) of items on a pool of
+    worker processes, in the order of items. Each day runs its steps in
+    order, so met 3D still gets the met 2D dataset of the same day, while
+    different days run concurrently.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    summary = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_day, date, kwargs, site, claims) for date, site, kwargs in items]
+        for future in as_completed(futures):
+            result = future.result()
+            label = result["date"] if result["site"] is None else f"{result['date']} {result['site']}"
+            print(
+                f"{label}: {'FAILED' if not result['success'] else result['status']} "
+                f"in {result['seconds']:.1f} s",
+                flush=True,
+            )
+            summary.append(result)
+    return sorted(summary, key=lambda result: (result["date"], result["site"] or ""))
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Process the CAMx files of many days in parallel')
+    parser.add_argument(
+        "-d", "--directory",
+        type=str, required=True,
+        help='directory where the input netCDF files are.'
+    )
+    parser.add_argument(
+        "-fc", "--fnameconc",
+        type=str, required=True,
+        help='input conc filename with a {date} placeholder for the YYYYMMDD day'
+    )
+    parser.add_argument(
+        "-fkv", "--fnamekv",
+        type=str, required=True,
+        help='input kv filename with a {date} placeholder for the YYYYMMDD day'
+    )
+    parser.add_argument(
+        "-fm2", "--fnamemet2d",
+        type=str, required=True,
+        help='input met 2D filename with a {date} placeholder for the YYYYMMDD day'
+    )
+    parser.add_argument(
+        "-fm3", "--fnamemet3d",
+        type=str, required=True,
+        help='input met 3D filename with a {date} placeholder for the YYYYMMDD day'
+    )
+    parser.add_argument(
+        "-sd", "--startdate",
+        type=str,
+        help='first day to process as YYYYMMDD, the days are found from the conc '+
+        'files in the directory if it is not given'
+    )
+    parser.add_argument(
+        "-ed", "--enddate",
+        type=str,
+        help='last day to process (included) as YYYYMMDD'
+    )
+    add_window_arguments(parser, required=False)
+    parser.add_argument(
+        "-si", "--sites",
+        type=str,
+        help='JSON file of the sites, each with the window flags (e.g. "rowindexavg") it sets '+
+        'over the ones given on the command line; every site of every day is a work item '+
+        'and --outputname must then contain a {site} placeholder'
+    )
+    parser.add_argument(
+        "-od", "--outputdir",
+        type=str, required=True,
+        help='output directory'
+    )
+    parser.add_argument(
+        "-on", "--outputname",
+        type=str, default="{date}",
+        help='output filename with a {date} placeholder for the YYYYMMDD day'
+    )
+    parser.add_argument(
+        "-s", "--stream",
+        action="store_true",
+        help='process the concentration file one variable and a few hours at a time '+
+        'to bound the memory usage'
+    )
+    parser.add_argument(
+        "-tc", "--timechunk",
+        type=int, default=1,
+        help='number of hours processed at a time in the streaming mode'
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int, default=os.cpu_count(),
+        help='number of days processed at the same time'
+    )
+    parser.add_argument(
+        "-sm", "--summary",
+        type=str,
+        help='JSON file where the timing and outcome of each day is written'
+    )
+    parser.add_argument(
+        "-sh", "--shard",
+        type=shard_spec,
+        help='only process the share i/N of the days (0<=i<N), e.g. "$SLURM_ARRAY_TASK_ID/8" '+
+        'for an array job of 8 tasks; the days are claimed through lock files in --claimdir'
+    )
+    parser.add_argument(
+        "-sl", "--steal",
+        action="store_true",
+        help='once its share is processed, also process the days of the other shards that '+
+        'are neither done nor claimed'
+    )
+    parser.add_argument(
+        "-cd", "--claimdir",
+        type=str,
+        help='shared directory of the lock files and the completion manifests of the days '+
+        '(<outputdir>/claims with --shard); days with a valid manifest are skipped'
+    )
+    parser.add_argument(
+        "-st", "--staletimeout",
+        type=float, default=600,
+        help='seconds after which the lock of a job that stopped touching it is taken over'
+    )
+    return parser
+
+def main(argv:list=None) -> None:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    for name in ["fnameconc", "fnamekv", "fnamemet2d", "fnamemet3d", "outputname"]:
+        if "{date}" not in getattr(args, name):
+            parser.error(f"--{name} must contain a {{date}} placeholder")
+    if (args.startdate is None)!=(args.enddate is None):
+        parser.error("--startdate and --enddate must be given together")
+    if args.startdate is None:
+        dates = glob_dates(args.directory, args.fnameconc)
+    else:
+        dates = date_range(args.startdate, args.enddate)
+    if not dates:
+        parser.error("no day to process")
+    sites = {None: {}}
+    if args.sites is not None:
+        if "{site}" not in args.outputname:
+            parser.error("--outputname must contain a {site} placeholder with --sites")
+        try:
+            sites = load_sites(args.sites)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    if (args.steal and args.shard is None):
+        parser.error("--steal can only be used with --shard")
+    if (args.staletimeout<=0):
+        parser.error("--staletimeout must be positive")
+
+    kwargs = {
+        "directory": args.directory,
+        "fnameconc": args.fnameconc,
+        "fnamekv": args.fnamekv,
+        "fnamemet2d": args.fnamemet2d,
+        "fnamemet3d": args.fnamemet3d,
+        "outputdir": args.outputdir,
+        "outputname": args.outputname,
+        "stream": args.stream,
+        "timechunk": args.timechunk,
+    }
+    site_kwargs = {}
+    for site, window in sites.items():
+        site_kwargs[site] = {
+            **kwargs,
+            **{name: getattr(args, name) for name in WINDOW_ARGUMENTS},
+            **window,
+        }
+        missing = [name for name in WINDOW_ARGUMENTS if site_kwargs[site][name] is None]
+        if missing:
+            where = "" if site is None else f" or the site {site}"
+            parser.error("the command line"+where+" must set --"+", --".join(missing))
+    # every job lists the items in the same order, so the shards agree
+    items = [(date, site, site_kwargs[site]) for date in dates for site in sites]
+
+    from shard_claims import ClaimDirectory, shard_items
+
+    claims = None
+    if args.shard is not None or args.claimdir is not None:
+        claims = ClaimDirectory(
+            args.claimdir or os.path.join(args.outputdir, "claims"),
+            args.staletimeout,
+            args.staletimeout/10,
+        )
+    if args.shard is not None:
+        index, count = args.shard
+        shares = [index] + ([(index+i)%count for i in range(1, count)] if args.steal else [])
+        items = [item for share in shares for item in shard_items(items, share, count)]
+
+    start = time.perf_counter()
+    summary = run_batch(items, args.workers, claims)
+    elapsed = time.perf_counter() - start
+
+    failed = [result for result in summary if not result["success"]]
+    counts = {status: sum(result["status"]==status for result in summary) for status in ["done", "skipped", "claimed"]}
+    print(
+        f"{counts['done']}/{len(summary)} days done in {elapsed:.1f} s"
+        + (f", {counts['skipped']} already done, {counts['claimed']} claimed by other jobs" if claims is not None else "")
+    )
+    for result in failed:
+        label = result["date"] if result["site"] is None else f"{result['date']} {result['site']}"
+        print(f"{label} failed:\n{result['error']}")
+
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump({"seconds": elapsed, "days": summary}, f, indent=2)
+
+    if failed:
+        raise SystemExit(1)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import http.client
+import json
+import socket
+import sys
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    # HTTP connection over a Unix socket
+    def __init__(self, path:str, timeout:float=None) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+        pass
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+        pass
+
+def send_request(
+    Request:dict=None,
+    Socket:str=None,
+    Host:str="127.0.0.1",
+    Port:int=8765,
+    Timeout:float=None,
+) -> tuple:
+    """
+    Sends Request to a running modify_server.py, on the Unix socket Socket
+    if it is given or on Host:Port, and returns the HTTP status and the JSON
+    answer. Without Request, the status of the server is asked for.
+
+    It only imports the standard library, so it starts much faster than
+    the scripts that import xarray.
+    """
+    if Socket is not None:
+        connection = UnixHTTPConnection(Socket, timeout=Timeout)
+    else:
+        connection = http.client.HTTPConnection(Host, Port, timeout=Timeout)
+    try:
+        if Request is None:
+            connection.request("GET", "/status")
+        else:
+            connection.request(
+                "POST", "/", body=json.dumps(Request).encode(), headers={"Content-Type": "application/json"},
+            )
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Send a modify request to a running modify_server.py')
+    parser.add_argument(
+        "request",
+        type=str, nargs="?",
+        help='JSON file of the request, "-" for the standard input, or nothing for the status of the server'
+    )
+    parser.add_argument(
+        "-so", "--socket",
+        type=str,
+        help='Unix socket of the server, instead of --host and --port'
+    )
+    parser.add_argument(
+        "-ho", "--host",
+        type=str, default="127.0.0.1",
+        help='address of the server'
+    )
+    parser.add_argument(
+        "-po", "--port",
+        type=int, default=8765,
+        help='port of the server'
+    )
+    return parser
+
+def main(argv:list=None) -> None:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    request = None
+    if args.request=="-":
+        request = json.load(sys.stdin)
+    elif args.request is not None:
+        with open(args.request) as f:
+            request = json.load(f)
+    status, answer = send_request(request, args.socket, args.host, args.port)
+    print(json.dumps(answer, indent=2))
+    if status!=200:
+        raise SystemExit(1)
+
+if __name__=="__main__":
+    main()
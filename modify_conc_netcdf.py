@@ -1,7 +1,8 @@
-from netcdf_modifier import *
+from script_arguments import index_list, pattern_list
 import argparse
+import os
 
-if __name__=="__main__":
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='Process netCDF concentration file')
     parser.add_argument(
         "-d", "--directory",
@@ -15,49 +16,49 @@ if __name__=="__main__":
     )
     parser.add_argument(
         "-rs", "--rowstart",
-        type=int, required=True,
+        type=int, required=False,
         help='starting index for the row where you want to clip the netCDF file'
     )
     parser.add_argument(
         "-re", "--rowend",
-        type=int, required=True,
+        type=int, required=False,
         help='ending index for the row where you want to clip the netCDF file'
     )
     parser.add_argument(
         "-cs", "--colstart",
-        type=int, required=True,
+        type=int, required=False,
         help='starting index for the column where you want to clip the netCDF file'
     )
     parser.add_argument(
         "-ce", "--colend",
-        type=int, required=True,
+        type=int, required=False,
         help='ending index for the column where you want to clip the netCDF file'
     )
     parser.add_argument(
         "-ls", "--laystart",
-        type=int, required=True,
+        type=int, required=False,
         help='starting index for the layer where you want to clip the netCDF file'
     )
     parser.add_argument(
         "-le", "--layend",
-        type=int, required=True,
+        type=int, required=False,
         help='ending index for the layer where you want to clip the netCDF file'
     )
     parser.add_argument(
         "-ra", "--rowindexavg",
-        type=str, required=True,
+        type=index_list, required=False,
         help='range of row indecies in a form of comma separated string containing two '+
         'integers where you want to take an average of concentration values'
     )
     parser.add_argument(
         "-ca", "--columnindexavg",
-        type=str, required=True,
+        type=index_list, required=False,
         help='range of column indecies in a form of comma separated string '+ 
         'containing two integers where you want to take an average of concentration values'
     )
     parser.add_argument(
         "-la", "--layerindexavg",
-        type=str, required=True,
+        type=index_list, required=False,
         help='range of layer indecies in a form of comma separated string containing '+ 
         'two integers where you want to take an average of concentration values'
     )
@@ -71,23 +72,296 @@ if __name__=="__main__":
         type=str, required=True,
         help='output filename'
     )
+    parser.add_argument(
+        "-s", "--stream",
+        action="store_true",
+        help='process the concentration file one variable and a few hours at a time '+
+        'to bound the memory usage'
+    )
+    parser.add_argument(
+        "-ap", "--append",
+        action="store_true",
+        help='only process the hours of the input file that are not yet in the output file, '+
+        'and append them to it and to the --summaryformat csv or parquet table of the means'
+    )
+    parser.add_argument(
+        "-tc", "--timechunk",
+        type=int, default=1,
+        help='number of hours processed at a time in the streaming mode, or per dask '+
+        'chunk in the dask mode'
+    )
+    parser.add_argument(
+        "-dk", "--dask",
+        type=str, choices=["threads", "processes", "synchronous"],
+        help='open the input files with dask chunks of --timechunk hours and run the '+
+        'means, the fill and the writes as dask graphs on this local scheduler'
+    )
+    parser.add_argument(
+        "-dw", "--daskworkers",
+        type=int,
+        help='number of threads or processes of the dask scheduler (default is the '+
+        'number of CPUs)'
+    )
+    parser.add_argument(
+        "-w", "--windows",
+        type=str,
+        help='CSV or YAML file with one clip/averaging window per line (e.g. one per '+
+        'monitor site), all processed in a single pass over the input file, instead '+
+        'of the clipping and averaging flags'
+    )
+    parser.add_argument(
+        "-wi", "--windowindex",
+        action="store_true",
+        help='take the window means from a summed-area table index of each input '+
+        'file, built next to the file the first time (useful when trying many '+
+        'averaging windows on the same file)'
+    )
+    parser.add_argument(
+        "-mc", "--meancache",
+        type=str,
+        help='directory of a cache of the window means, so a later run with the same '+
+        'input files and averaging windows skips reading and averaging them'
+    )
+    parser.add_argument(
+        "-mcs", "--meancachesize",
+        type=float, default=1024,
+        help='size limit of the mean cache in MiB, the least recently used means are '+
+        'removed above it'
+    )
+    parser.add_argument(
+        "-cp", "--compact",
+        action="store_true",
+        help='keep the filled variables as their (hour, layer) means broadcast over the rows '+
+        'and columns instead of full grids, and write them one hour at a time'
+    )
+    parser.add_argument(
+        "-sp", "--species",
+        type=pattern_list,
+        help='comma separated species to keep in the conc file, as names, patterns (e.g. "SOA*") '+
+        'or groups (e.g. "@ozone", see species_selection.py); the others are never read'
+    )
+    parser.add_argument(
+        "-xs", "--excludespecies",
+        type=pattern_list,
+        help='comma separated species to drop from the conc file, as names, patterns or groups'
+    )
+    parser.add_argument(
+        "-nm", "--nomemorymap",
+        action="store_true",
+        help='read NETCDF3 input files with netCDF4 instead of through a memory map'
+    )
+    parser.add_argument(
+        "-of", "--outputformat",
+        type=str, choices=["NETCDF4", "NETCDF4_CLASSIC", "NETCDF3_64BIT", "UAMIV"],
+        help='format of the output netCDF files (NETCDF4 by default, whatever the input format, '+
+        'with the compression of NETCDF4 input files), '+
+        'or UAMIV for CAMx binary files with a .bin extension'
+    )
+    parser.add_argument(
+        "-cl", "--compression",
+        type=int, choices=range(10),
+        help='zlib level (1 to 9) of the output netCDF files, with one chunk per hour and '+
+        'layer; the filled values are constant over rows and columns so they compress well'
+    )
+    parser.add_argument(
+        "-dc", "--downcast",
+        action="store_true",
+        help='write float64 and int64 variables as float32 and int32 when no value changes'
+    )
+    parser.add_argument(
+        "-sf", "--summaryformat",
+        type=str, default="sheets", choices=["sheets", "parquet", "csv", "xlsx"],
+        help='format of the tables of window means: "sheets" is an excel file with one '+
+        'sheet per species, the others are a single long table (species, hour, layer, '+
+        'value) written on a background thread'
+    )
+    parser.add_argument(
+        "-sv", "--smoothvariables",
+        type=str,
+        help='species to smooth in time, separated by commas: each hour of --smoothhours '+
+        'is replaced by the mean of the --smoothwindow hours ending at it'
+    )
+    parser.add_argument(
+        "-sw", "--smoothwindow",
+        type=int, default=3,
+        help='number of hours of the smoothing window'
+    )
+    parser.add_argument(
+        "-sh", "--smoothhours",
+        type=index_list, default="1,12",
+        help='first hour smoothed and hour after the last hour smoothed, separated by a comma'
+    )
+    parser.add_argument(
+        "-pr", "--profile",
+        type=str,
+        help='JSON file where the time and peak memory of each stage of each step, and the '+
+        'fill time of each variable, are written'
+    )
+    parser.add_argument(
+        "-pd", "--profiledump",
+        type=str,
+        help='file where a cProfile dump of the run is written, to read with pstats '+
+        '(only the main thread is profiled)'
+    )
+    parser.add_argument(
+        "-io", "--ioreport",
+        action="store_true",
+        help='print how many bytes were read from each input file versus its size, and '+
+        'written to each output file with its compression ratio'
+    )
+    return parser
 
-    args = parser.parse_args()
-    
-    nc_modify = netcdf_modifier(args.directory)
-    
-    new_netcdf, excel_dict = nc_modify.modify_conc(
-        args.filename,
-        args.rowstart,
-        args.rowend,
-        args.colstart,
-        args.colend,
-        args.laystart,
-        args.layend,
-        [int(i) for i in args.rowindexavg.split(',')],
-        [int(i) for i in args.columnindexavg.split(',')],
-        [int(i) for i in args.layerindexavg.split(',')],
+def main(argv:list=None) -> None:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    window_flags = [
+        "rowstart", "rowend", "colstart", "colend", "laystart", "layend",
+        "rowindexavg", "columnindexavg", "layerindexavg",
+    ]
+    if args.windows is None:
+        missing = [f"--{flag}" for flag in window_flags if getattr(args, flag) is None]
+        if missing:
+            parser.error("the following arguments are required: "+", ".join(missing))
+    elif args.stream:
+        parser.error("--windows can not be used with --stream")
+    if args.dask is not None and (args.stream or args.windows is not None):
+        parser.error("--dask can not be used with --stream or --windows")
+    if args.stream and (args.outputformat or args.compression or args.downcast):
+        parser.error("--outputformat, --compression and --downcast can not be used with --stream")
+    if args.smoothvariables is not None and (args.stream or args.windows is not None):
+        parser.error("--smoothvariables can not be used with --stream or --windows")
+    if args.windowindex and args.windows is not None:
+        parser.error("--windowindex can not be used with --windows")
+    if args.meancache is not None and args.windows is not None:
+        parser.error("--meancache can not be used with --windows")
+    if args.compact and args.windows is not None:
+        parser.error("--compact can not be used with --windows")
+    if args.append and (args.stream or args.windows is not None or args.dask is not None):
+        parser.error("--append can not be used with --stream, --windows or --dask")
+    if args.append and (args.windowindex or args.meancache or args.smoothvariables is not None):
+        parser.error("--append can not be used with --windowindex, --meancache or --smoothvariables")
+    if args.append and (args.outputformat or args.compression or args.downcast):
+        parser.error("--outputformat, --compression and --downcast can not be used with --append")
+    if args.outputformat=="UAMIV" and (args.compression or args.downcast):
+        parser.error("--compression and --downcast can not be used with --outputformat UAMIV")
+    if args.append and args.summaryformat not in ["csv", "parquet"]:
+        parser.error("--append needs --summaryformat csv or parquet")
+    if not os.path.exists(os.path.join(args.directory, args.filename)):
+        parser.error(f"the input file {os.path.join(args.directory, args.filename)} does not exist")
+
+    # the libraries of the modifier are only imported once the arguments are valid
+    from netcdf_modifier import MeanCache, StageProfiler, netcdf_modifier, read_windows
+
+    profile = None
+    if args.profiledump is not None:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+    profiler = StageProfiler() if args.profile is not None else None
+
+    mean_cache = None
+    if args.meancache is not None:
+        mean_cache = MeanCache(args.meancache, int(args.meancachesize*2**20))
+    nc_modify = netcdf_modifier(
+        args.directory,
+        mean_cache=mean_cache,
+        dask_scheduler=args.dask,
+        dask_workers=args.daskworkers,
+        dask_chunks={"TSTEP": args.timechunk},
+        memory_map=not args.nomemorymap,
+        profiler=profiler,
+        compact=args.compact,
+        species=args.species,
+        exclude_species=args.excludespecies,
     )
+    
+    netcdf_options = {
+        "Format": args.outputformat,
+        "Compression": args.compression,
+        "Downcast": args.downcast,
+    }
+    extension = ".bin" if args.outputformat=="UAMIV" else ".nc"
+    def write_means(excel_dict, outputname):
+        if args.summaryformat=="sheets":
+            nc_modify.to_excel(excel_dict, args.outputdir, outputname+".xlsx")
+        else:
+            nc_modify.to_summary(excel_dict, args.outputdir, outputname+"."+args.summaryformat, args.summaryformat)
+
+    if args.windows is not None:
+        windows = read_windows(args.windows)
+        results = nc_modify.modify_conc_multi(args.filename, windows)
+        for window, (new_netcdf, excel_dict) in zip(windows, results):
+            write_means(excel_dict, args.outputname+"_"+window["Name"])
+            nc_modify.to_netcdf(new_netcdf, args.outputdir, args.outputname+"_"+window["Name"]+extension, **netcdf_options)
+    elif args.append:
+        nc_modify.modify_conc_append(
+            args.filename,
+            args.rowstart,
+            args.rowend,
+            args.colstart,
+            args.colend,
+            args.laystart,
+            args.layend,
+            args.rowindexavg,
+            args.columnindexavg,
+            args.layerindexavg,
+            args.outputdir,
+            args.outputname+".nc",
+            args.outputname+"."+args.summaryformat,
+            args.summaryformat,
+        )
+    elif args.stream:
+        excel_dict = nc_modify.modify_conc_stream(
+            args.filename,
+            args.rowstart,
+            args.rowend,
+            args.colstart,
+            args.colend,
+            args.laystart,
+            args.layend,
+            args.rowindexavg,
+            args.columnindexavg,
+            args.layerindexavg,
+            args.outputdir,
+            args.outputname+".nc",
+            args.timechunk,
+        )
+        write_means(excel_dict, args.outputname)
+    else:
+        new_netcdf, excel_dict = nc_modify.modify_conc(
+            args.filename,
+            args.rowstart,
+            args.rowend,
+            args.colstart,
+            args.colend,
+            args.laystart,
+            args.layend,
+            args.rowindexavg,
+            args.columnindexavg,
+            args.layerindexavg,
+            args.windowindex,
+            args.smoothvariables.split(',') if args.smoothvariables is not None else None,
+            args.smoothwindow,
+            tuple(args.smoothhours),
+        )
+
+        write_means(excel_dict, args.outputname)
+        nc_modify.to_netcdf(new_netcdf, args.outputdir, args.outputname+extension, **netcdf_options)
+
+    nc_modify.wait_summaries()
 
-    nc_modify.to_excel(excel_dict, args.outputdir, args.outputname+".xlsx")
-    nc_modify.to_netcdf(new_netcdf, args.outputdir, args.outputname+".nc")
+    if profile is not None:
+        profile.disable()
+        profile.dump_stats(args.profiledump)
+    if profiler is not None:
+        profiler.close()
+        profiler.write_json(args.profile)
+
+    if args.ioreport:
+        nc_modify.print_read_report()
+        nc_modify.print_write_report()
+    nc_modify.print_cache_report()
+
+if __name__=="__main__":
+    main()
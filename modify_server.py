@@ -0,0 +1,313 @@
+from modify_all_netcdf import modify_all, modify_all_outputs
+from netcdf_modifier import netcdf_modifier
+from dataset_pool import DatasetPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+import traceback
+
+def conc_request(
+    datasetpool:DatasetPool,
+    directory:str,
+    filename:str,
+    rowstart:int,
+    rowend:int,
+    colstart:int,
+    colend:int,
+    laystart:int,
+    layend:int,
+    rowindexavg:list,
+    columnindexavg:list,
+    layerindexavg:list,
+    outputdir:str,
+    outputname:str,
+    windowindex:bool=False,
+    summaryformat:str="sheets",
+    outputformat:str=None,
+    compression:int=None,
+    downcast:bool=False,
+    smoothvariables:list=None,
+    smoothwindow:int=3,
+    smoothhours:list=(1, 12),
+    memorymap:bool=True,
+    species:list=None,
+    excludespecies:list=None,
+) -> list:
+    """
+    Runs modify_conc_netcdf.py for one window, with the input file taken
+    from datasetpool, and returns the paths of the files written.
+    """
+    nc_modify = netcdf_modifier(
+        directory, memory_map=memorymap, dataset_pool=datasetpool, species=species, exclude_species=excludespecies,
+    )
+    new_netcdf, excel_dict = nc_modify.modify_conc(
+        filename,
+        rowstart,
+        rowend,
+        colstart,
+        colend,
+        laystart,
+        layend,
+        rowindexavg,
+        columnindexavg,
+        layerindexavg,
+        windowindex,
+        smoothvariables,
+        smoothwindow,
+        tuple(smoothhours),
+    )
+    if summaryformat=="sheets":
+        excel_name = outputname+".xlsx"
+        nc_modify.to_excel(excel_dict, outputdir, excel_name)
+    else:
+        excel_name = outputname+"."+summaryformat
+        nc_modify.to_summary(excel_dict, outputdir, excel_name, summaryformat, Background=False)
+    netcdf_name = outputname+(".bin" if outputformat=="UAMIV" else ".nc")
+    nc_modify.to_netcdf(
+        new_netcdf, outputdir, netcdf_name, Format=outputformat, Compression=compression, Downcast=downcast,
+    )
+    return [os.path.join(outputdir, excel_name), os.path.join(outputdir, netcdf_name)]
+
+def all_request(datasetpool:DatasetPool, **kwargs) -> list:
+    """
+    Runs modify_all_netcdf.py with the keyword arguments of modify_all, with
+    the input files taken from datasetpool, and returns the paths of the
+    files written.
+    """
+    modify_all(datasetpool=datasetpool, **kwargs)
+    outputs = modify_all_outputs(
+        kwargs["outputname"],
+        kwargs.get("stream", False),
+        kwargs.get("outputformat"),
+        kwargs.get("summaryformat", "sheets"),
+    )
+    return [os.path.join(kwargs["outputdir"], output) for output in outputs]
+
+TASKS = {"conc": conc_request, "all": all_request}
+
+# the request arguments that are paths, each with the argument of the
+# directory it is relative to (None for the paths taken as they are)
+PATH_ARGUMENTS = {
+    "directory": None,
+    "outputdir": None,
+    "meancache": None,
+    "filename": "directory",
+    "fnameconc": "directory",
+    "fnamekv": "directory",
+    "fnamemet2d": "directory",
+    "fnamemet3d": "directory",
+    "outputname": "outputdir",
+}
+
+class ModifyServer:
+    """
+    Runs modify requests for many clients in one long-running process, so
+    the imports stay loaded and the input files stay open between requests
+    in a pool of at most PoolSize datasets (see DatasetPool).
+    ...
+    Parameters
+    ----------
+    PoolSize : int
+        largest number of open datasets kept between requests
+    MaxRequests : int
+        largest number of requests computed at the same time, the others
+        wait for their turn
+    AllowedRoots : list
+        directories the files of the requests must be in, the current
+        directory if it is not given
+
+    Caveat
+    -------
+    A request is a JSON object with "task" ("conc" or "all") and the
+    keyword arguments of conc_request or modify_all, named like the long
+    flags of modify_conc_netcdf.py and modify_all_netcdf.py, for example
+    {"task": "conc", "directory": "../inputs", "filename": "conc.nc",
+    "rowstart": 0, ..., "rowindexavg": [5, 30], ...}. The answer is a JSON
+    object with "outputs", the paths of the files written, and "seconds",
+    or with "error". A request with a path (see PATH_ARGUMENTS) that does
+    not resolve under one of AllowedRoots, symbolic links and ".." included,
+    is refused with the status 403.
+    """
+    def __init__(self, PoolSize:int=8, MaxRequests:int=None, AllowedRoots:list=None) -> None:
+        self.pool = DatasetPool(PoolSize)
+        self.roots = [os.path.realpath(root) for root in (AllowedRoots or [os.getcwd()])]
+        self.slots = threading.BoundedSemaphore(MaxRequests or os.cpu_count() or 1)
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        pass
+
+    def outside_roots(self, Request:dict) -> list:
+        """
+        Returns the paths of Request that do not resolve under the allowed
+        roots.
+        """
+        outside = []
+        for argument, relative_to in PATH_ARGUMENTS.items():
+            path = Request.get(argument)
+            if not isinstance(path, str):
+                continue
+            if relative_to is not None:
+                path = os.path.join(str(Request.get(relative_to) or ""), path)
+            path = os.path.realpath(path)
+            if not any(os.path.commonpath([root, path])==root for root in self.roots):
+                outside.append(path)
+        return outside
+
+    def run(self, Request:dict) -> tuple:
+        """
+        Runs one request and returns the HTTP status and the JSON answer.
+        """
+        kwargs = dict(Request)
+        task = kwargs.pop("task", None)
+        if task not in TASKS:
+            return 400, {"error": f"task must be one of {', '.join(TASKS)}"}
+        outside = self.outside_roots(kwargs)
+        if outside:
+            with self._lock:
+                self.requests += 1
+                self.failures += 1
+            return 403, {"error": "outside of the allowed roots: "+", ".join(outside)}
+        start = time.perf_counter()
+        try:
+            with self.slots:
+                outputs = TASKS[task](self.pool, **kwargs)
+        except (TypeError, ValueError, FileNotFoundError) as e:
+            # bad arguments, or files that do not exist
+            status, answer = 400, {"error": f"{type(e).__name__}: {e}"}
+        except Exception:
+            status, answer = 500, {"error": traceback.format_exc()}
+        else:
+            status, answer = 200, {"outputs": outputs, "seconds": time.perf_counter() - start}
+        with self._lock:
+            self.requests += 1
+            self.failures += status!=200
+        return status, answer
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "failures": self.failures,
+                "open_datasets": len(self.pool.datasets),
+                "pool_hits": self.pool.hits,
+                "pool_misses": self.pool.misses,
+            }
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # POST / runs a request, GET /status returns the counters of the server
+    server_version = "CAMxFileModifier"
+
+    def _answer(self, status:int, answer:dict) -> None:
+        body = json.dumps(answer).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/")!="/status":
+            return self._answer(404, {"error": "GET /status or POST / with a JSON request"})
+        self._answer(200, self.server.modify_server.status())
+
+    def do_POST(self) -> None:
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if not isinstance(request, dict):
+                raise ValueError("the request must be a JSON object")
+        except ValueError as e:
+            return self._answer(400, {"error": f"invalid JSON request: {e}"})
+        self._answer(*self.server.modify_server.run(request))
+
+    def address_string(self) -> str:
+        # the client address of a Unix socket is empty
+        return self.client_address[0] if self.client_address else "unix"
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+def serve(
+    server:ModifyServer,
+    socket:str=None,
+    host:str="127.0.0.1",
+    port:int=8765,
+) -> None:
+    """
+    Serves server over HTTP on the Unix socket socket if it is given, or on
+    host:port, until it is interrupted or terminated (SIGTERM).
+    """
+    if socket is not None:
+        if os.path.exists(socket):
+            os.remove(socket)
+        httpd = ThreadingUnixHTTPServer(socket, RequestHandler)
+        address = socket
+    else:
+        httpd = ThreadingHTTPServer((host, port), RequestHandler)
+        httpd.daemon_threads = True
+        address = f"http://{host}:{port}"
+    httpd.modify_server = server
+    if threading.current_thread() is threading.main_thread():
+        # shutdown waits for serve_forever, so it can not run in this thread
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=httpd.shutdown).start())
+    print(f"serving on {address}", flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        server.pool.close()
+        if socket is not None and os.path.exists(socket):
+            os.remove(socket)
+    pass
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Serve modify requests from a long-running process')
+    parser.add_argument(
+        "-so", "--socket",
+        type=str,
+        help='Unix socket to listen on, instead of --host and --port'
+    )
+    parser.add_argument(
+        "-ho", "--host",
+        type=str, default="127.0.0.1",
+        help='address to listen on'
+    )
+    parser.add_argument(
+        "-po", "--port",
+        type=int, default=8765,
+        help='port to listen on'
+    )
+    parser.add_argument(
+        "-ps", "--poolsize",
+        type=int, default=8,
+        help='largest number of input files kept open between requests'
+    )
+    parser.add_argument(
+        "-mr", "--maxrequests",
+        type=int, default=None,
+        help='largest number of requests computed at the same time (default: number of CPUs)'
+    )
+    parser.add_argument(
+        "-ar", "--allowedroots",
+        type=str, nargs="+", default=None,
+        help='directories the input and output files of the requests must be in, other '+
+        'requests are refused (default: the current directory)'
+    )
+    return parser
+
+def main(argv:list=None) -> None:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    serve(ModifyServer(args.poolsize, args.maxrequests, args.allowedroots), args.socket, args.host, args.port)
+
+if __name__=="__main__":
+    main()
@@ -1,13 +1,991 @@
 import numpy as np
 import xarray as xr
 import pandas as pd
-from copy import deepcopy
+import netCDF4
+import importlib.util
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from window_index import WindowMeanIndex
+from mean_cache import MeanCache
+from summary_writer import APPEND_FORMATS, SUMMARY_FORMATS, append_summary, summary_table, write_summary
+from classic_netcdf import is_classic_netcdf, open_classic_dataset
+from uamiv import is_uamiv, open_uamiv_dataset, write_uamiv
+from species_selection import NOT_SPECIES, expand_patterns, select_species
+from zarr_store import append_zarr_store, is_zarr_store, open_zarr_store, store_sources
+from dataset_pool import DatasetPool
+from profiler import StageProfiler, profiled
+
+# HDF5 is not thread-safe, so every netCDF open, read and write of this
+# module holds this lock. Threads can still overlap their computation.
+netcdf_lock = threading.RLock()
+
+# The values reset after the fill of the met files, as rule tables: each
+# variable has a list of rules applied in order, and each rule is a dict
+# with one of
+#   "constant": value that replaces the values
+#   "clip": [low, high] range the values are clipped to
+#   "copy": name of the variable of the source dataset (the met 2D dataset
+#           for met 3D) whose values replace the values, its first layer
+#           when the rule has a layer
+# and, optionally, "layer": index of the only layer of the clipped dataset
+# the rule applies to. See apply_rules and fill_with_mean.
+MET2D_RULES = {
+    'snowewd': [{"constant": 0.}],
+    'snowage': [{"constant": 0.}],
+    'tcloudod': [{"constant": 0.}],
+    'preciprate': [{"constant": 0.}],
+    'cloudtop': [{"constant": 0.}],
+    'pblwrf': [{"clip": [30, 2500]}],
+    'pblcmaq': [{"clip": [30, 2500]}],
+    'pblysu': [{"clip": [30, 2500]}],
+}
+MET3D_RULES = {
+    'cloudwater': [{"constant": 0.}],
+    'rainwater': [{"constant": 0.}],
+    'grplwater': [{"constant": 0.}],
+    'cloudod': [{"constant": 0.}],
+    # the height of the first layer is the pbl height of the met 2D file,
+    # and the height of the second layer is 3000 m
+    'z': [{"layer": 0, "copy": 'pblwrf'}, {"layer": 1, "constant": 3000.}],
+    'uwind': [{"constant": 0.}],
+    # no v wind in layer 1 and 0.0926 m/s in layer 2 (purging layer 2
+    # with a 12 hr lifetime)
+    'vwind': [{"layer": 0, "constant": 0.}, {"layer": 1, "constant": 0.0926}],
+}
+RULE_KINDS = ["constant", "clip", "copy"]
+
+def split_rules(
+    Rules:dict,
+    new_ds:xr.Dataset,
+    excluded_variable:list,
+    SmoothVariables:list=None,
+    Unread:list=None,
+) -> tuple:
+    """
+    Checks the rule table Rules against new_ds and splits it into the
+    rules that fill_with_mean applies during the fill, and the rules that
+    apply_rules has to apply afterwards: those of the excluded variables,
+    which are not filled, and of SmoothVariables, which are smoothed
+    before their rules apply. The rules of the Unread variables (see
+    plan_sources) are always applied during the fill, since they have no
+    mean to be filled with.
+
+    Raises
+    ------
+    ValueError:
+        - if a variable of Rules is not in new_ds
+        - if a rule does not have exactly one of RULE_KINDS
+    """
+    for variable, rules in Rules.items():
+        if variable not in new_ds.variables:
+            raise ValueError(f"{variable} has rules but is not in the dataset.")
+        for rule in rules:
+            if len([kind for kind in RULE_KINDS if kind in rule])!=1:
+                raise ValueError(f"every rule of {variable} must have one of {', '.join(RULE_KINDS)}.")
+    deferred = list(excluded_variable) + list(SmoothVariables or [])
+    fused = {
+        variable: rules for variable, rules in Rules.items()
+        if variable not in excluded_variable and (variable not in deferred or variable in (Unread or []))
+    }
+    remaining = {variable: rules for variable, rules in Rules.items() if variable in deferred}
+    return fused, remaining
+
+def plan_sources(
+    Rules:dict,
+    NumLayer:int=None,
+) -> tuple:
+    """
+    Works out, from the rule table Rules, which values of the output come
+    from the rules alone, so they are never read from the input file nor
+    averaged.
+    ...
+    Parameters
+    ----------
+    Rules : dict
+        lists of rules of the variables, in the format of MET2D_RULES
+    NumLayer : int
+        number of layers of the clipped dataset, a variable whose every
+        layer is set by a layer rule is then set by its rules only
+
+    Returns
+    -------
+    tuple
+        the list of the variables whose values are all set by a "constant"
+        or "copy" rule, and the dictionary of the variables whose first
+        layers only are set that way, with their number of such layers.
+
+    Caveat
+    -------
+    A "clip" rule never sets values, but it does not need the values it
+    clips to be read if they were set by an earlier rule of the variable.
+    """
+    unread, skip_layers = [], {}
+    for variable, rules in Rules.items():
+        setting = [rule for rule in rules if "constant" in rule or "copy" in rule]
+        if any("layer" not in rule for rule in setting):
+            unread.append(variable)
+            continue
+        layers = {rule["layer"] for rule in setting}
+        first = 0
+        while first in layers:
+            first += 1
+        if NumLayer is not None and first>=NumLayer:
+            unread.append(variable)
+        elif first>0:
+            skip_layers[variable] = first
+    return unread, skip_layers
+
+# the dimensions of the gridded variables of the CAMx files
+GRID_DIMS = ("TSTEP", "LAY", "ROW", "COL")
+
+def uniform_profile(var:xr.Variable):
+    """
+    Returns the (TSTEP, LAY) profile of a (TSTEP, LAY, ROW, COL) variable
+    kept as a view broadcast over ROW and COL (see fill_with_mean with
+    Compact), or None for any other variable. The profile is a read-only
+    view, nothing is copied.
+    """
+    data = var.data
+    if not isinstance(data, np.ndarray) or var.dims!=GRID_DIMS or 0 in data.shape:
+        return None
+    if data.strides[2:]!=(0, 0):
+        return None
+    return data[:, :, 0, 0]
+
+def compact_writes() -> bool:
+    # whether dask is there to write the uniform variables in chunks
+    return importlib.util.find_spec("dask") is not None
+
+def _compact_rules(rules:list, Sources:xr.Dataset=None) -> bool:
+    # whether the rules can be applied to a (TSTEP, LAY) profile: their copy
+    # rules must take their values from uniform variables
+    return all(
+        "copy" not in rule or uniform_profile(Sources.variables[rule["copy"]]) is not None for rule in rules
+    )
+
+def _apply_rule(data:np.ndarray, rule:dict, Sources:xr.Dataset=None) -> None:
+    # applies one rule in place to a (TSTEP, LAY, ...) numpy array, which
+    # can also be the (TSTEP, LAY) mean profile of a variable
+    index = (slice(None), slice(rule["layer"], rule["layer"]+1)) if "layer" in rule else (Ellipsis,)
+    if "constant" in rule:
+        data[index] = rule["constant"]
+    elif "clip" in rule:
+        np.clip(data[index], rule["clip"][0], rule["clip"][1], out=data[index])
+    else:
+        source = Sources.variables[rule["copy"]]
+        # a profile copies the profile of a uniform source
+        values = uniform_profile(source) if data.ndim==2 else source.values
+        data[index] = values[:, :1] if "layer" in rule else values
+
+def _apply_rule_lazy(data, rule:dict, Sources:xr.Dataset=None):
+    # returns data with one rule applied, written with np.where so the
+    # same code works on dask arrays
+    if "layer" in rule:
+        where = np.arange(data.shape[1]).reshape((1, -1) + (1,)*(data.ndim-2))==rule["layer"]
+    else:
+        where = np.ones((1,)*data.ndim, dtype=bool)
+    if "constant" in rule:
+        value = np.asarray(rule["constant"], dtype=data.dtype)
+    elif "clip" in rule:
+        value = np.clip(data, rule["clip"][0], rule["clip"][1])
+    else:
+        source = Sources.variables[rule["copy"]].data
+        value = (source[:, :1] if "layer" in rule else source).astype(data.dtype)
+    return np.where(where, value, data)
+
+def apply_rules(
+    new_ds:xr.Dataset,
+    Rules:dict,
+    Sources:xr.Dataset=None,
+) -> None:
+    """
+    Applies the rule table Rules (see MET2D_RULES) to the variables of
+    new_ds. The numpy variables are changed in place, only on the layers
+    the rules name, and clipped with np.clip(out=...), so no whole-array
+    temporary is made. Dask-backed variables get lazy np.where.
+    ...
+    Parameters
+    ----------
+    new_ds : xr.Dataset
+        dataset whose variables are changed
+    Rules : dict
+        lists of rules of the variables, in the format of MET2D_RULES
+    Sources : xr.Dataset
+        dataset the "copy" rules take their values from
+
+    Caveat
+    -------
+    The variables kept as profiles (see fill_with_mean with Compact) stay
+    profiles when their copy rules take their values from profiles too.
+    """
+    for variable, rules in Rules.items():
+        var = new_ds.variables[variable]
+        profile = uniform_profile(var)
+        if profile is not None and _compact_rules(rules, Sources):
+            # only the profile of a uniform variable is changed
+            profile = profile.copy()
+            for rule in rules:
+                _apply_rule(profile, rule, Sources)
+            var.data = np.broadcast_to(profile[:, :, np.newaxis, np.newaxis], var.shape)
+        elif var.chunks is not None:
+            data = var.data
+            for rule in rules:
+                data = _apply_rule_lazy(data, rule, Sources)
+            var.data = data
+        else:
+            data = var.values
+            if not data.flags.writeable:
+                data = data.copy()
+            for rule in rules:
+                _apply_rule(data, rule, Sources)
+            var.values = data
+    pass
+
+def fill_with_mean(
+    new_ds:xr.Dataset,
+    mean_ds:xr.Dataset,
+    excluded_variable:list,
+    Profiler:StageProfiler=None,
+    Rules:dict=None,
+    Sources:xr.Dataset=None,
+    Compact:bool=False,
+) -> None:
+    """
+    Fills every (TSTEP, LAY, ROW, COL) variable of the clipped dataset
+    with its window mean, broadcast over ROW and COL.
+    ...
+    Parameters
+    ----------
+    new_ds : xr.Dataset
+        clipped dataset whose variables are overwritten in place
+    mean_ds : xr.Dataset
+        window mean of each variable, either per hour (TSTEP) or per
+        hour and layer (TSTEP, LAY)
+    excluded_variable : list
+        names of the variables that must keep their original values
+    Profiler : StageProfiler
+        if given, the time and the number of cells of the fill of each
+        variable are counted in it
+    Rules : dict
+        rules of the filled variables (see MET2D_RULES and split_rules),
+        applied during the fill
+    Sources : xr.Dataset
+        dataset the "copy" rules take their values from
+    Compact : bool
+        if True, the numpy variables are kept as their (TSTEP, LAY)
+        profile, with its rules applied, behind a read-only view broadcast
+        over ROW and COL (see uniform_profile), so they take the memory of
+        the profile instead of the grid. A copy rule from a variable that
+        is not uniform still fills a buffer.
+
+    Caveat
+    -------
+    A per-layer mean is matched to the clipped layers from the first
+    averaged layer on, the same way the former per-(t, z) loops did.
+    Every variable is written in a single broadcast into a freshly
+    allocated buffer, so the original values are never read from disk.
+    Dask-backed variables get a lazy broadcast instead of a buffer.
+    The constant and clip rules, up to the first copy rule, are applied to
+    the small (TSTEP, LAY) mean profile before it is broadcast, so they
+    cost nothing; the copy rules, and the rules after them, are applied
+    to the filled buffer.
+    """
+    Rules = Rules or {}
+    for variable in new_ds.variables:
+        if variable in excluded_variable:
+            continue
+        start = time.perf_counter()
+        var = new_ds.variables[variable]
+        if variable not in mean_ds.variables:
+            # set by its rules only, nothing was read nor averaged (see
+            # plan_sources), so they write the empty buffer
+            if Compact and var.chunks is None and var.dims==GRID_DIMS and _compact_rules(Rules[variable], Sources):
+                var.data = np.broadcast_to(np.empty((1,)*var.ndim, dtype=var.dtype), var.shape)
+            apply_rules(new_ds, {variable: Rules[variable]}, Sources)
+            if Profiler is not None:
+                Profiler.count(variable, var.size, time.perf_counter() - start)
+            continue
+        profile = np.asarray(mean_ds.variables[variable].values)
+        if profile.ndim == 1:
+            profile = profile[:, np.newaxis]
+        profile = profile[:var.shape[0], :var.shape[1]]
+
+        rules = Rules.get(variable, [])
+        copies = [i for i, rule in enumerate(rules) if "copy" in rule]
+        profile_rules = rules[:copies[0]] if copies else rules
+        buffer_rules = rules[len(profile_rules):]
+        if profile_rules:
+            # the values of the rules are those of the variable's type
+            profile = np.array(
+                np.broadcast_to(profile, (profile.shape[0], var.shape[1])),
+                dtype=var.dtype,
+            )
+            for rule in profile_rules:
+                _apply_rule(profile, rule)
+
+        if var.chunks is not None:
+            # dask-backed variable, broadcast lazily with its own chunks
+            import dask.array
+            profile = dask.array.from_array(
+                profile.astype(var.dtype)[:, :, np.newaxis, np.newaxis],
+                chunks=(var.chunks[0], var.chunks[1] if profile.shape[1]==var.shape[1] else 1, 1, 1),
+            )
+            var.data = dask.array.broadcast_to(profile, var.shape, chunks=var.chunks)
+            for rule in buffer_rules:
+                var.data = _apply_rule_lazy(var.data, rule, Sources)
+        elif Compact and var.dims==GRID_DIMS and _compact_rules(buffer_rules, Sources):
+            profile = np.array(np.broadcast_to(profile, (profile.shape[0], var.shape[1])), dtype=var.dtype)
+            for rule in buffer_rules:
+                _apply_rule(profile, rule, Sources)
+            var.data = np.broadcast_to(profile[:, :, np.newaxis, np.newaxis], var.shape)
+        else:
+            out = np.empty(var.shape, dtype=var.dtype)
+            out[...] = profile[:, :, np.newaxis, np.newaxis]
+            for rule in buffer_rules:
+                _apply_rule(out, rule, Sources)
+            var.values = out
+        if Profiler is not None:
+            Profiler.count(variable, var.size, time.perf_counter() - start)
+
+def _mean_block(block:np.ndarray, dims:tuple, reduce_dims:list) -> np.ndarray:
+    # the mean of one dask block, through xarray so it is the same as the eager mean
+    return xr.Variable(dims, block).mean(reduce_dims).values
+
+def lazy_mean(
+    ds:xr.Dataset,
+    Dims:list,
+) -> xr.Dataset:
+    """
+    Returns the mean of the dask-backed dataset ds along Dims as a lazy
+    dataset, without computing anything.
+    ...
+    Parameters
+    ----------
+    ds : xr.Dataset
+        dataset opened with dask chunks
+    Dims : list
+        dimensions to take the mean along
+
+    Caveat
+    -------
+    The (TSTEP, ...) variables are rechunked to a single chunk along Dims
+    and each block is reduced with xarray itself, so the result is bit for
+    bit the one of ds.load().mean(dim=Dims) while the hours are still
+    reduced in parallel. The small variables without TSTEP are loaded and
+    reduced eagerly.
+    """
+    lazy = [
+        variable for variable in ds.data_vars
+        if ds.variables[variable].chunks is not None and "TSTEP" in ds.variables[variable].dims
+        and set(Dims) & set(ds.variables[variable].dims)
+    ]
+    eager_ds = ds.drop_vars(lazy).load().mean(dim=Dims)
+    variables = {}
+    for variable in ds.variables:
+        if variable in eager_ds.variables:
+            variables[variable] = eager_ds.variables[variable]
+        elif variable in lazy:
+            var = ds.variables[variable]
+            reduce_dims = [dim for dim in var.dims if dim in Dims]
+            axes = tuple(var.get_axis_num(dim) for dim in reduce_dims)
+            dtype = _mean_block(np.zeros((1,)*var.ndim, dtype=var.dtype), var.dims, reduce_dims).dtype
+            data = var.data.rechunk({axis: -1 for axis in axes}).map_blocks(
+                _mean_block, var.dims, reduce_dims, drop_axis=axes, dtype=dtype,
+            )
+            variables[variable] = ([dim for dim in var.dims if dim not in reduce_dims], data)
+    # keep the order of the variables of ds, like ds.mean does
+    return xr.Dataset(variables)
+
+def smooth_in_time(
+    new_ds:xr.Dataset,
+    Variables:list,
+    Window:int=3,
+    HourStart:int=1,
+    HourEnd:int=12,
+    Profiler:StageProfiler=None,
+) -> None:
+    """
+    Replaces, in place, the hours HourStart to HourEnd (excluded) of each
+    variable of Variables by the NaN-mean of the Window hours that end at
+    that hour (a trailing rolling mean along TSTEP).
+    ...
+    Parameters
+    ----------
+    new_ds : xr.Dataset
+        dataset whose variables are smoothed in place
+    Variables : list
+        names of the float variables to smooth, the ones that are not in
+        new_ds are skipped
+    Window : int
+        number of hours averaged, including the smoothed hour
+    HourStart : int
+        first hour smoothed
+    HourEnd : int
+        hour after the last hour smoothed
+    Profiler : StageProfiler
+        if given, the time and the number of cells of the smoothing of each
+        variable are counted in it
+
+    Raises
+    ------
+    ValueError:
+        - if Window is smaller than one
+        - if HourStart and HourEnd are not 0 <= HourStart < HourEnd <= TSTEP
+        - if a variable is not a float variable
+
+    Caveat
+    -------
+    The means are taken from the original values, never from hours that
+    are already smoothed, and the windows of the first hours are cut at
+    hour 0 (hour 1 with Window=3 is the mean of hours 0 and 1). The
+    windows are strided views of the hours HourStart-Window+1 to HourEnd,
+    so the cost grows linearly with the number of hours and only those
+    hours are copied, once. Dask-backed variables are smoothed lazily, and
+    the variables kept as profiles (see uniform_profile) only have their
+    profile smoothed.
+    """
+    # ----------------------------------------------------------------------
+    # Error checking
+    if (Window<1):
+        raise ValueError("Window must be at least one hour.")
+    if (HourStart<0 or HourEnd<=HourStart or HourEnd>new_ds.sizes["TSTEP"]):
+        raise ValueError("HourStart and HourEnd must be 0 <= HourStart < HourEnd <= TSTEP.")
+    # -----------------------------------------------------------------------
+    for variable in Variables:
+        if variable not in new_ds.variables:
+            continue
+        start = time.perf_counter()
+        var = new_ds.variables[variable]
+        if not np.issubdtype(var.dtype, np.floating):
+            raise ValueError(f"{variable} is not a float variable and can not be smoothed.")
+        axis = var.get_axis_num("TSTEP")
+        first = HourStart-Window+1
+        if var.chunks is not None:
+            import dask.array as array_module
+        else:
+            array_module = np
+        # only the profile of a uniform variable is smoothed
+        profile = uniform_profile(var)
+        data = var.data if profile is None else profile[:, :, np.newaxis, np.newaxis]
+        span = data[(slice(None),)*axis + (slice(max(first, 0), HourEnd),)]
+        if first<0:
+            # NaN hours before hour 0 cut the first windows
+            shape = list(span.shape)
+            shape[axis] = -first
+            span = array_module.concatenate([array_module.full(shape, np.nan, dtype=var.dtype), span], axis=axis)
+        windows = array_module.lib.stride_tricks.sliding_window_view(span, Window, axis=axis)
+        smoothed = array_module.nanmean(windows, axis=-1).astype(var.dtype)
+        if var.chunks is not None:
+            before = var.data[(slice(None),)*axis + (slice(None, HourStart),)]
+            after = var.data[(slice(None),)*axis + (slice(HourEnd, None),)]
+            var.data = array_module.concatenate([before, smoothed, after], axis=axis).rechunk(var.chunks)
+        elif profile is not None:
+            data = data.copy()
+            data[(slice(None),)*axis + (slice(HourStart, HourEnd),)] = smoothed
+            var.data = np.broadcast_to(data, var.shape)
+        else:
+            data = var.values
+            data[(slice(None),)*axis + (slice(HourStart, HourEnd),)] = smoothed
+            var.values = data
+        if Profiler is not None:
+            Profiler.count(variable, smoothed.size, time.perf_counter() - start)
+
+def create_netcdf_like(
+    ds:xr.Dataset,
+    clip:dict,
+    path:str,
+    UnlimitedDims:list=None,
+) -> netCDF4.Dataset:
+    """
+    Creates an empty netCDF file at path with the dimensions, variables and
+    attributes of ds, with the dimensions in clip reduced to the length of
+    their slice. The unlimited dimensions of ds, and UnlimitedDims, are
+    unlimited. The returned netCDF4.Dataset is open for writing.
+    """
+    out = netCDF4.Dataset(path, "w", format=ds.encoding.get("format", "NETCDF4"))
+    unlimited_dims = set(ds.encoding.get("unlimited_dims", set())) | set(UnlimitedDims or [])
+    for dim, size in ds.sizes.items():
+        if dim in clip:
+            size = len(range(size)[clip[dim]])
+        out.createDimension(dim, None if dim in unlimited_dims else size)
+
+    for variable in ds.variables:
+        var = ds.variables[variable]
+        fill_value = var.encoding.get("_FillValue")
+        if fill_value is None and np.issubdtype(var.dtype, np.floating):
+            fill_value = np.nan
+        nc_var = out.createVariable(
+            variable, var.dtype, var.dims, fill_value=fill_value,
+        )
+        nc_var.setncatts({key: value for key, value in var.attrs.items() if key!="_FillValue"})
+    out.setncatts(ds.attrs)
+    return out
+
+def plan_reads(
+    ds:xr.Dataset,
+    Clip:dict,
+    Window,
+    Overwritten:list,
+    Unread:list=None,
+    SkipLayers:dict=None,
+) -> list:
+    """
+    Plans the hyperslabs that have to be read from the file of ds.
+    ...
+    Parameters
+    ----------
+    ds : xr.Dataset
+        lazily opened input dataset
+    Clip : dict
+        slice of each dimension for the window you need for your simulation
+    Window : dict or None
+        slice of each dimension for the window you want to take a mean
+    Overwritten : list
+        names of the variables whose values in the clipped domain are
+        replaced, so only their averaging window is read
+    Unread : list
+        names of the variables that are not read at all, because their
+        values are set by rules (see plan_sources)
+    SkipLayers : dict
+        number of first clipped layers of the variables that are not read
+        in the clipped domain, because they are set by rules
+
+    Returns
+    -------
+    list
+        one dictionary per hyperslab with the variable name, the region
+        ("clip" or "window"), the slice of each dimension and the number
+        of bytes of the hyperslab.
+    """
+    plan = []
+    Unread = Unread or []
+    SkipLayers = SkipLayers or {}
+    for variable in ds.variables:
+        if variable in Unread:
+            continue
+        var = ds.variables[variable]
+        regions = []
+        if variable not in Overwritten and variable in SkipLayers:
+            # the first layers of the clipped domain are set by rules
+            layers = range(ds.sizes["LAY"])[Clip.get("LAY", slice(None))]
+            regions.append(("clip", {**Clip, "LAY": slice(layers.start+SkipLayers[variable], layers.stop)}))
+        elif variable not in Overwritten:
+            regions.append(("clip", Clip))
+        if Window is not None and (variable in Overwritten or "TSTEP" not in var.dims):
+            regions.append(("window", Window))
+
+        itemsize = np.dtype(var.encoding.get("dtype", var.dtype)).itemsize
+        for region, index in regions:
+            index = {dim: index[dim] for dim in var.dims if dim in index}
+            shape = [
+                len(range(size)[index[dim]]) if dim in index else size
+                for dim, size in zip(var.dims, var.shape)
+            ]
+            plan.append({
+                "variable": variable,
+                "region": region,
+                "index": index,
+                "nbytes": int(np.prod(shape))*itemsize,
+            })
+    return plan
+
+def read_report(
+    path:str,
+    plan:list,
+) -> dict:
+    """
+    Summarizes a plan of plan_reads as the number of bytes read from the
+    file at path and the size of that file.
+    """
+    return {
+        "file_size": os.path.getsize(path),
+        "bytes_read": sum(read["nbytes"] for read in plan),
+        "reads": plan,
+    }
+
+def camx_chunksizes(var:xr.Variable) -> tuple:
+    """
+    Returns the netCDF4 chunk shape of var for the way CAMx files are read:
+    one hour (TSTEP) and, for the gridded variables, one layer (LAY) of the
+    whole ROW x COL plane per chunk. The other dimensions are not split.
+    """
+    gridded = "ROW" in var.dims and "COL" in var.dims
+    return tuple(
+        1 if dim=="TSTEP" or (dim=="LAY" and gridded) else max(size, 1)
+        for dim, size in zip(var.dims, var.shape)
+    )
+
+def netcdf_encoding(
+    ds:xr.Dataset,
+    Format:str="NETCDF4",
+    Compression:int=None,
+    Shuffle:bool=True,
+    Downcast:bool=False,
+    Encoding:dict=None,
+) -> dict:
+    """
+    Returns the encoding argument of xr.Dataset.to_netcdf for ds.
+    ...
+    Parameters
+    ----------
+    ds : xr.Dataset
+        dataset to write
+    Format : str
+        "NETCDF4", "NETCDF4_CLASSIC" or "NETCDF3_64BIT"
+    Compression : int
+        zlib level from 1 to 9 of every variable, with the chunk shape of
+        camx_chunksizes; None or 0 writes the variables uncompressed
+    Shuffle : bool
+        if True, the bytes are shuffled before the compression, which
+        helps float data
+    Downcast : bool
+        if True, float64 variables are written as float32 and int64
+        variables as int32 when no value changes
+    Encoding : dict
+        encoding of some variables (e.g. {"O3": {"complevel": 9}}) that
+        is applied last, over the one above
+
+    Raises
+    ------
+    ValueError:
+        - if Format is not one of the formats above
+        - if Compression is given with NETCDF3_64BIT
+        - if Compression is not between 0 and 9
+
+    Caveat
+    -------
+    The _FillValue of each variable in the input file is kept. Downcast
+    only looks at variables that are in memory, not at dask-backed ones.
+    """
+    # ----------------------------------------------------------------------
+    # Error checking
+    if Format not in ["NETCDF4", "NETCDF4_CLASSIC", "NETCDF3_64BIT"]:
+        raise ValueError("Format must be NETCDF4, NETCDF4_CLASSIC or NETCDF3_64BIT")
+    if Compression and Format=="NETCDF3_64BIT":
+        raise ValueError("NETCDF3_64BIT files can not be compressed")
+    if Compression is not None and not 0<=Compression<=9:
+        raise ValueError("Compression must be between 0 and 9")
+    # -----------------------------------------------------------------------
+    encoding = {}
+    for variable in ds.variables:
+        var = ds.variables[variable]
+        encoding[variable] = {
+            key: value for key, value in var.encoding.items() if key in ["_FillValue", "dtype"]
+        }
+        if Compression:
+            encoding[variable].update({
+                "zlib": True,
+                "complevel": Compression,
+                "shuffle": Shuffle,
+                "chunksizes": camx_chunksizes(var),
+            })
+        if Downcast and var.chunks is None:
+            # the profile of a uniform variable has all of its values
+            values = var.values if uniform_profile(var) is None else uniform_profile(var)
+            if values.dtype==np.float64 and np.array_equal(
+                values.astype(np.float32).astype(np.float64), values, equal_nan=True,
+            ):
+                encoding[variable]["dtype"] = np.dtype(np.float32)
+            elif values.dtype==np.int64 and (
+                values.size==0 or np.iinfo(np.int32).min<=values.min()<=values.max()<=np.iinfo(np.int32).max
+            ):
+                encoding[variable]["dtype"] = np.dtype(np.int32)
+    for variable, variable_encoding in (Encoding or {}).items():
+        encoding.setdefault(variable, {}).update(variable_encoding)
+    return encoding
+
+def read_windows(path:str) -> list:
+    """
+    Reads the clip/averaging windows of modify_conc_multi from a CSV or a
+    YAML file (chosen by the extension .csv, .yaml or .yml).
+    ...
+    Each window is a CSV row or a YAML list item with the keys name,
+    rowstart, rowend, colstart, colend, laystart, layend, rowindexavg,
+    columnindexavg and layerindexavg, named like the flags of
+    modify_conc_netcdf.py. The averaging ranges are comma separated
+    strings of two integers (e.g. "20,50"), or lists in YAML.
+
+    Example
+    -------
+    name,rowstart,rowend,colstart,colend,laystart,layend,rowindexavg,columnindexavg,layerindexavg
+    site1,0,10,0,20,0,2,"20,50","30,60","0,2"
+    """
+    if path.endswith(".csv"):
+        windows = pd.read_csv(path, dtype=str).to_dict("records")
+    elif path.endswith((".yaml", ".yml")):
+        import yaml
+        with open(path) as f:
+            windows = yaml.safe_load(f)
+    else:
+        raise ValueError("the windows file must be a .csv, .yaml or .yml file")
+
+    def index_range(value):
+        if isinstance(value, str):
+            value = value.split(',')
+        return [int(i) for i in value]
+
+    return [
+        {
+            "Name": str(window["name"]),
+            "RowStart": int(window["rowstart"]),
+            "RowEnd": int(window["rowend"]),
+            "ColumnStart": int(window["colstart"]),
+            "ColumnEnd": int(window["colend"]),
+            "LayerStart": int(window["laystart"]),
+            "LayerEnd": int(window["layend"]),
+            "RowIndexAvg": index_range(window["rowindexavg"]),
+            "ColumnIndexAvg": index_range(window["columnindexavg"]),
+            "LayerIndexAvg": index_range(window["layerindexavg"]),
+        }
+        for window in windows
+    ]
 
 class netcdf_modifier:
-    def __init__(self, directory:str) -> None:
+    def __init__(
+        self,
+        directory:str,
+        index_directory:str=None,
+        mean_cache:MeanCache=None,
+        dask_scheduler:str=None,
+        dask_workers:int=None,
+        dask_chunks:dict=None,
+        memory_map:bool=True,
+        profiler:StageProfiler=None,
+        dataset_pool:DatasetPool=None,
+        compact:bool=False,
+        species:list=None,
+        exclude_species:list=None,
+    ) -> None:
+        """
+        ...
+        Parameters
+        ----------
+        directory : str
+            directory where the input netCDF files are
+        index_directory : str
+            directory of the summed-area table indexes (see window_index),
+            by default next to each file
+        mean_cache : MeanCache
+            on-disk cache of the window means, if any
+        dask_scheduler : str
+            if given ("threads", "processes" or "synchronous"), the files
+            are opened with dask chunks and the means, the fill and the
+            writing run as dask graphs on this local scheduler
+        dask_workers : int
+            number of threads or processes of the dask scheduler, by
+            default the number of cores
+        dask_chunks : dict
+            dask chunks of the opened files, by default one hour (TSTEP)
+            and every layer per chunk
+        memory_map : bool
+            if True, classic and 64-bit offset (NETCDF3) input files are
+            read through a memory map (see classic_netcdf) instead of
+            netCDF4, so only the pages of the windows that are read are
+            loaded from disk. It is not used in the dask mode.
+        profiler : StageProfiler
+            if given, the time and memory of the stages of every method
+            are recorded in it
+        dataset_pool : DatasetPool
+            if given, the input files are taken from this pool of open
+            datasets, which can be shared by many netcdf_modifier, instead
+            of being opened and closed by every method
+        compact : bool
+            if True, the filled variables of the returned datasets are
+            kept as their (TSTEP, LAY) profile broadcast over ROW and COL
+            (see fill_with_mean), and to_netcdf writes them one hour at a
+            time, so a large clipped domain costs the memory of the
+            profiles instead of the grids. Their values are read-only.
+        species : list
+            if given, the conc methods only keep the species matching
+            one of these patterns (see select_species), e.g. ["O3",
+            "NO*", "@ozone"]. The other species are dropped when the file
+            is opened, so they are never read, averaged, filled or
+            written, and are not in the excel files.
+        exclude_species : list
+            patterns of the species the conc methods drop, after species
+
+        Raises
+        ------
+        ValueError:
+            - if dask_scheduler is not one of the schedulers above
+            - if species or exclude_species name an unknown group
+        """
+        if dask_scheduler not in [None, "threads", "processes", "synchronous"]:
+            raise ValueError("dask_scheduler must be threads, processes or synchronous")
+        # the groups are checked before any file is opened
+        expand_patterns(list(species or []) + list(exclude_species or []))
         self.directory = directory
+        self.index_directory = index_directory
+        self.mean_cache = mean_cache
+        self.dask_scheduler = dask_scheduler
+        self.dask_workers = dask_workers
+        self.dask_chunks = dask_chunks if dask_chunks is not None else {"TSTEP": 1}
+        self.memory_map = memory_map
+        self.profiler = profiler
+        self.dataset_pool = dataset_pool
+        self.compact = compact
+        self.species = species
+        self.exclude_species = exclude_species
+        self.read_reports = {}
+        self.write_reports = {}
+        # the summary tables are written on this thread, see to_summary
+        self.summary_executor = ThreadPoolExecutor(max_workers=1)
+        self.summary_futures = []
         pass
 
+    def _stage(self, Stage:str):
+        # times the body as a stage of the current method when profiling
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.stage(Stage)
+
+    def _select_species(self) -> bool:
+        # True when the conc methods only keep some of the species
+        return self.species is not None or bool(self.exclude_species)
+
+    def _dropped_species(self, path:str) -> list:
+        # the variables of the conc file at path that the species selection
+        # drops, read from the header only
+        if is_zarr_store(path):
+            variables = list(open_zarr_store(path).variables)
+        elif is_uamiv(path):
+            variables = list(open_uamiv_dataset(path).variables)
+        else:
+            with netcdf_lock, netCDF4.Dataset(path) as nc:
+                variables = list(nc.variables)
+        kept = select_species(variables, self.species, self.exclude_species)
+        if not kept:
+            raise ValueError(f"no species of {path} is selected by species and exclude_species")
+        return [variable for variable in variables if variable not in kept and variable not in NOT_SPECIES]
+
+    def _open_dataset(self, FileName:str, Dask:bool=True, Species:bool=False) -> xr.Dataset:
+        # lazily open the file, with dask chunks in the dask mode, or through
+        # a memory map if it is a NETCDF3 or UAM-IV file. With Species, the
+        # species that are not selected are dropped by the open step.
+        path = f"{self.directory}/{FileName}"
+        Dask = Dask and self.dask_scheduler is not None
+        dropped = self._dropped_species(path) if Species and self._select_species() else []
+
+        def opener():
+            if is_zarr_store(path):
+                # the tiles of the windows are read in parallel by dask in
+                # either mode, with the chunks of the store
+                return open_zarr_store(path).drop_vars(dropped)
+            if is_uamiv(path):
+                ds = open_uamiv_dataset(path).drop_vars(dropped)
+                return ds.chunk(self.dask_chunks) if Dask else ds
+            if Dask:
+                with netcdf_lock:
+                    return xr.open_dataset(path, chunks=self.dask_chunks, drop_variables=dropped or None)
+            if self.memory_map and is_classic_netcdf(path):
+                # the dropped variables are never read
+                return open_classic_dataset(path).drop_vars(dropped)
+            with netcdf_lock:
+                return xr.open_dataset(path, drop_variables=dropped or None)
+
+        with self._stage("open"):
+            if self.dataset_pool is None:
+                return opener()
+            mode = (tuple(sorted(self.dask_chunks.items())) if Dask else None, self.memory_map, tuple(dropped))
+            with netcdf_lock:
+                return self.dataset_pool.acquire(path, mode, opener)
+
+    def _close_dataset(self, ds:xr.Dataset) -> None:
+        # close a dataset of _open_dataset, or give it back to the pool
+        with netcdf_lock:
+            if self.dataset_pool is None:
+                ds.close()
+            else:
+                self.dataset_pool.release(ds)
+        pass
+
+    def _dask_config(self, Write:bool=False):
+        import dask
+        scheduler = self.dask_scheduler
+        if Write and scheduler=="processes":
+            # the write lock of the output file can not be sent to other processes
+            scheduler = "threads"
+        return dask.config.set(scheduler=scheduler, num_workers=self.dask_workers)
+
+    def _means(self, selected_ds:xr.Dataset, DimsList:list) -> list:
+        # the mean of selected_ds along each list of dimensions of DimsList,
+        # computed together in one dask graph in the dask mode
+        with self._stage("reduce"):
+            if self.dask_scheduler is None:
+                return [selected_ds.mean(dim=Dims) for Dims in DimsList]
+            import dask
+            means = [lazy_mean(selected_ds, Dims) for Dims in DimsList]
+            with netcdf_lock, self._dask_config():
+                return list(dask.compute(*means))
+
+    def _cached_means(self, FileName:str, Kind:str, Window:dict):
+        # key and cached means of the window, or None when there is no cache
+        if self.mean_cache is None:
+            return None, None
+        if Kind.startswith("conc") and self._select_species():
+            # the means of another selection have other species
+            Kind = json.dumps([Kind, self.species, self.exclude_species])
+        key = self.mean_cache.key(f"{self.directory}/{FileName}", Kind, Window)
+        return key, self.mean_cache.get(key)
+
+    def _plan_rules(
+        self,
+        ds:xr.Dataset,
+        Rules:dict,
+        excluded_variable:list,
+        SmoothVariables:list,
+        NumLayer:int,
+        KeepRuleMeans:bool,
+    ) -> tuple:
+        # splits the rules (see split_rules) and plans, before anything is
+        # read, which variables are averaged and which values are set by
+        # the rules only (see plan_sources)
+        unread, skip_layers = plan_sources(Rules, NumLayer)
+        if KeepRuleMeans:
+            # their averaging window is still read, for the excel tables
+            unread = [variable for variable in unread if variable in excluded_variable]
+        fused_rules, rules = split_rules(Rules, ds, excluded_variable, SmoothVariables, unread)
+        averaged = [
+            variable for variable in ds.variables if variable not in excluded_variable and variable not in unread
+        ]
+        return fused_rules, rules, averaged, unread, skip_layers
+
+    def print_cache_report(self) -> None:
+        if self.mean_cache is None:
+            return
+        print(
+            f"mean cache: {self.mean_cache.hits} hits, {self.mean_cache.misses} misses, "
+            f"{self.mean_cache.evictions} evictions "
+            f"({self.mean_cache.size()/2**20:.2f} MiB of {self.mean_cache.max_bytes/2**20:.0f} MiB)"
+        )
+        pass
+
+    def window_index(
+        self,
+        FileName:str,
+        Variables:list,
+        ds:xr.Dataset=None,
+    ) -> WindowMeanIndex:
+        """
+        Returns the summed-area table index of FileName with the tables of
+        Variables built. The index is kept next to the file, or in
+        index_directory if it was given, and is rebuilt when the file
+        changes.
+        """
+        index_directory = None
+        if self.index_directory is not None:
+            index_directory = os.path.join(self.index_directory, FileName+".sat")
+        index = WindowMeanIndex(f"{self.directory}/{FileName}", index_directory)
+        with self._stage("index"), netcdf_lock:
+            index.build(Variables, ds)
+        return index
+
+    @profiled
     def modify_conc(
         self,
         FileName:str,
@@ -20,6 +998,10 @@ class netcdf_modifier:
         RowIndexAvg:list,
         ColumnIndexAvg:list,
         LayerIndexAvg:list,
+        WindowIndex:bool=False,
+        SmoothVariables:list=None,
+        SmoothWindow:int=3,
+        SmoothHours:tuple=(1, 12),
     ):
         """
         This function modifies CAMx output concentration.
@@ -58,6 +1040,19 @@ class netcdf_modifier:
             range of layer indecies in a form of list containing
             two integers where you want to take an average of
             concentration values
+        WindowIndex : bool
+            if True, the means are taken from the summed-area table
+            index of the file (see window_index), which is built the
+            first time, instead of reading the averaging window
+        SmoothVariables : list
+            names of the species whose hours SmoothHours[0] to
+            SmoothHours[1] (excluded) are replaced, after the fill, by
+            the mean of the SmoothWindow hours ending at each hour
+            (see smooth_in_time)
+        SmoothWindow : int
+            number of hours of the smoothing window
+        SmoothHours : tuple
+            first hour smoothed and hour after the last hour smoothed
         
         Raises
         ------
@@ -109,43 +1104,56 @@ class netcdf_modifier:
         # -----------------------------------------------------------------------
         
         # read the file
-        ds = xr.open_dataset(f"{self.directory}/{FileName}")
-        
-        # select the window you want to take a mean
-        selected_ds = ds.isel(
-            COL=slice(ColumnIndexAvg[0], ColumnIndexAvg[1]),
-            ROW=slice(RowIndexAvg[0], RowIndexAvg[1]),
-            LAY=slice(LayerIndexAvg[0], LayerIndexAvg[1]),
-        )
-        # take the mean
-        mean_ds = selected_ds.mean(dim=["ROW", "COL", "LAY"])
-        mean_ds_noavglay = selected_ds.mean(dim=["ROW", "COL"])
+        ds = self._open_dataset(FileName, Species=True)
+        excluded_variable = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
         
-        # select the window you need for your simulation
-        new_ds = ds.isel(
-            COL=slice(ColumnStart, ColumnEnd),
-            ROW=slice(RowStart, RowEnd),
-            LAY=slice(LayerStart, LayerEnd),
-        )
+        clip = {
+            "COL": slice(ColumnStart, ColumnEnd),
+            "ROW": slice(RowStart, RowEnd),
+            "LAY": slice(LayerStart, LayerEnd),
+        }
+        window = {
+            "COL": slice(ColumnIndexAvg[0], ColumnIndexAvg[1]),
+            "ROW": slice(RowIndexAvg[0], RowIndexAvg[1]),
+            "LAY": slice(LayerIndexAvg[0], LayerIndexAvg[1]),
+        }
+        overwritten = [variable for variable in ds.variables if variable not in excluded_variable]
+
+        cache_key, means = self._cached_means(FileName, "conc/index" if WindowIndex else "conc", window)
+        if means is not None:
+            # the means of this window were kept by an earlier run
+            new_ds, _ = self._read_window(FileName, ds, clip, None, overwritten)
+            mean_ds, mean_ds_noavglay = means["mean"], means["mean_noavglay"]
+        elif WindowIndex:
+            # read the window you need for your simulation, except the values
+            # that are replaced below, and take the mean from the index
+            new_ds, _ = self._read_window(FileName, ds, clip, None, overwritten)
+            index = self.window_index(FileName, overwritten, ds)
+            with self._stage("reduce"):
+                mean_ds = index.mean_dataset(overwritten, window, ["ROW", "COL", "LAY"])
+                mean_ds_noavglay = index.mean_dataset(overwritten, window, ["ROW", "COL"])
+            with netcdf_lock:
+                mean_ds_noavglay["layer"] = ds["layer"].isel(LAY=window["LAY"]).load()
+        else:
+            # read the window you want to take a mean and the window you need for
+            # your simulation, except the values that are replaced below
+            new_ds, selected_ds = self._read_window(FileName, ds, clip, window, overwritten)
+            # take the mean
+            mean_ds, mean_ds_noavglay = self._means(selected_ds, [["ROW", "COL", "LAY"], ["ROW", "COL"]])
+        if cache_key is not None and means is None:
+            self.mean_cache.put(cache_key, {"mean": mean_ds, "mean_noavglay": mean_ds_noavglay})
         
         # replace the values with the average value for each variable at the surface
-        excluded_variable = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
-        for i, variable in enumerate(new_ds.variables):
-            if variable not in excluded_variable:
-                for z in range(new_ds.dims["LAY"]):
-                    for t in range(new_ds[variable].shape[0]):
-                        new_ds[variable][t,z,:,:] = mean_ds[variable][t]
+        with self._stage("fill"):
+            fill_with_mean(new_ds, mean_ds, excluded_variable, self.profiler, Compact=self.compact)
+        self._close_dataset(ds)
+
+        if SmoothVariables:
+            with self._stage("smoothing"):
+                smooth_in_time(new_ds, SmoothVariables, SmoothWindow, *SmoothHours, Profiler=self.profiler)
         
         # to create excel file
-        excel_mean_noavglay = {}
-        for i, variable in enumerate(mean_ds.variables):
-            if variable not in excluded_variable:
-                df = pd.DataFrame()
-                df['hour\layer'] = [i for i in range(24)]
-                for z in mean_ds_noavglay["layer"].values:
-                    df[z] = mean_ds_noavglay[variable][:,z-1]
-                df["averaged"] = mean_ds[variable][:].values.tolist()
-                excel_mean_noavglay[variable] = df
+        excel_mean_noavglay = self._conc_excel(mean_ds, mean_ds_noavglay, excluded_variable)
         
         # editing the attributes
         new_ds.attrs["NCOLS"] = ColumnEnd-ColumnStart
@@ -153,7 +1161,592 @@ class netcdf_modifier:
         new_ds.attrs["NLAYS"] = LayerEnd-LayerStart
 
         return new_ds, excel_mean_noavglay
+
+    @profiled
+    def modify_conc_stream(
+        self,
+        FileName:str,
+        RowStart:int,
+        RowEnd:int,
+        ColumnStart:int,
+        ColumnEnd:int,
+        LayerStart:int,
+        LayerEnd:int,
+        RowIndexAvg:list,
+        ColumnIndexAvg:list,
+        LayerIndexAvg:list,
+        OutputDirectory:str,
+        OutputName:str,
+        TimeChunk:int=1,
+    ) -> dict:
+        """
+        This function modifies CAMx output concentration like modify_conc,
+        but streams it: one variable and TimeChunk hours are read, averaged,
+        filled and written to the output netCDF file at a time.
+        ...
+        Parameters
+        ----------
+        FileName, RowStart, RowEnd, ColumnStart, ColumnEnd, LayerStart,
+        LayerEnd, RowIndexAvg, ColumnIndexAvg, LayerIndexAvg
+            same as modify_conc
+        OutputDirectory : str
+            directory where the modified netCDF file is written
+        OutputName : str
+            name of the modified netCDF file
+        TimeChunk : int
+            number of hours processed at a time
+
+        Raises
+        ------
+        ValueError:
+            - same as modify_conc
+            - if TimeChunk is smaller than one
+
+        Returns
+        -------
+        dict
+            that is the same excel dictionary as modify_conc returns.
+
+        Caveat
+        -------
+        Peak memory is bounded by one (TimeChunk, LAY, ROW, COL) slab of the
+        clipped domain plus the averaging window of one variable, instead of
+        by the size of the input file.
+        """
+        # ----------------------------------------------------------------------
+        # Error checking
+        if (len(RowIndexAvg)!=2):
+            raise ValueError("RowIndexAvg must have a length of two.")
+        if (len(ColumnIndexAvg)!=2):
+            raise ValueError("ColumnIndexAvg must have a length of two.")
+        if (len(LayerIndexAvg)!=2):
+            raise ValueError("LayerIndexAvg must have a length of two.")
+        # ---
+        if (ColumnEnd<=ColumnStart):
+            raise ValueError("ColumnStart is bigger than or equal to ColumnEnd")
+        if (RowEnd<RowStart):
+            raise ValueError("RowStart is bigger than or equal to RowEnd")
+        if (LayerEnd<LayerStart):
+            raise ValueError("LayerStart is bigger than or equal to LayerEnd")
+        if (TimeChunk<1):
+            raise ValueError("TimeChunk must be at least one.")
+        # -----------------------------------------------------------------------
+
+        # open the file lazily, only the slabs indexed below are read
+        ds = self._open_dataset(FileName, Dask=False, Species=True)
+
+        clip = {
+            "COL": slice(ColumnStart, ColumnEnd),
+            "ROW": slice(RowStart, RowEnd),
+            "LAY": slice(LayerStart, LayerEnd),
+        }
+        window = {
+            "COL": slice(ColumnIndexAvg[0], ColumnIndexAvg[1]),
+            "ROW": slice(RowIndexAvg[0], RowIndexAvg[1]),
+            "LAY": slice(LayerIndexAvg[0], LayerIndexAvg[1]),
+        }
+        excluded_variable = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
+        self.read_reports[FileName] = read_report(
+            f"{self.directory}/{FileName}",
+            plan_reads(
+                ds, clip, window,
+                [variable for variable in ds.variables if variable not in excluded_variable],
+            ),
+        )
+
+        with netcdf_lock:
+            out = create_netcdf_like(
+                ds, clip, f"{OutputDirectory}/{OutputName}",
+            )
+            out.setncatts({
+                "NCOLS": ColumnEnd-ColumnStart,
+                "NROWS": RowEnd-RowStart,
+                "NLAYS": LayerEnd-LayerStart,
+            })
+
+        mean = {}
+        mean_noavglay = {}
+        try:
+            for variable in ds.variables:
+                var = ds[variable]
+                var_clip = {dim: clip[dim] for dim in var.dims if dim in clip}
+                if "TSTEP" not in var.dims:
+                    with netcdf_lock:
+                        out[variable][:] = var.isel(var_clip).values
+                    continue
+
+                ntime = var.sizes["TSTEP"]
+                for t in range(0, ntime, TimeChunk):
+                    hours = slice(t, min(t+TimeChunk, ntime))
+                    if variable in excluded_variable:
+                        with netcdf_lock:
+                            out[variable][hours] = var.isel({**var_clip, "TSTEP": hours}).values
+                        continue
+
+                    # take the mean of the window for these hours only
+                    with netcdf_lock:
+                        selected = var.isel({**window, "TSTEP": hours}).load()
+                    mean.setdefault(variable, []).append(
+                        selected.mean(dim=["ROW", "COL", "LAY"]).values
+                    )
+                    mean_noavglay.setdefault(variable, []).append(
+                        selected.mean(dim=["ROW", "COL"]).values
+                    )
+
+                    # fill the clipped domain with the mean of each hour
+                    slab = np.empty(
+                        (hours.stop-hours.start,) + out[variable].shape[1:],
+                        dtype=out[variable].dtype,
+                    )
+                    slab[...] = mean[variable][-1][:, np.newaxis, np.newaxis, np.newaxis]
+                    with netcdf_lock:
+                        out[variable][hours] = slab
+        finally:
+            with netcdf_lock:
+                out.close()
+
+        # to create excel file
+        mean_ds = xr.Dataset({
+            variable: ("TSTEP", np.concatenate(chunks))
+            for variable, chunks in mean.items()
+        })
+        mean_ds_noavglay = xr.Dataset({
+            variable: (("TSTEP", "LAY"), np.concatenate(chunks))
+            for variable, chunks in mean_noavglay.items()
+        })
+        with netcdf_lock:
+            mean_ds_noavglay["layer"] = ds["layer"].isel(LAY=window["LAY"]).load()
+        self._close_dataset(ds)
+
+        return self._conc_excel(mean_ds, mean_ds_noavglay, excluded_variable)
+
+    @profiled
+    def modify_conc_append(
+        self,
+        FileName:str,
+        RowStart:int,
+        RowEnd:int,
+        ColumnStart:int,
+        ColumnEnd:int,
+        LayerStart:int,
+        LayerEnd:int,
+        RowIndexAvg:list,
+        ColumnIndexAvg:list,
+        LayerIndexAvg:list,
+        OutputDirectory:str,
+        OutputName:str,
+        SummaryName:str=None,
+        SummaryFormat:str="csv",
+    ) -> dict:
+        """
+        This function modifies CAMx output concentration like modify_conc,
+        but only for the hours of the input file that are not yet in the
+        output netCDF file, which are appended to it along TSTEP. It is
+        meant for the output of a running CAMx simulation, whose hours
+        land in the file one after the other: every call reads, averages
+        and writes only the new hours.
+        ...
+        Parameters
+        ----------
+        FileName, RowStart, RowEnd, ColumnStart, ColumnEnd, LayerStart,
+        LayerEnd, RowIndexAvg, ColumnIndexAvg, LayerIndexAvg
+            same as modify_conc
+        OutputDirectory : str
+            directory where the modified netCDF file is written
+        OutputName : str
+            name of the modified netCDF file, created with an unlimited
+            TSTEP by the first call
+        SummaryName : str
+            if given, name of the long table of the window means (see
+            summary_table) in OutputDirectory, which the rows of the new
+            hours are appended to (see append_summary)
+        SummaryFormat : str
+            "csv" or "parquet"
+
+        Raises
+        ------
+        ValueError:
+            - same as modify_conc
+            - if SummaryFormat is not "csv" or "parquet"
+            - if the output file was written with other arguments, or not
+            by modify_conc_append
+            - if the input file has fewer hours than the output file
+
+        Returns
+        -------
+        dict
+            that is the excel dictionary of modify_conc for the new hours
+            only, empty when there is no new hour.
+
+        Caveat
+        -------
+        The number of hours done is kept in the MODIFIED_TSTEPS attribute of
+        the output file, and the arguments in MODIFIED_WINDOW. It is updated
+        last, so an interrupted call is done again by the next one.
+        """
+        # ----------------------------------------------------------------------
+        # Error checking
+        if (len(RowIndexAvg)!=2):
+            raise ValueError("RowIndexAvg must have a length of two.")
+        if (len(ColumnIndexAvg)!=2):
+            raise ValueError("ColumnIndexAvg must have a length of two.")
+        if (len(LayerIndexAvg)!=2):
+            raise ValueError("LayerIndexAvg must have a length of two.")
+        # ---
+        if (ColumnEnd<=ColumnStart):
+            raise ValueError("ColumnStart is bigger than or equal to ColumnEnd")
+        if (RowEnd<RowStart):
+            raise ValueError("RowStart is bigger than or equal to RowEnd")
+        if (LayerEnd<LayerStart):
+            raise ValueError("LayerStart is bigger than or equal to LayerEnd")
+        if (SummaryFormat not in APPEND_FORMATS):
+            raise ValueError(f"SummaryFormat must be one of {', '.join(APPEND_FORMATS)}")
+        # -----------------------------------------------------------------------
+
+        # open the file lazily, only the new hours are read
+        ds = self._open_dataset(FileName, Dask=False, Species=True)
+
+        clip = {
+            "COL": slice(ColumnStart, ColumnEnd),
+            "ROW": slice(RowStart, RowEnd),
+            "LAY": slice(LayerStart, LayerEnd),
+        }
+        window = {
+            "COL": slice(ColumnIndexAvg[0], ColumnIndexAvg[1]),
+            "ROW": slice(RowIndexAvg[0], RowIndexAvg[1]),
+            "LAY": slice(LayerIndexAvg[0], LayerIndexAvg[1]),
+        }
+        excluded_variable = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
+        arguments = [
+            FileName, RowStart, RowEnd, ColumnStart, ColumnEnd, LayerStart, LayerEnd,
+            list(RowIndexAvg), list(ColumnIndexAvg), list(LayerIndexAvg),
+        ]
+        if self._select_species():
+            arguments.append([self.species, self.exclude_species])
+        arguments = json.dumps(arguments)
+        path = f"{OutputDirectory}/{OutputName}"
+        ntime = ds.sizes["TSTEP"]
+
+        with netcdf_lock:
+            if os.path.exists(path):
+                out = netCDF4.Dataset(path, "a")
+                if "MODIFIED_TSTEPS" not in out.ncattrs() or getattr(out, "MODIFIED_WINDOW", None)!=arguments:
+                    out.close()
+                    self._close_dataset(ds)
+                    raise ValueError(f"{path} was not written by modify_conc_append with these arguments")
+                done = int(out.MODIFIED_TSTEPS)
+                summary_bytes = int(getattr(out, "SUMMARY_BYTES", 0))
+            else:
+                out = create_netcdf_like(ds, clip, path, UnlimitedDims=["TSTEP"])
+                # no hour is done yet, so an interrupted first call is done
+                # again by the next one
+                out.setncatts({
+                    "NCOLS": ColumnEnd-ColumnStart,
+                    "NROWS": RowEnd-RowStart,
+                    "NLAYS": LayerEnd-LayerStart,
+                    "MODIFIED_WINDOW": arguments,
+                    "MODIFIED_TSTEPS": 0,
+                    "SUMMARY_BYTES": 0,
+                })
+                for variable in ds.variables:
+                    var = ds[variable]
+                    if "TSTEP" not in var.dims:
+                        out[variable][:] = var.isel({dim: clip[dim] for dim in var.dims if dim in clip}).values
+                done, summary_bytes = 0, 0
+        if (ntime<done):
+            with netcdf_lock:
+                out.close()
+            self._close_dataset(ds)
+            raise ValueError(f"{FileName} has {ntime} hours but {path} already has {done}")
+
+        hours = slice(done, ntime)
+        mean = {}
+        mean_noavglay = {}
+        try:
+            for variable in ds.variables:
+                var = ds[variable]
+                if "TSTEP" not in var.dims or done==ntime:
+                    continue
+                if variable in excluded_variable:
+                    var_clip = {dim: clip[dim] for dim in var.dims if dim in clip}
+                    with netcdf_lock:
+                        out[variable][hours] = var.isel({**var_clip, "TSTEP": hours}).values
+                    continue
+
+                # take the mean of the window for the new hours only
+                with self._stage("read"), netcdf_lock:
+                    selected = var.isel({**window, "TSTEP": hours}).load()
+                with self._stage("reduce"):
+                    mean[variable] = selected.mean(dim=["ROW", "COL", "LAY"]).values
+                    mean_noavglay[variable] = selected.mean(dim=["ROW", "COL"]).values
+
+                # fill the new hours of the clipped domain with their mean
+                with self._stage("fill"):
+                    slab = np.empty((ntime-done,) + out[variable].shape[1:], dtype=out[variable].dtype)
+                    slab[...] = mean[variable][:, np.newaxis, np.newaxis, np.newaxis]
+                with self._stage("write"), netcdf_lock:
+                    out[variable][hours] = slab
+
+            excel_dict = {}
+            if mean:
+                mean_ds = xr.Dataset({variable: ("TSTEP", values) for variable, values in mean.items()})
+                mean_ds_noavglay = xr.Dataset({
+                    variable: (("TSTEP", "LAY"), values) for variable, values in mean_noavglay.items()
+                })
+                with netcdf_lock:
+                    mean_ds_noavglay["layer"] = ds["layer"].isel(LAY=window["LAY"]).load()
+                excel_dict = self._conc_excel(mean_ds, mean_ds_noavglay, excluded_variable, FirstHour=done)
+                if SummaryName is not None:
+                    with self._stage("summary"):
+                        summary_bytes = append_summary(
+                            summary_table(excel_dict), f"{OutputDirectory}/{SummaryName}", SummaryFormat,
+                            done, summary_bytes,
+                        )
+
+            # the hours are only recorded once they are written everywhere
+            with netcdf_lock:
+                out.setncatts({"MODIFIED_TSTEPS": ntime, "SUMMARY_BYTES": summary_bytes})
+        finally:
+            with netcdf_lock:
+                out.close()
+        self._close_dataset(ds)
+
+        return excel_dict
+
+    @profiled
+    def modify_conc_multi(
+        self,
+        FileName:str,
+        Windows:list,
+    ) -> list:
+        """
+        This function modifies CAMx output concentration like modify_conc
+        for many clip/averaging windows (e.g. one per monitor site) in a
+        single pass over the file: each variable is read once, over the
+        smallest box holding every averaging window, and all the window
+        means are taken from that slab.
+        ...
+        Parameters
+        ----------
+        FileName : str
+            a formatted string to give a input file
+        Windows : list
+            one dictionary per window with the RowStart, RowEnd,
+            ColumnStart, ColumnEnd, LayerStart, LayerEnd, RowIndexAvg,
+            ColumnIndexAvg and LayerIndexAvg arguments of modify_conc
+            (see read_windows)
+
+        Raises
+        ------
+        ValueError:
+            - same as modify_conc, for any of the windows
+
+        Returns
+        -------
+        list
+            the (netCDF dataset, excel dictionary) that modify_conc
+            returns, for each window in the order of Windows.
+        """
+        # ----------------------------------------------------------------------
+        # Error checking
+        for window in Windows:
+            if (len(window["RowIndexAvg"])!=2):
+                raise ValueError("RowIndexAvg must have a length of two.")
+            if (len(window["ColumnIndexAvg"])!=2):
+                raise ValueError("ColumnIndexAvg must have a length of two.")
+            if (len(window["LayerIndexAvg"])!=2):
+                raise ValueError("LayerIndexAvg must have a length of two.")
+            # ---
+            if (window["ColumnEnd"]<=window["ColumnStart"]):
+                raise ValueError("ColumnStart is bigger than or equal to ColumnEnd")
+            if (window["RowEnd"]<window["RowStart"]):
+                raise ValueError("RowStart is bigger than or equal to RowEnd")
+            if (window["LayerEnd"]<window["LayerStart"]):
+                raise ValueError("LayerStart is bigger than or equal to LayerEnd")
+        # -----------------------------------------------------------------------
+
+        clips = [
+            {
+                "COL": slice(window["ColumnStart"], window["ColumnEnd"]),
+                "ROW": slice(window["RowStart"], window["RowEnd"]),
+                "LAY": slice(window["LayerStart"], window["LayerEnd"]),
+            }
+            for window in Windows
+        ]
+        averages = [
+            {
+                "COL": slice(*window["ColumnIndexAvg"]),
+                "ROW": slice(*window["RowIndexAvg"]),
+                "LAY": slice(*window["LayerIndexAvg"]),
+            }
+            for window in Windows
+        ]
+        # smallest box holding every window, and each window inside that box
+        union_clip = {
+            dim: slice(min(clip[dim].start for clip in clips), max(clip[dim].stop for clip in clips))
+            for dim in ["COL", "ROW", "LAY"]
+        }
+        union_average = {
+            dim: slice(min(average[dim].start for average in averages), max(average[dim].stop for average in averages))
+            for dim in ["COL", "ROW", "LAY"]
+        }
+        relative_clips = [
+            {dim: slice(index.start-union_clip[dim].start, index.stop-union_clip[dim].start) for dim, index in clip.items()}
+            for clip in clips
+        ]
+        relative_averages = [
+            {dim: slice(index.start-union_average[dim].start, index.stop-union_average[dim].start) for dim, index in average.items()}
+            for average in averages
+        ]
+
+        # read the file
+        ds = self._open_dataset(FileName, Dask=False, Species=True)
+        excluded_variable = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
+        overwritten = [variable for variable in ds.variables if variable not in excluded_variable]
+        self.read_reports[FileName] = read_report(
+            f"{self.directory}/{FileName}",
+            plan_reads(ds, union_clip, union_average, overwritten),
+        )
+
+        # read each variable once and take the mean of every window from it
+        mean = [{} for _ in Windows]
+        mean_noavglay = [{} for _ in Windows]
+        kept = {}
+        for variable in ds.variables:
+            var = ds[variable]
+            if variable in overwritten:
+                with netcdf_lock:
+                    slab = var.isel({dim: union_average[dim] for dim in var.dims if dim in union_average}).load()
+                for k, average in enumerate(relative_averages):
+                    selected = slab.isel(average)
+                    mean[k][variable] = selected.mean(dim=["ROW", "COL", "LAY"])
+                    mean_noavglay[k][variable] = selected.mean(dim=["ROW", "COL"])
+            else:
+                with netcdf_lock:
+                    kept[variable] = var.variable.isel(
+                        {dim: union_clip[dim] for dim in var.dims if dim in union_clip}
+                    ).load()
+        with netcdf_lock:
+            layer = ds["layer"].load()
+
+        results = []
+        for k, window in enumerate(Windows):
+            new_ds = ds.isel(clips[k])
+            new_ds.attrs = dict(new_ds.attrs)
+            for variable, var in kept.items():
+                new_ds.variables[variable].values = var.isel(
+                    {dim: relative_clips[k][dim] for dim in var.dims if dim in relative_clips[k]}
+                ).values
+            mean_ds = xr.Dataset(mean[k])
+            mean_ds_noavglay = xr.Dataset(mean_noavglay[k])
+            mean_ds_noavglay["layer"] = layer.isel(LAY=averages[k]["LAY"])
+
+            # replace the values with the average value for each variable at the surface
+            with self._stage("fill"):
+                fill_with_mean(new_ds, mean_ds, excluded_variable, self.profiler, Compact=self.compact)
+
+            # to create excel file
+            excel_mean_noavglay = self._conc_excel(mean_ds, mean_ds_noavglay, excluded_variable)
+
+            # editing the attributes
+            new_ds.attrs["NCOLS"] = window["ColumnEnd"]-window["ColumnStart"]
+            new_ds.attrs["NROWS"] = window["RowEnd"]-window["RowStart"]
+            new_ds.attrs["NLAYS"] = window["LayerEnd"]-window["LayerStart"]
+            results.append((new_ds, excel_mean_noavglay))
+
+        self._close_dataset(ds)
+        return results
+
+    def _conc_excel(
+        self,
+        mean_ds:xr.Dataset,
+        mean_ds_noavglay:xr.Dataset,
+        excluded_variable:list,
+        FirstHour:int=0,
+    ) -> dict:
+        with self._stage("excel_table"):
+            excel_mean_noavglay = {}
+            layers = mean_ds_noavglay["layer"].values
+            for variable in mean_ds.variables:
+                if variable not in excluded_variable:
+                    # build each sheet at once instead of column by column
+                    values = mean_ds_noavglay[variable].values
+                    columns = {'hour\\layer': [i for i in range(FirstHour, FirstHour+values.shape[0])]}
+                    columns.update({z: values[:,z-1] for z in layers})
+                    columns["averaged"] = mean_ds[variable].values.tolist()
+                    excel_mean_noavglay[variable] = pd.DataFrame(columns)
+        return excel_mean_noavglay
     
+    def _read_window(
+        self,
+        FileName:str,
+        ds:xr.Dataset,
+        Clip:dict,
+        Window,
+        Overwritten:list,
+        Unread:list=None,
+        SkipLayers:dict=None,
+    ):
+        # read exactly the hyperslabs planned by plan_reads and keep the report
+        plan = plan_reads(ds, Clip, Window, Overwritten, Unread, SkipLayers)
+        self.read_reports[FileName] = read_report(f"{self.directory}/{FileName}", plan)
+
+        new_ds = ds.isel(Clip)
+        # the values set by rules only get an empty buffer, which the fill
+        # and apply_rules write
+        for variable in Unread or []:
+            var = new_ds.variables[variable]
+            if self.dask_scheduler is not None:
+                import dask.array
+                var.data = dask.array.empty(var.shape, dtype=var.dtype, chunks=var.chunks)
+            else:
+                var.values = np.empty(var.shape, dtype=var.dtype)
+        skipped = {
+            variable: layers for variable, layers in (SkipLayers or {}).items()
+            if variable not in Overwritten and variable not in (Unread or [])
+        }
+        for variable, layers in skipped.items():
+            var = new_ds.variables[variable]
+            if self.dask_scheduler is not None:
+                import dask.array
+                axis = var.get_axis_num("LAY")
+                shape = var.shape[:axis] + (layers,) + var.shape[axis+1:]
+                var.data = dask.array.concatenate(
+                    [dask.array.empty(shape, dtype=var.dtype), var.isel(LAY=slice(layers, None)).data], axis=axis,
+                ).rechunk(var.chunks)
+        selected_ds = None
+        if Window is not None:
+            selected_ds = ds[
+                [read["variable"] for read in plan if read["region"]=="window"]
+            ].isel(Window)
+        if self.dask_scheduler is not None:
+            # the dask graphs read the same hyperslabs when they are computed
+            return new_ds, selected_ds
+        with self._stage("read"), netcdf_lock:
+            for read in plan:
+                if read["region"]=="clip" and read["variable"] in skipped:
+                    # only the layers after the ones set by rules
+                    var = new_ds.variables[read["variable"]]
+                    layers = skipped[read["variable"]]
+                    axis = var.get_axis_num("LAY")
+                    buffer = np.empty(var.shape, dtype=var.dtype)
+                    buffer[(slice(None),)*axis + (slice(layers, None),)] = var.isel(LAY=slice(layers, None)).values
+                    var.values = buffer
+                    continue
+                target = new_ds if read["region"]=="clip" else selected_ds
+                target.variables[read["variable"]].load()
+        return new_ds, selected_ds
+
+    def print_read_report(self) -> None:
+        for FileName, report in self.read_reports.items():
+            print(
+                f"{FileName}: read {report['bytes_read']/2**20:.2f} MiB of "
+                f"{report['file_size']/2**20:.2f} MiB "
+                f"({100*report['bytes_read']/max(report['file_size'], 1):.2f}%)"
+            )
+        pass
+
+    @profiled
     def to_excel(
         self,
         Dictionary:dict,
@@ -165,15 +1758,230 @@ class netcdf_modifier:
                 df.to_excel(writer, sheet_name=key, index=False)
         pass
 
+    @profiled
+    def to_summary(
+        self,
+        Dictionary:dict,
+        OutputDir:str,
+        OutputFile:str,
+        Format:str,
+        Background:bool=True,
+    ) -> None:
+        """
+        Writes the excel dictionary Dictionary as one long table (see
+        summary_table) to OutputDir/OutputFile in Format ("parquet", "csv"
+        or "xlsx"). With Background, the table is built and written on a
+        background thread, so the next netCDF step can start right away;
+        call wait_summaries before relying on the file.
+        """
+        if Format not in SUMMARY_FORMATS:
+            raise ValueError(f"Format must be one of {', '.join(SUMMARY_FORMATS)}")
+        path = f'{OutputDir}/{OutputFile}'
+        if not Background:
+            self._write_summary(Dictionary, path, Format)
+            return
+        self.summary_futures.append(self.summary_executor.submit(
+            self._write_summary, Dictionary, path, Format,
+        ))
+        pass
+
+    @profiled
+    def _write_summary(self, Dictionary:dict, Path:str, Format:str) -> None:
+        with self._stage("table"):
+            table = summary_table(Dictionary)
+        with self._stage("write"):
+            write_summary(table, Path, Format)
+        pass
+
+    def wait_summaries(self) -> None:
+        """
+        Waits for the summaries written in the background and raises the
+        first error of any of them.
+        """
+        futures, self.summary_futures = self.summary_futures, []
+        for future in futures:
+            future.result()
+        pass
+
+    @profiled
     def to_netcdf(
         self,
         nc_dataset:xr.Dataset,
         OutputDirectory:str,
         OutputName:str,
-    ) -> None:
-        nc_dataset.to_netcdf(f"{OutputDirectory}/{OutputName}")
+        Format:str=None,
+        Compression:int=None,
+        Shuffle:bool=True,
+        Downcast:bool=False,
+        Encoding:dict=None,
+    ) -> dict:
+        """
+        Writes nc_dataset to OutputDirectory/OutputName and returns the
+        number of bytes written and the compression ratio, which are also
+        kept in write_reports.
+        ...
+        Parameters
+        ----------
+        Format, Compression, Shuffle, Downcast, Encoding
+            see netcdf_encoding. Without any of them, the file is written
+            as NETCDF4, whatever the format of the input file, with the
+            chunks and compression that the variables kept from a NETCDF4
+            input file (not from NETCDF3, UAM-IV or Zarr inputs).
+            Format "UAMIV" writes a CAMx binary file instead (see
+            write_uamiv), in the byte order of the input file if it was
+            one, without any of the others.
+
+        Raises
+        ------
+        ValueError
+            if Format is "UAMIV" and Compression, Downcast or Encoding is
+            given
+
+        Caveat
+        -------
+        The filled variables are constant over ROW and COL, so with
+        Compression each (hour, layer) chunk shrinks to a few bytes. The
+        variables kept as profiles (see uniform_profile) are expanded one
+        hour at a time while they are written, through dask; without dask,
+        netCDF4 expands each of them whole.
+        """
+        path = f"{OutputDirectory}/{OutputName}"
+        if Format=="UAMIV":
+            # ----------------------------------------------------------------------
+            # Error checking
+            if (Compression or Downcast or Encoding):
+                raise ValueError("Compression, Downcast and Encoding are netCDF options, not UAMIV ones")
+            # -----------------------------------------------------------------------
+            with self._stage("write"):
+                if self.dask_scheduler is None:
+                    with netcdf_lock:
+                        write_uamiv(nc_dataset, path, nc_dataset.encoding.get("byteorder", ">"))
+                else:
+                    with netcdf_lock, self._dask_config(Write=True):
+                        write_uamiv(nc_dataset, path, nc_dataset.encoding.get("byteorder", ">"))
+            return self._write_report(nc_dataset, path, OutputName)
+        kwargs = {}
+        if Format is not None or Compression or Downcast or Encoding:
+            kwargs["format"] = Format if Format is not None else "NETCDF4"
+            with self._stage("encoding"):
+                kwargs["encoding"] = netcdf_encoding(
+                    nc_dataset, kwargs["format"], Compression, Shuffle, Downcast, Encoding,
+                )
+        uniform = [
+            variable for variable in nc_dataset.variables
+            if uniform_profile(nc_dataset.variables[variable]) is not None
+        ]
+        with self._stage("write"):
+            if self.dask_scheduler is None and uniform and compact_writes():
+                # the uniform variables are expanded and written one hour at a time
+                import dask
+                import dask.array
+                nc_dataset = nc_dataset.copy()
+                for variable in uniform:
+                    var = nc_dataset.variables[variable]
+                    # name=False skips hashing the values of the whole grid
+                    var.data = dask.array.from_array(var.data, chunks=(1, -1, -1, -1), name=False)
+                with netcdf_lock, dask.config.set(scheduler="synchronous"):
+                    nc_dataset.to_netcdf(path, **kwargs)
+            elif self.dask_scheduler is None:
+                with netcdf_lock:
+                    nc_dataset.to_netcdf(path, **kwargs)
+            else:
+                # compute the dask graphs of nc_dataset while writing it
+                with netcdf_lock, self._dask_config(Write=True):
+                    nc_dataset.to_netcdf(path, **kwargs)
+
+        return self._write_report(nc_dataset, path, OutputName)
+
+    def _write_report(self, nc_dataset:xr.Dataset, path:str, OutputName:str) -> dict:
+        # bytes of data and bytes written of a file written by to_netcdf
+        data_bytes = sum(var.nbytes for var in nc_dataset.variables.values())
+        bytes_written = os.path.getsize(path)
+        self.write_reports[OutputName] = {
+            "data_bytes": data_bytes,
+            "bytes_written": bytes_written,
+            "ratio": data_bytes/max(bytes_written, 1),
+        }
+        return self.write_reports[OutputName]
+
+    def print_write_report(self) -> None:
+        for OutputName, report in self.write_reports.items():
+            print(
+                f"{OutputName}: wrote {report['bytes_written']/2**20:.2f} MiB for "
+                f"{report['data_bytes']/2**20:.2f} MiB of data "
+                f"(compression ratio {report['ratio']:.1f})"
+            )
         pass
 
+    @profiled
+    def ingest_zarr(
+        self,
+        FileNames:list,
+        StoreName:str,
+        Chunks:dict=None,
+        Compression:int=5,
+        Overwrite:bool=False,
+    ) -> list:
+        """
+        Converts the input files FileNames (e.g. the daily conc files of a
+        month) into one chunked and compressed Zarr store, concatenated
+        along TSTEP, that the modify methods then read like a file with
+        FileName=StoreName. The netCDF (HDF5) or UAM-IV decoding is paid
+        once here, and the window slabs are read from the tiles of the
+        store afterwards.
+        ...
+        Parameters
+        ----------
+        FileNames : list
+            input files in directory, in the order of their hours
+        StoreName : str
+            name of the store in directory, e.g. "conc.201907.zarr"
+        Chunks, Compression
+            see append_zarr_store
+        Overwrite : bool
+            if True, the store is written again from the first file
+
+        Raises
+        ------
+        ValueError:
+            - if the files of the store are not the first ones of
+            FileNames and Overwrite is False
+
+        Returns
+        -------
+        list
+            the files appended, which are only the ones that were not in
+            the store yet (e.g. the new days of the month)
+
+        Caveat
+        -------
+        One variable of one file is in memory at a time. Every file must
+        have the grid and the variables of the first one. The species
+        selection is not applied, the store keeps every variable. It
+        needs zarr 2 (see requirements.txt).
+        """
+        path = f"{self.directory}/{StoreName}"
+        if Overwrite and os.path.isdir(path):
+            shutil.rmtree(path)
+        done = [source[0] for source in store_sources(path)]
+        # ----------------------------------------------------------------------
+        # Error checking
+        if (list(FileNames[:len(done)])!=done):
+            raise ValueError(f"{path} has the files {', '.join(done)}, which are not the first ones of FileNames")
+        # -----------------------------------------------------------------------
+
+        appended = []
+        for FileName in FileNames[len(done):]:
+            ds = self._open_dataset(FileName, Dask=False)
+            try:
+                with self._stage("ingest"), netcdf_lock:
+                    append_zarr_store(ds, path, FileName, Chunks, Compression)
+            finally:
+                self._close_dataset(ds)
+            appended.append(FileName)
+        return appended
+
+    @profiled
     def modify_met_kv(
         self,
         FileName:str,
@@ -195,13 +2003,20 @@ class netcdf_modifier:
         # -----------------------------------------------------------------------
         
         # read the file
-        ds = xr.open_dataset(f"{self.directory}/{FileName}")
+        ds = self._open_dataset(FileName)
         
-        # select the window you need for your simulation
-        new_ds = ds.isel(
-            COL=slice(ColumnStart, ColumnEnd),
-            ROW=slice(RowStart, RowEnd),
-            LAY=slice(LayerStart, LayerEnd),
+        # read the window you need for your simulation, except kv that is
+        # replaced below
+        new_ds, _ = self._read_window(
+            FileName,
+            ds,
+            {
+                "COL": slice(ColumnStart, ColumnEnd),
+                "ROW": slice(RowStart, RowEnd),
+                "LAY": slice(LayerStart, LayerEnd),
+            },
+            None,
+            ['kv'],
         )
                 
         # editing the attributes
@@ -209,10 +2024,18 @@ class netcdf_modifier:
         new_ds.attrs["NROWS"] = RowEnd-RowStart
         new_ds.attrs["NLAYS"] = LayerEnd-LayerStart
         
-        new_ds.variables['kv'].values[:] = 0.1
+        kv = new_ds.variables['kv']
+        with self._stage("fill"):
+            if kv.chunks is not None:
+                import dask.array
+                kv.data = dask.array.full(kv.shape, 0.1, dtype=kv.dtype, chunks=kv.chunks)
+            else:
+                kv.values = np.full(kv.shape, 0.1, dtype=kv.dtype)
+        self._close_dataset(ds)
 
         return new_ds
     
+    @profiled
     def modify_met_2d(
         self,
         FileName:str,
@@ -223,6 +2046,12 @@ class netcdf_modifier:
         RowIndexAvg:list,
         ColumnIndexAvg:list,
         pbl_windowavg:bool=False,
+        WindowIndex:bool=False,
+        SmoothVariables:list=None,
+        SmoothWindow:int=3,
+        SmoothHours:tuple=(1, 12),
+        Rules:dict=None,
+        KeepRuleMeans:bool=True,
     ):
         # ----------------------------------------------------------------------
         # Error checking
@@ -238,55 +2067,77 @@ class netcdf_modifier:
         # -----------------------------------------------------------------------
 
         # read the file
-        ds = xr.open_dataset(f"{self.directory}/{FileName}")
+        ds = self._open_dataset(FileName)
+        excluded_variable = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
 
-        # select the window you want to take a mean
-        selected_ds = ds.isel(
-            COL=slice(ColumnIndexAvg[0], ColumnIndexAvg[1]),
-            ROW=slice(RowIndexAvg[0], RowIndexAvg[1]),
-        )
-        # take the mean
-        mean_ds = selected_ds.mean(dim=["ROW", "COL"])
+        clip = {
+            "COL": slice(ColumnStart, ColumnEnd),
+            "ROW": slice(RowStart, RowEnd),
+        }
+        window = {
+            "COL": slice(ColumnIndexAvg[0], ColumnIndexAvg[1]),
+            "ROW": slice(RowIndexAvg[0], RowIndexAvg[1]),
+        }
 
-        # select the window you need for your simulation
-        new_ds = ds.isel(
-            COL=slice(ColumnStart, ColumnEnd),
-            ROW=slice(RowStart, RowEnd),
+        # pbl_windowavg smooths the pbl height over the hours 1 to 11, each
+        # hour being the mean of that hour and the two before
+        if pbl_windowavg and SmoothVariables is None:
+            SmoothVariables = ['pblwrf']
+        # the snow, cloud and precipitation variables are set to zero without
+        # being read, and the pbl heights are clipped to [30, 2500] m during
+        # the fill, except the smoothed ones, which are clipped once smoothed
+        fused_rules, rules, averaged, unread, skip_layers = self._plan_rules(
+            ds, MET2D_RULES if Rules is None else Rules, excluded_variable, SmoothVariables,
+            ds.sizes["LAY"], KeepRuleMeans,
         )
+        kind = "met2d/index" if WindowIndex else "met2d"
+        without = sorted(variable for variable in unread if variable not in excluded_variable)
+        if without:
+            kind += "/without:" + ",".join(without)
+
+        cache_key, means = self._cached_means(FileName, kind, window)
+        if means is not None:
+            # the means of this window were kept by an earlier run
+            new_ds, _ = self._read_window(FileName, ds, clip, None, averaged, unread, skip_layers)
+            mean_ds = means["mean"]
+        elif WindowIndex:
+            # read the window you need for your simulation, except the values
+            # that are replaced below, and take the mean from the index
+            new_ds, _ = self._read_window(FileName, ds, clip, None, averaged, unread, skip_layers)
+            index = self.window_index(FileName, averaged, ds)
+            with self._stage("reduce"):
+                mean_ds = index.mean_dataset(averaged, window, ["ROW", "COL"])
+        else:
+            # read the window you want to take a mean and the window you need for
+            # your simulation, except the values that are replaced below
+            new_ds, selected_ds = self._read_window(FileName, ds, clip, window, averaged, unread, skip_layers)
+            # take the mean
+            mean_ds, = self._means(selected_ds, [["ROW", "COL"]])
+        if cache_key is not None and means is None:
+            self.mean_cache.put(cache_key, {"mean": mean_ds})
 
         # replace the values with the average value for each variable at the surface
-        excluded_variable = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
-        for i, variable in enumerate(new_ds.variables):
-            if variable not in excluded_variable:
-                for z in range(new_ds.dims["LAY"]):
-                    for t in range(new_ds[variable].shape[0]):
-                        new_ds[variable][t,z,:,:] = mean_ds[variable][t]
-
-        for var in ['snowewd', 'snowage', 'tcloudod', 'preciprate', 'cloudtop']:
-            new_ds[var][:] = 0.0
-
-        if pbl_windowavg:
-            pbl = new_ds.variables['pblwrf'].values
-            new_pbl = deepcopy(pbl)
-            for i in range(2,13):
-                if i==2:
-                    new_pbl[i-1] = np.nanmean(pbl[i-2:i], axis=0)
-                else:
-                    new_pbl[i-1] = np.nanmean(pbl[i-3:i], axis=0)
-            new_ds.variables['pblwrf'].values = new_pbl
+        with self._stage("fill"):
+            fill_with_mean(new_ds, mean_ds, excluded_variable, self.profiler, fused_rules, Compact=self.compact)
+        self._close_dataset(ds)
+
+        if SmoothVariables:
+            with self._stage("smoothing"):
+                smooth_in_time(new_ds, SmoothVariables, SmoothWindow, *SmoothHours, Profiler=self.profiler)
 
-        for var in ['pblwrf', 'pblcmaq', 'pblysu']:
-            new_ds.variables[var].values[new_ds.variables[var].values<30] = 30
-            new_ds.variables[var].values[new_ds.variables[var].values>2500] = 2500
+        if rules:
+            with self._stage("reset"):
+                apply_rules(new_ds, rules)
 
         # to create excel file
-        excel_mean = {}
-        df = pd.DataFrame()
-        df['hour\layer'] = [i for i in range(25)]
-        for i, variable in enumerate(mean_ds.variables):
-            if variable not in excluded_variable:
-                df[variable] = mean_ds[variable][:,0]
-        excel_mean['all'] = df
+        with self._stage("excel_table"):
+            excel_mean = {}
+            columns = {'hour\\layer': [i for i in range(mean_ds.sizes["TSTEP"])]}
+            columns.update({
+                variable: mean_ds[variable].values[:,0]
+                for variable in mean_ds.variables if variable not in excluded_variable
+            })
+            excel_mean['all'] = pd.DataFrame(columns)
 
         # editing the attributes
         new_ds.attrs["NCOLS"] = ColumnEnd-ColumnStart
@@ -294,6 +2145,7 @@ class netcdf_modifier:
         
         return new_ds, excel_mean
 
+    @profiled
     def modify_met_3d(
         self,
         Dataset2D,
@@ -307,6 +2159,12 @@ class netcdf_modifier:
         RowIndexAvg:list,
         ColumnIndexAvg:list,
         LayerIndexAvg:list,
+        WindowIndex:bool=False,
+        SmoothVariables:list=None,
+        SmoothWindow:int=3,
+        SmoothHours:tuple=(1, 12),
+        Rules:dict=None,
+        KeepRuleMeans:bool=True,
     ):
         # ----------------------------------------------------------------------
         # Error checking
@@ -326,56 +2184,82 @@ class netcdf_modifier:
         # -----------------------------------------------------------------------
 
         # read the file
-        ds = xr.open_dataset(f"{self.directory}/{FileName}")
+        ds = self._open_dataset(FileName)
+        excluded_variable = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
 
-        # select the window you want to take a mean
-        selected_ds = ds.isel(
-            COL=slice(ColumnIndexAvg[0], ColumnIndexAvg[1]),
-            ROW=slice(RowIndexAvg[0], RowIndexAvg[1]),
-            LAY=slice(LayerIndexAvg[0], LayerIndexAvg[1]),
-        )
-        # take the mean
-        mean_ds = selected_ds.mean(dim=["ROW", "COL"])
-
-        # select the window you need for your simulation
-        new_ds = ds.isel(
-            COL=slice(ColumnStart, ColumnEnd),
-            ROW=slice(RowStart, RowEnd),
-            LAY=slice(LayerStart, LayerEnd),
+        clip = {
+            "COL": slice(ColumnStart, ColumnEnd),
+            "ROW": slice(RowStart, RowEnd),
+            "LAY": slice(LayerStart, LayerEnd),
+        }
+        window = {
+            "COL": slice(ColumnIndexAvg[0], ColumnIndexAvg[1]),
+            "ROW": slice(RowIndexAvg[0], RowIndexAvg[1]),
+            "LAY": slice(LayerIndexAvg[0], LayerIndexAvg[1]),
+        }
+
+        # the cloud variables and u wind are set to zero, and the first two
+        # layers of z, without being read (see MET3D_RULES)
+        fused_rules, rules, averaged, unread, skip_layers = self._plan_rules(
+            ds, MET3D_RULES if Rules is None else Rules, excluded_variable, SmoothVariables,
+            len(range(ds.sizes["LAY"])[clip["LAY"]]), KeepRuleMeans,
         )
+        kind = "met3d/index" if WindowIndex else "met3d"
+        without = sorted(variable for variable in unread if variable not in excluded_variable)
+        if without:
+            kind += "/without:" + ",".join(without)
+
+        cache_key, means = self._cached_means(FileName, kind, window)
+        if means is not None:
+            # the means of this window were kept by an earlier run
+            new_ds, _ = self._read_window(FileName, ds, clip, None, averaged, unread, skip_layers)
+            mean_ds = means["mean"]
+        elif WindowIndex:
+            # read the window you need for your simulation, except the values
+            # that are replaced below, and take the mean from the index
+            new_ds, _ = self._read_window(FileName, ds, clip, None, averaged, unread, skip_layers)
+            index = self.window_index(FileName, averaged, ds)
+            with self._stage("reduce"):
+                mean_ds = index.mean_dataset(averaged, window, ["ROW", "COL"])
+            with netcdf_lock:
+                mean_ds["layer"] = ds["layer"].isel(LAY=window["LAY"]).load()
+        else:
+            # read the window you want to take a mean and the window you need for
+            # your simulation, except the values that are replaced below
+            new_ds, selected_ds = self._read_window(FileName, ds, clip, window, averaged, unread, skip_layers)
+            # take the mean
+            mean_ds, = self._means(selected_ds, [["ROW", "COL"]])
+        if cache_key is not None and means is None:
+            self.mean_cache.put(cache_key, {"mean": mean_ds})
 
         # replace the values with the average value for each variable at the surface
-        excluded_variable = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
-        for i, variable in enumerate(new_ds.variables):
-            if variable not in excluded_variable:
-                for z in range(new_ds.dims["LAY"]):
-                    for t in range(new_ds[variable].shape[0]):
-                        new_ds[variable][t,z,:,:] = mean_ds[variable][t,z]
-
-        for var in ['cloudwater', 'rainwater', 'grplwater', 'cloudod']:
-            new_ds[var][:] = 0.0
-
-        # set the height of second layer to 3000 m
-        new_ds.variables['z'].values[:,1,:,:] = 3000.
-        # set the height of first layer to pbl height from 2D netcdf file
-        new_ds.variables['z'].values[:,0,:,:] = Dataset2D.variables['pblwrf'].values[:,0,:,:]
-        # set u wind speed to zero 
-        new_ds.variables['uwind'].values[:] = 0
-        # set v wind speed to zero 
-        new_ds.variables['vwind'].values[:,1] = 0.0926 # m/s (purging layer 2 with 12 hr lifetime)
-        new_ds.variables['vwind'].values[:,0] = 0.0 # m/s (layer 1 should be zero)
+        with self._stage("fill"):
+            fill_with_mean(
+                new_ds, mean_ds, excluded_variable, self.profiler, fused_rules, Dataset2D, Compact=self.compact,
+            )
+        self._close_dataset(ds)
+
+        # the rules of the smoothed variables are applied to the smoothed values
+        if SmoothVariables:
+            with self._stage("smoothing"):
+                smooth_in_time(new_ds, SmoothVariables, SmoothWindow, *SmoothHours, Profiler=self.profiler)
+
+        if rules:
+            with self._stage("reset"):
+                apply_rules(new_ds, rules, Dataset2D)
 
         # to create excel file
-        excel_mean = {}
-        for i, variable in enumerate(mean_ds.variables):
-            if variable not in excluded_variable:
-                df = pd.DataFrame()
-                df['hour\layer'] = [i for i in range(25)]
-                for z in mean_ds["layer"].values:
-                    z = int(z)
-                    df[z] = mean_ds[variable].values[:,z-1]
-                df["averaged"] = np.nanmean(mean_ds[variable][:].values, axis=1).tolist()
-                excel_mean[variable] = df
+        with self._stage("excel_table"):
+            excel_mean = {}
+            layers = [int(z) for z in mean_ds["layer"].values]
+            for variable in mean_ds.variables:
+                if variable not in excluded_variable:
+                    # build each sheet at once instead of column by column
+                    values = mean_ds[variable].values
+                    columns = {'hour\\layer': [i for i in range(values.shape[0])]}
+                    columns.update({z: values[:,z-1] for z in layers})
+                    columns["averaged"] = np.nanmean(values, axis=1).tolist()
+                    excel_mean[variable] = pd.DataFrame(columns)
 
         # editing the attributes
         new_ds.attrs["NCOLS"] = ColumnEnd-ColumnStart
@@ -0,0 +1,161 @@
+from contextlib import contextmanager
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+def rss_bytes() -> int:
+    """
+    Returns the resident memory of this process in bytes, or its peak so
+    far where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KiB elsewhere
+        return peak if sys.platform=="darwin" else peak*1024
+
+class StageProfiler:
+    """
+    Collects the wall time and the peak resident memory of the stages (open,
+    read, reduce, fill, write, ...) of each netcdf_modifier method, and the
+    time and number of cells of the fill of each variable.
+    ...
+    Parameters
+    ----------
+    interval : float
+        seconds between two samples of the resident memory
+
+    Example
+    -------
+    profiler = StageProfiler()
+    nc_modify = netcdf_modifier("../inputs", profiler=profiler)
+    ...
+    profiler.close()
+    profiler.write_json("profile.json")
+
+    Caveat
+    -------
+    The memory is sampled for the whole process, so when methods run at the
+    same time on threads, the peak of a stage includes the memory of the
+    others.
+    """
+    def __init__(self, interval:float=0.01) -> None:
+        self.interval = interval
+        self.stages = {}
+        self.variables = {}
+        self.peak_rss = rss_bytes()
+        self._active = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        pass
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._update(rss_bytes())
+        pass
+
+    def _update(self, rss:int) -> None:
+        with self._lock:
+            self.peak_rss = max(self.peak_rss, rss)
+            for record in self._active:
+                record["peak"] = max(record["peak"], rss)
+        pass
+
+    def close(self) -> None:
+        self._stop.set()
+        self._sampler.join()
+        pass
+
+    def current_method(self) -> str:
+        methods = getattr(self._local, "methods", [])
+        return methods[-1] if methods else "other"
+
+    @contextmanager
+    def method(self, Method:str):
+        """
+        Runs the body as the method Method: the stages and variables of
+        this thread are recorded under it, and the whole body is the stage
+        "total".
+        """
+        methods = self._local.__dict__.setdefault("methods", [])
+        methods.append(Method)
+        try:
+            with self.stage("total"):
+                yield
+        finally:
+            methods.pop()
+
+    @contextmanager
+    def stage(self, Stage:str):
+        """
+        Times the body as the stage Stage of the current method.
+        """
+        rss = rss_bytes()
+        record = {"peak": rss}
+        with self._lock:
+            self._active.append(record)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            end = rss_bytes()
+            self._update(end)
+            with self._lock:
+                self._active = [active for active in self._active if active is not record]
+                stats = self.stages.setdefault(self.current_method(), {}).setdefault(
+                    Stage, {"calls": 0, "seconds": 0., "peak_rss_mib": 0., "rss_growth_mib": 0.},
+                )
+                stats["calls"] += 1
+                stats["seconds"] += seconds
+                stats["peak_rss_mib"] = max(stats["peak_rss_mib"], record["peak"]/2**20)
+                stats["rss_growth_mib"] += (end-rss)/2**20
+
+    def count(self, Variable:str, Cells:int, Seconds:float) -> None:
+        """
+        Adds one fill of Cells values of Variable that took Seconds to the
+        current method.
+        """
+        with self._lock:
+            stats = self.variables.setdefault(self.current_method(), {}).setdefault(
+                Variable, {"calls": 0, "cells": 0, "seconds": 0.},
+            )
+            stats["calls"] += 1
+            stats["cells"] += Cells
+            stats["seconds"] += Seconds
+        pass
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "peak_rss_mib": self.peak_rss/2**20,
+                "stages": json.loads(json.dumps(self.stages)),
+                "variables": json.loads(json.dumps(self.variables)),
+            }
+
+    def write_json(self, path:str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        pass
+
+def profiled(method):
+    """
+    Decorator of the netcdf_modifier methods: when the instance has a
+    profiler, the call is recorded as that method (see StageProfiler.method).
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.profiler is None:
+            return method(self, *args, **kwargs)
+        with self.profiler.method(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
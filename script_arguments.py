@@ -0,0 +1,115 @@
+# the argparse helpers shared by the scripts, which only import the standard
+# library and species_selection, so the scripts check their arguments
+# before numpy and xarray are imported
+from species_selection import expand_patterns
+from datetime import datetime, timedelta
+import argparse
+import glob
+import os
+import re
+
+def index_list(value:str) -> list:
+    # argparse type of the comma separated indices, e.g. "20,50" -> [20, 50]
+    try:
+        return [int(i) for i in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a list of integers separated by commas")
+
+def pattern_list(value:str) -> list:
+    # argparse type of the comma separated species patterns, e.g. "O3,NO*,@ozone"
+    patterns = [pattern.strip() for pattern in value.split(',') if pattern.strip()]
+    try:
+        expand_patterns(patterns)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return patterns
+
+def add_window_arguments(parser:argparse.ArgumentParser, required:bool=True) -> None:
+    parser.add_argument(
+        "-rs", "--rowstart",
+        type=int, required=required,
+        help='starting index for the row where you want to clip the netCDF file'
+    )
+    parser.add_argument(
+        "-re", "--rowend",
+        type=int, required=required,
+        help='ending index for the row where you want to clip the netCDF file'
+    )
+    parser.add_argument(
+        "-cs", "--colstart",
+        type=int, required=required,
+        help='starting index for the column where you want to clip the netCDF file'
+    )
+    parser.add_argument(
+        "-ce", "--colend",
+        type=int, required=required,
+        help='ending index for the column where you want to clip the netCDF file'
+    )
+    parser.add_argument(
+        "-ls", "--laystart",
+        type=int, required=required,
+        help='starting index for the layer where you want to clip the netCDF file'
+    )
+    parser.add_argument(
+        "-le", "--layend",
+        type=int, required=required,
+        help='ending index for the layer where you want to clip the netCDF file'
+    )
+    parser.add_argument(
+        "-ra", "--rowindexavg",
+        type=index_list, required=required,
+        help='range of row indecies in a form of comma separated string containing two '+
+        'integers where you want to take an average of concentration values'
+    )
+    parser.add_argument(
+        "-ca", "--columnindexavg",
+        type=index_list, required=required,
+        help='range of column indecies in a form of comma separated string '+ 
+        'containing two integers where you want to take an average of concentration values'
+    )
+    parser.add_argument(
+        "-la", "--layerindexavg",
+        type=index_list, required=required,
+        help='range of layer indecies in a form of comma separated string containing '+ 
+        'two integers where you want to take an average of concentration values'
+    )
+    pass
+
+def date_range(StartDate:str, EndDate:str) -> list:
+    """
+    Returns every day from StartDate to EndDate (both included) as YYYYMMDD
+    strings.
+    """
+    start = datetime.strptime(StartDate, "%Y%m%d")
+    end = datetime.strptime(EndDate, "%Y%m%d")
+    if (end<start):
+        raise ValueError("StartDate is after EndDate")
+    return [
+        (start + timedelta(days=i)).strftime("%Y%m%d")
+        for i in range((end-start).days + 1)
+    ]
+
+def glob_dates(Directory:str, Template:str) -> list:
+    """
+    Returns the sorted days for which a file matching Template exists in
+    Directory, where Template is a filename with a {date} placeholder for
+    the YYYYMMDD day.
+    """
+    parts = [re.escape(part) for part in Template.split("{date}")]
+    pattern = re.compile(parts[0] + r"(?P<date>\d{8})" + r"(?P=date)".join(parts[1:]) + "$")
+    dates = set()
+    for path in glob.glob(os.path.join(Directory, Template.replace("{date}", "*"))):
+        match = pattern.match(os.path.basename(path))
+        if match:
+            dates.add(match.group("date"))
+    return sorted(dates)
+
+def shard_spec(value:str) -> tuple:
+    # argparse type of --shard, e.g. "3/8" -> (3, 8)
+    try:
+        index, count = (int(i) for i in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a shard of the form i/N")
+    if count<1 or not 0<=index<count:
+        raise argparse.ArgumentTypeError(f"'{value}' must have N>=1 and 0<=i<N")
+    return index, count
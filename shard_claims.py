@@ -0,0 +1,261 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+def shard_items(Items:list, Index:int, Count:int) -> list:
+    """
+    Returns the share of shard Index (0 to Count-1) of Items: every
+    Count-th item starting at Index, so consecutive days are spread over
+    the shards and every job computes the same split without talking to
+    the others.
+    """
+    # ----------------------------------------------------------------------
+    # Error checking
+    if (Count<1):
+        raise ValueError("Count must be at least one.")
+    if (Index<0 or Index>=Count):
+        raise ValueError(f"Index must be between 0 and {Count-1}.")
+    # -----------------------------------------------------------------------
+    return list(Items[Index::Count])
+
+def _file_identity(path:str) -> list:
+    # size and modification time of a file, or None if it does not exist
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+class ClaimDirectory:
+    """
+    Lock files and completion manifests of the work items of a batch, kept
+    in a directory shared by every job (e.g. on the file system of a
+    cluster), so that any number of independent jobs split the items
+    between them, skip the ones that are done, and take over the ones of
+    the jobs that died, without a central service.
+    ...
+    Parameters
+    ----------
+    directory : str
+        directory of the lock files (<name>.lock) and the manifests
+        (<name>.json) of the items
+    stale_seconds : float
+        a lock whose file was not touched for that long is taken over.
+        The job that holds a lock touches it every heartbeat_seconds.
+    heartbeat_seconds : float
+        time between two touches of a held lock
+
+    Example
+    -------
+    claims = ClaimDirectory("../output/claims")
+    if not claims.is_done(name):
+        token = claims.claim(name)
+        if token is not None:
+            try:
+                with claims.heartbeat(name, token):
+                    ...
+                claims.complete(name, token, outputs, inputs)
+            finally:
+                claims.release(name, token)
+
+    Caveat
+    -------
+    A lock is created with os.link of a file that is already written, which
+    is atomic on local file systems and on NFS. A lock is also taken over
+    when the process that holds it is on this host and no longer runs. The
+    staleness of a lock is judged from its modification time, so the
+    clocks of the hosts must agree to well within stale_seconds.
+    """
+    def __init__(self, directory:str, stale_seconds:float=600, heartbeat_seconds:float=60) -> None:
+        if (heartbeat_seconds>=stale_seconds):
+            raise ValueError("heartbeat_seconds must be shorter than stale_seconds.")
+        self.directory = directory
+        self.stale_seconds = stale_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.host = socket.gethostname()
+        os.makedirs(directory, exist_ok=True)
+        pass
+
+    def lock_path(self, name:str) -> str:
+        return os.path.join(self.directory, name+".lock")
+
+    def manifest_path(self, name:str) -> str:
+        return os.path.join(self.directory, name+".json")
+
+    def _read(self, path:str) -> dict:
+        # contents of a lock or a manifest, or None if it is gone or torn
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, path:str, contents:dict) -> str:
+        # writes contents to a temporary file next to path and returns it
+        temporary = f"{path}.{self.host}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(contents, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        return temporary
+
+    def is_done(self, name:str) -> bool:
+        """
+        Returns True if item name has a manifest whose output files still
+        exist with the size they were written with, and whose input files
+        did not change since.
+        """
+        manifest = self._read(self.manifest_path(name))
+        if manifest is None:
+            return False
+        for path, identity in manifest["outputs"].items():
+            current = _file_identity(path)
+            if current is None or current[0]!=identity[0]:
+                return False
+        for path, identity in manifest["inputs"].items():
+            if _file_identity(path)!=identity:
+                return False
+        return True
+
+    def _is_stale(self, lock:dict, mtime:float) -> bool:
+        if time.time()-mtime>self.stale_seconds:
+            return True
+        if lock is not None and lock["host"]==self.host:
+            try:
+                os.kill(lock["pid"], 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass
+        return False
+
+    def _break(self, name:str, token:str) -> None:
+        # moves a stale lock aside, and puts it back if it was replaced by
+        # a fresh one between the check and the move
+        path = self.lock_path(name)
+        broken = f"{path}.{self.host}.{os.getpid()}.{uuid.uuid4().hex}.broken"
+        try:
+            os.rename(path, broken)
+        except FileNotFoundError:
+            return
+        lock = self._read(broken)
+        if lock is not None and lock["token"]!=token:
+            try:
+                os.link(broken, path)
+            except FileExistsError:
+                pass
+        os.remove(broken)
+        pass
+
+    def claim(self, name:str) -> str:
+        """
+        Takes the lock of item name and returns its token, or returns None
+        if another job holds a lock that is not stale. The lock is not
+        taken if the item is done.
+        """
+        path = self.lock_path(name)
+        token = uuid.uuid4().hex
+        temporary = self._write(path, {
+            "token": token, "host": self.host, "pid": os.getpid(), "claimed": time.time(),
+        })
+        try:
+            for attempt in range(2):
+                try:
+                    os.link(temporary, path)
+                except FileExistsError:
+                    lock = self._read(path)
+                    try:
+                        mtime = os.stat(path).st_mtime
+                    except FileNotFoundError:
+                        continue
+                    if attempt>0 or not self._is_stale(lock, mtime):
+                        return None
+                    self._break(name, lock["token"] if lock is not None else None)
+                    continue
+                # a job may have completed the item between is_done and the link
+                if self.is_done(name):
+                    os.remove(path)
+                    return None
+                return token
+            return None
+        finally:
+            os.remove(temporary)
+
+    def release(self, name:str, token:str) -> None:
+        """
+        Removes the lock of item name if it is still the one of token.
+        """
+        lock = self._read(self.lock_path(name))
+        if lock is not None and lock["token"]==token:
+            try:
+                os.remove(self.lock_path(name))
+            except FileNotFoundError:
+                pass
+        pass
+
+    def heartbeat(self, name:str, token:str) -> "_Heartbeat":
+        """
+        Returns a context manager that touches the lock of item name every
+        heartbeat_seconds on a background thread while it is entered.
+        """
+        return _Heartbeat(self, name, token)
+
+    def complete(self, name:str, token:str, Outputs:list, Inputs:list, Info:dict=None) -> None:
+        """
+        Writes the manifest of item name, which records the size of each
+        of its Outputs and the size and modification time of each of its
+        Inputs (see is_done), and then releases its lock.
+        ...
+        Raises
+        ------
+        FileNotFoundError
+            if one of Outputs was not written
+        """
+        missing = [path for path in Outputs if not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError("the outputs were not written: "+", ".join(missing))
+        manifest = {
+            "name": name,
+            "host": self.host,
+            "pid": os.getpid(),
+            "completed": time.time(),
+            "outputs": {path: _file_identity(path) for path in Outputs},
+            "inputs": {path: _file_identity(path) for path in Inputs},
+            **(Info or {}),
+        }
+        # the manifest appears whole or not at all
+        os.replace(self._write(self.manifest_path(name), manifest), self.manifest_path(name))
+        self.release(name, token)
+        pass
+
+class _Heartbeat:
+    # see ClaimDirectory.heartbeat
+    def __init__(self, claims:ClaimDirectory, name:str, token:str) -> None:
+        self.claims = claims
+        self.name = name
+        self.token = token
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, daemon=True)
+        pass
+
+    def _beat(self) -> None:
+        path = self.claims.lock_path(self.name)
+        while not self._stop.wait(self.claims.heartbeat_seconds):
+            lock = self.claims._read(path)
+            if lock is None or lock["token"]!=self.token:
+                # the lock was taken over, it is not ours to keep alive
+                return
+            os.utime(path)
+        pass
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        pass
@@ -0,0 +1,78 @@
+from fnmatch import fnmatchcase
+
+# variables of the conc files that are not species, they are never dropped
+NOT_SPECIES = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
+
+# groups of CB6r5 species that the patterns name as "@group"
+SPECIES_GROUPS = {
+    "nox": ["NO", "NO2"],
+    "noy": [
+        "NO", "NO2", "NO3", "N2O5", "HNO3", "HONO", "PNA", "PAN", "PANX", "OPAN",
+        "NTR1", "NTR2", "INTR", "CRON",
+    ],
+    "ozone": ["O3", "NO", "NO2", "NO3", "N2O5", "HNO3", "HONO", "PNA", "H2O2", "CO", "FORM", "PAN"],
+    "voc": [
+        "PAR", "ETHA", "ETH", "ETHY", "OLE", "IOLE", "TOL", "XYL", "BENZ", "ISOP", "ISPD",
+        "TERP", "FORM", "ALD2", "ALDX", "MEOH", "ETOH", "ACET", "KET", "PRPA", "CRES",
+        "GLY", "GLYD", "MGLY",
+    ],
+    "sulfur": ["SO2", "SULF", "PSO4"],
+    "pm": [
+        "PSO4", "PNO3", "PNH4", "POA", "PEC", "FPRM", "CPRM", "FCRS", "CCRS", "NA", "PCL",
+        "PH2O", "SOA1", "SOA2", "SOA3", "SOA4", "SOPA", "SOPB",
+    ],
+}
+
+def expand_patterns(Patterns:list) -> list:
+    """
+    Returns Patterns with each "@group" replaced by the species of that
+    group of SPECIES_GROUPS.
+    ...
+    Raises
+    ------
+    ValueError
+        if a group is not in SPECIES_GROUPS
+    """
+    expanded = []
+    for pattern in Patterns:
+        if pattern.startswith("@"):
+            if pattern[1:] not in SPECIES_GROUPS:
+                raise ValueError(
+                    f"unknown species group {pattern}, the groups are "+", ".join("@"+g for g in SPECIES_GROUPS)
+                )
+            expanded.extend(SPECIES_GROUPS[pattern[1:]])
+        else:
+            expanded.append(pattern)
+    return expanded
+
+def select_species(Variables:list, Include:list=None, Exclude:list=None) -> list:
+    """
+    Returns the species of Variables (the ones not in NOT_SPECIES) that
+    match a pattern of Include, or every species without Include, and no
+    pattern of Exclude.
+    ...
+    Parameters
+    ----------
+    Variables : list
+        names of the variables of a conc file
+    Include, Exclude : list
+        species names, fnmatch patterns (e.g. "SOA*") or groups of
+        SPECIES_GROUPS (e.g. "@ozone"), matched case sensitively
+
+    Raises
+    ------
+    ValueError
+        if a group is not in SPECIES_GROUPS
+
+    Example
+    -------
+    select_species(ds.variables, ["@ozone", "SOA*"], ["PAN"])
+    """
+    include = expand_patterns(Include) if Include is not None else ["*"]
+    exclude = expand_patterns(Exclude or [])
+    return [
+        variable for variable in Variables
+        if variable not in NOT_SPECIES
+        and any(fnmatchcase(variable, pattern) for pattern in include)
+        and not any(fnmatchcase(variable, pattern) for pattern in exclude)
+    ]
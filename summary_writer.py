@@ -0,0 +1,207 @@
+from xml.sax.saxutils import escape
+import math
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+SUMMARY_FORMATS = ["parquet", "csv", "xlsx"]
+# the formats that append_summary can extend
+APPEND_FORMATS = ["parquet", "csv"]
+
+def summary_table(Dictionary:dict) -> pd.DataFrame:
+    """
+    Turns the excel dictionary of a netcdf_modifier method (one sheet per
+    species, or a single "all" sheet with one column per species for met
+    2D) into one long table with the columns species, hour, layer and
+    value.
+    ...
+    Parameters
+    ----------
+    Dictionary : dict
+        excel dictionary returned by modify_conc, modify_met_2d or
+        modify_met_3d
+
+    Returns
+    -------
+    pd.DataFrame
+        that has one row per species, hour and layer. layer is empty
+        (<NA>) for the values averaged over the layers and for the 2D
+        variables.
+    """
+    species, hours, layers, values = [], [], [], []
+    for sheet, df in Dictionary.items():
+        hour = df['hour\\layer'].to_numpy()
+        columns = [column for column in df.columns if column!='hour\\layer']
+        # one block of len(hour) rows per column, in the order of the columns
+        values.append(df[columns].to_numpy(dtype=np.float64).ravel(order="F"))
+        hours.append(np.tile(hour, len(columns)))
+        for column in columns:
+            if isinstance(column, (int, np.integer)):
+                species.append(np.full(len(hour), sheet, dtype=object))
+                layers.append(np.full(len(hour), column, dtype=object))
+            elif column=="averaged":
+                species.append(np.full(len(hour), sheet, dtype=object))
+                layers.append(np.full(len(hour), None, dtype=object))
+            else:
+                species.append(np.full(len(hour), column, dtype=object))
+                layers.append(np.full(len(hour), None, dtype=object))
+    if not values:
+        return pd.DataFrame({
+            "species": pd.Series([], dtype=object),
+            "hour": pd.Series([], dtype=np.int64),
+            "layer": pd.array([], dtype="Int64"),
+            "value": pd.Series([], dtype=np.float64),
+        })
+    return pd.DataFrame({
+        "species": np.concatenate(species),
+        "hour": np.concatenate(hours).astype(np.int64),
+        "layer": pd.array(np.concatenate(layers), dtype="Int64"),
+        "value": np.concatenate(values),
+    })
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="summary" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+def _write_xlsx(Table:pd.DataFrame, Path:str) -> None:
+    # a minimal single-sheet workbook written straight as XML, with inline
+    # strings, which is much faster than building one cell object per value
+    # like openpyxl and pd.ExcelWriter do
+    def string_cell(value):
+        return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+    def number_cell(value):
+        # NaN, <NA> and the infinities are written as empty cells, Excel has
+        # no cell value for them and reports "inf" or "nan" as corrupt
+        if value is None or not math.isfinite(value):
+            return "<c/>"
+        return f"<c><v>{value!r}</v></c>"
+
+    species = {value: string_cell(value) for value in Table["species"].unique()}
+    rows = ["<row>" + "".join(string_cell(column) for column in Table.columns) + "</row>"]
+    rows.extend(
+        f"<row>{species[name]}{number_cell(hour)}{number_cell(layer)}{number_cell(value)}</row>"
+        for name, hour, layer, value in zip(
+            Table["species"].tolist(),
+            Table["hour"].tolist(),
+            Table["layer"].astype(object).where(Table["layer"].notna(), None).tolist(),
+            Table["value"].tolist(),
+        )
+    )
+    with zipfile.ZipFile(Path, "w", compression=zipfile.ZIP_DEFLATED) as xlsx:
+        for name, part in _XLSX_PARTS.items():
+            xlsx.writestr(name, part)
+        with xlsx.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            ).encode())
+            for start in range(0, len(rows), 10000):
+                sheet.write("".join(rows[start:start+10000]).encode())
+            sheet.write(b"</sheetData></worksheet>")
+    pass
+
+def write_summary(Table:pd.DataFrame, Path:str, Format:str) -> None:
+    """
+    Writes the long table of summary_table to Path as a "parquet", "csv"
+    or "xlsx" (single sheet) file.
+
+    Raises
+    ------
+    ValueError:
+        - if Format is not one of SUMMARY_FORMATS
+
+    Caveat
+    -------
+    parquet needs pyarrow (or fastparquet), pyarrow is pinned in
+    requirements.txt. xlsx is written as XML by _write_xlsx, about 9 times
+    faster than openpyxl in write-only mode, which also rounds the
+    values to 16 digits.
+    """
+    if Format not in SUMMARY_FORMATS:
+        raise ValueError(f"Format must be one of {', '.join(SUMMARY_FORMATS)}")
+    if Format=="parquet":
+        Table.to_parquet(Path, index=False)
+    elif Format=="csv":
+        Table.to_csv(Path, index=False)
+    else:
+        _write_xlsx(Table, Path)
+    pass
+
+def append_summary(Table:pd.DataFrame, Path:str, Format:str, FirstHour:int, Offset:int=0) -> int:
+    """
+    Appends the rows of the long table of summary_table, which are the
+    hours from FirstHour on, to the "csv" or "parquet" summary at Path, and
+    returns the new size of a csv file.
+    ...
+    Parameters
+    ----------
+    Table : pd.DataFrame
+        long table of the new hours
+    Path : str
+        csv file, or directory of parquet files with one file per append
+        named after its first hour
+    Format : str
+        "csv" or "parquet"
+    FirstHour : int
+        first hour of Table
+    Offset : int
+        size of the csv file after the last append that was recorded, the
+        rows after it are left over from an interrupted append and removed
+
+    Raises
+    ------
+    ValueError:
+        - if Format is not one of APPEND_FORMATS
+
+    Caveat
+    -------
+    An interrupted append is done again by the next one: the csv file is
+    cut back to Offset and the parquet file of FirstHour is overwritten,
+    so no row is written twice.
+    """
+    if Format not in APPEND_FORMATS:
+        raise ValueError(f"Format must be one of {', '.join(APPEND_FORMATS)}")
+    if Format=="parquet":
+        os.makedirs(Path, exist_ok=True)
+        Table.to_parquet(os.path.join(Path, f"part-{FirstHour:06d}.parquet"), index=False)
+        return 0
+    with open(Path, "a+b") as f:
+        f.truncate(Offset)
+    Table.to_csv(Path, mode="a", header=Offset==0, index=False)
+    return os.path.getsize(Path)
@@ -0,0 +1,133 @@
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+import time
+
+class TaskResult:
+    """
+    Placeholder for the result of another task in the arguments of a task.
+    It also makes the task depend on that one.
+    ...
+    Parameters
+    ----------
+    name : str
+        name of the task whose result is used
+    index : int
+        if given, only this item of a tuple result is used
+    """
+    def __init__(self, name:str, index:int=None) -> None:
+        self.name = name
+        self.index = index
+        pass
+
+    def resolve(self, results:dict):
+        result = results[self.name]
+        if self.index is not None:
+            result = result[self.index]
+        return result
+
+class InlineExecutor(Executor):
+    """
+    Executor that runs each task in the calling thread as soon as it is
+    submitted, so a TaskGraph runs its tasks one after the other in the
+    main thread (e.g. to profile them with cProfile).
+    """
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+def _run_timed(func, args, kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+class TaskGraph:
+    """
+    A small task graph where each task is a function call whose arguments
+    may be the results of other tasks (see TaskResult). A task is submitted
+    to the executor as soon as every task it depends on is finished, so
+    independent tasks run at the same time.
+    ...
+    Example
+    -------
+    graph = TaskGraph()
+    graph.add("met2d", nc_modify.modify_met_2d, "met2d.nc", 0, 10, 0, 20, [20,40], [30,60])
+    graph.add("met3d", nc_modify.modify_met_3d, TaskResult("met2d", 0), "met3d.nc", ...)
+    with ThreadPoolExecutor() as executor:
+        results = graph.run(executor)
+
+    Caveat
+    -------
+    With a ProcessPoolExecutor the functions, their arguments and their
+    results must be picklable, and results are copied between processes.
+    """
+    def __init__(self) -> None:
+        self.tasks = {}
+        self.timings = {}
+        pass
+
+    def add(
+        self,
+        name:str,
+        func,
+        *args,
+        after:list=(),
+        **kwargs,
+    ) -> None:
+        """
+        Adds the task name that calls func(*args, **kwargs). It depends on
+        the tasks of the TaskResult arguments and on the tasks in after.
+        """
+        if name in self.tasks:
+            raise ValueError(f"task {name} already exists")
+        depends = set(after)
+        for value in list(args) + list(kwargs.values()):
+            if isinstance(value, TaskResult):
+                depends.add(value.name)
+        for depend in depends:
+            if depend not in self.tasks:
+                raise ValueError(f"task {name} depends on the unknown task {depend}")
+        self.tasks[name] = (func, args, kwargs, depends)
+        pass
+
+    def run(self, executor:Executor) -> dict:
+        """
+        Runs every task on executor and returns the result of each task by
+        name. The run time of each task is kept in timings. If a task
+        raises, no new task is started and the exception is raised once the
+        running tasks are finished.
+        """
+        results = {}
+        pending = dict(self.tasks)
+        running = {}
+        error = None
+        while pending or running:
+            if error is None:
+                for name, (func, args, kwargs, depends) in list(pending.items()):
+                    if depends.issubset(results):
+                        args = [
+                            value.resolve(results) if isinstance(value, TaskResult) else value
+                            for value in args
+                        ]
+                        kwargs = {
+                            key: value.resolve(results) if isinstance(value, TaskResult) else value
+                            for key, value in kwargs.items()
+                        }
+                        running[executor.submit(_run_timed, func, args, kwargs)] = name
+                        del pending[name]
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    results[name], self.timings[name] = future.result()
+                except Exception as e:
+                    if error is None:
+                        error = e
+        if error is not None:
+            raise error
+        return results
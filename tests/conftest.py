@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# the modules of the repository are flat, at its root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import write_camx_inputs
+
+@pytest.fixture
+def camx_inputs(tmp_path):
+    # a small synthetic day of CAMx inputs: (directory, file names)
+    files = write_camx_inputs(str(tmp_path), NumLayer=4, NumRow=12, NumColumn=14, NumSpecies=3)
+    return str(tmp_path), files
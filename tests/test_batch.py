@@ -0,0 +1,43 @@
+import os
+
+from modify_batch_netcdf import run_batch
+
+WINDOW = {
+    "rowstart": 2, "rowend": 8, "colstart": 3, "colend": 10, "laystart": 0, "layend": 2,
+    "rowindexavg": [4, 10], "columnindexavg": [5, 12], "layerindexavg": [0, 3],
+}
+
+def batch_kwargs(directory, outputdir):
+    return {
+        "directory": directory,
+        "fnameconc": "conc.{date}.nc",
+        "fnamekv": "kv.{date}.nc",
+        "fnamemet2d": "met2d.{date}.nc",
+        "fnamemet3d": "met3d.{date}.nc",
+        "outputdir": outputdir,
+        "outputname": "out.{date}",
+        "stream": False,
+        "timechunk": 1,
+        **WINDOW,
+    }
+
+def test_a_failing_day_does_not_stop_the_batch(camx_inputs, tmp_path):
+    directory, files = camx_inputs
+    for name, filename in files.items():
+        os.rename(f"{directory}/{filename}", f"{directory}/{name}.20190723.nc")
+    # the second day has no conc file
+    for name in ["kv", "met2d", "met3d"]:
+        os.link(f"{directory}/{name}.20190723.nc", f"{directory}/{name}.20190724.nc")
+    os.makedirs(tmp_path/"out")
+    kwargs = batch_kwargs(directory, str(tmp_path/"out"))
+
+    summary = run_batch([("20190724", None, kwargs), ("20190723", None, kwargs)], 2)
+    assert [result["date"] for result in summary]==["20190723", "20190724"]
+    done, failed = summary
+    assert (done["status"], done["success"], done["error"])==("done", True, None)
+    assert (failed["status"], failed["success"])==("failed", False)
+    assert "conc.20190724.nc" in failed["error"]
+    assert all(result["seconds"]>0 for result in summary)
+    written = sorted(os.listdir(tmp_path/"out"))
+    assert "out.20190723_met3d.nc" in written
+    assert not [name for name in written if name.startswith("out.20190724")]
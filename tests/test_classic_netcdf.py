@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from classic_netcdf import is_classic_netcdf, open_classic_dataset
+from netcdf_modifier import netcdf_modifier
+from benchmarks.synthetic import camx_conc
+
+CLASSIC_FORMATS = ["NETCDF3_CLASSIC", "NETCDF3_64BIT"]
+
+def mixed_dataset():
+    # record and non-record variables of every classic type, with odd sizes
+    # so the records are padded
+    rng = np.random.default_rng(0)
+    ds = xr.Dataset(attrs={"title": "mixed", "NCOLS": np.int32(5), "XCELL": 4000.})
+    ds["X"] = ("COL", np.arange(5, dtype=np.float64))
+    ds["layer"] = ("LAY", np.arange(1, 4, dtype=np.int32))
+    ds["flags"] = (("TSTEP", "VAR"), rng.integers(0, 100, (7, 3)).astype(np.int16))
+    ds["bytes"] = (("TSTEP", "COL"), rng.integers(-100, 100, (7, 5)).astype(np.int8))
+    ds["O3"] = (("TSTEP", "LAY", "COL"), rng.random((7, 3, 5), dtype=np.float32), {"units": "ppmV"})
+    ds["temperature"] = (("TSTEP", "COL"), rng.random((7, 5)))
+    ds["temperature"].encoding = {"scale_factor": 0.01, "dtype": "int16", "_FillValue": -9999}
+    ds["temperature"][2, 1] = np.nan
+    ds["name"] = ("COL", np.array(list("abcde"), dtype="S1"))
+    return ds
+
+def assert_read_like_xarray(path):
+    assert is_classic_netcdf(path)
+    ds = open_classic_dataset(path)
+    with xr.open_dataset(path) as expected:
+        xr.testing.assert_identical(ds.load(), expected.load())
+    return ds
+
+@pytest.mark.parametrize("netcdf_format", CLASSIC_FORMATS)
+@pytest.mark.parametrize("unlimited", [True, False])
+def test_classic_files_are_read_like_xarray(tmp_path, netcdf_format, unlimited):
+    path = str(tmp_path/"mixed.nc")
+    mixed_dataset().to_netcdf(path, format=netcdf_format, unlimited_dims=["TSTEP"] if unlimited else None)
+    ds = assert_read_like_xarray(path)
+    assert ds.encoding["unlimited_dims"]==({"TSTEP"} if unlimited else set())
+
+@pytest.mark.parametrize("netcdf_format", CLASSIC_FORMATS)
+def test_single_record_variable_is_not_padded(tmp_path, netcdf_format):
+    path = str(tmp_path/"single.nc")
+    ds = xr.Dataset({"hours": ("TSTEP", np.arange(9, dtype=np.int16)), "X": ("COL", np.arange(3.))})
+    ds.to_netcdf(path, format=netcdf_format, unlimited_dims=["TSTEP"])
+    assert_read_like_xarray(path)
+
+def test_windows_are_read_from_the_memory_map(tmp_path):
+    path = str(tmp_path/"conc.nc")
+    camx_conc(5, 3, 8, 9, 2).to_netcdf(path, format="NETCDF3_64BIT", unlimited_dims=["TSTEP"])
+    ds = open_classic_dataset(path)
+    window = {"TSTEP": slice(1, 4), "LAY": [0, 2], "ROW": slice(2, 7), "COL": slice(1, 8, 3)}
+    with xr.open_dataset(path) as expected:
+        xr.testing.assert_identical(ds.isel(window).load(), expected.isel(window).load())
+
+def test_netcdf4_files_are_not_memory_mapped(tmp_path):
+    conc = camx_conc(5, 3, 8, 9, 2)
+    conc.to_netcdf(tmp_path/"conc4.nc", format="NETCDF4")
+    conc.to_netcdf(tmp_path/"conc3.nc", format="NETCDF3_64BIT", unlimited_dims=["TSTEP"])
+    assert not is_classic_netcdf(str(tmp_path/"conc4.nc"))
+    with pytest.raises(ValueError):
+        open_classic_dataset(str(tmp_path/"conc4.nc"))
+
+    # the modifier reads either one, NETCDF4 through netCDF4
+    arguments = (1, 6, 2, 8, 0, 2, [2, 7], [3, 9], [0, 3])
+    results = {}
+    for memory_map in [True, False]:
+        modifier = netcdf_modifier(str(tmp_path), memory_map=memory_map)
+        for name in ["conc3.nc", "conc4.nc"]:
+            results[memory_map, name] = modifier.modify_conc(name, *arguments)
+    expected_ds, expected_excel = results[False, "conc4.nc"]
+    for new_ds, excel in results.values():
+        for variable in expected_ds.variables:
+            np.testing.assert_array_equal(new_ds[variable].values, expected_ds[variable].values, err_msg=variable)
+        for variable, df in expected_excel.items():
+            np.testing.assert_array_equal(excel[variable].values, df.values, err_msg=variable)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from netcdf_modifier import GRID_DIMS, netcdf_modifier, uniform_profile
+
+def run_day(modifier, files):
+    conc = modifier.modify_conc(files["conc"], 2, 8, 3, 10, 0, 2, [4, 10], [5, 12], [0, 3])[0]
+    met2d = modifier.modify_met_2d(files["met2d"], 2, 8, 3, 10, [4, 10], [5, 12])[0]
+    met3d = modifier.modify_met_3d(met2d, files["met3d"], 2, 8, 3, 10, 0, 2, [4, 10], [5, 12], [0, 3])[0]
+    return {"conc": conc, "met2d": met2d, "met3d": met3d}
+
+def test_compact_variables_are_read_only_views(camx_inputs):
+    directory, files = camx_inputs
+    results = run_day(netcdf_modifier(directory, compact=True), files)
+    for name, ds in results.items():
+        compact = [variable for variable in ds.variables if uniform_profile(ds.variables[variable]) is not None]
+        assert compact, name
+        for variable in compact:
+            var = ds.variables[variable]
+            assert var.dims==GRID_DIMS
+            # a single (TSTEP, LAY) profile stands for the whole grid
+            assert var.data.strides[2:]==(0, 0)
+            assert not var.data.flags.writeable
+            with pytest.raises(ValueError):
+                var.values[0, 0, 0, 0] = 1.
+
+@pytest.mark.parametrize("compression", [None, 4])
+def test_compact_outputs_are_identical(camx_inputs, tmp_path, compression):
+    directory, files = camx_inputs
+    expected = run_day(netcdf_modifier(directory), files)
+    modifier = netcdf_modifier(directory, compact=True)
+    results = run_day(modifier, files)
+    for name, ds in results.items():
+        for variable in expected[name].variables:
+            np.testing.assert_array_equal(ds[variable].values, expected[name][variable].values, err_msg=variable)
+        netcdf_modifier(directory).to_netcdf(expected[name], str(tmp_path), name+"_full.nc", Compression=compression)
+        modifier.to_netcdf(ds, str(tmp_path), name+"_compact.nc", Compression=compression)
+        with xr.open_dataset(tmp_path/f"{name}_full.nc") as full_ds, xr.open_dataset(tmp_path/f"{name}_compact.nc") as compact_ds:
+            xr.testing.assert_identical(compact_ds.load(), full_ds.load())
+            for variable in full_ds.variables:
+                assert compact_ds[variable].encoding.get("chunksizes")==full_ds[variable].encoding.get("chunksizes")
@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import netcdf_modifier as modifier_module
+from netcdf_modifier import netcdf_modifier
+from summary_writer import summary_table
+from benchmarks.synthetic import camx_conc
+
+ARGUMENTS = (2, 8, 3, 10, 0, 2, [4, 10], [5, 12], [0, 3])
+
+def write_hours(ds, path, hours):
+    # the input file as CAMx has written it after its first hours
+    temporary = path+".tmp"
+    ds.isel(TSTEP=slice(0, hours)).to_netcdf(temporary, unlimited_dims=["TSTEP"])
+    os.replace(temporary, path)
+
+@pytest.fixture
+def running_conc(tmp_path):
+    ds = camx_conc(24, 4, 12, 14, 3)
+    os.makedirs(tmp_path/"in")
+    os.makedirs(tmp_path/"out")
+    return ds, str(tmp_path/"in"), str(tmp_path/"out")
+
+def test_append_matches_modify_conc_and_is_idempotent(running_conc):
+    ds, input_directory, output_directory = running_conc
+    modifier = netcdf_modifier(input_directory)
+    path = f"{output_directory}/out.nc"
+
+    write_hours(ds, f"{input_directory}/conc.nc", 10)
+    excel = modifier.modify_conc_append("conc.nc", *ARGUMENTS, output_directory, "out.nc", "out.csv")
+    assert excel["SPEC0"]['hour\\layer'].tolist()==list(range(10))
+    write_hours(ds, f"{input_directory}/conc.nc", 24)
+    excel = modifier.modify_conc_append("conc.nc", *ARGUMENTS, output_directory, "out.nc", "out.csv")
+    assert excel["SPEC0"]['hour\\layer'].tolist()==list(range(10, 24))
+
+    # nothing is left to do the second time
+    with open(path, "rb") as f:
+        written = f.read()
+    with open(f"{output_directory}/out.csv", "rb") as f:
+        summary = f.read()
+    assert modifier.modify_conc_append("conc.nc", *ARGUMENTS, output_directory, "out.nc", "out.csv")=={}
+    with open(path, "rb") as f:
+        assert f.read()==written
+    with open(f"{output_directory}/out.csv", "rb") as f:
+        assert f.read()==summary
+
+    expected_ds, expected_excel = modifier.modify_conc("conc.nc", *ARGUMENTS)
+    with xr.open_dataset(path) as out:
+        assert out.attrs["MODIFIED_TSTEPS"]==24
+        for variable in expected_ds.variables:
+            np.testing.assert_array_equal(out[variable].values, expected_ds[variable].values, err_msg=variable)
+    expected_table = summary_table(expected_excel).sort_values(["species", "layer", "hour"], ignore_index=True)
+    table = pd.read_csv(f"{output_directory}/out.csv", dtype={"layer": "Int64"})
+    table = table.sort_values(["species", "layer", "hour"], ignore_index=True)
+    pd.testing.assert_frame_equal(table, expected_table, check_dtype=False)
+
+def test_interrupted_summary_rows_are_not_written_twice(running_conc):
+    ds, input_directory, output_directory = running_conc
+    modifier = netcdf_modifier(input_directory)
+    write_hours(ds, f"{input_directory}/conc.nc", 10)
+    modifier.modify_conc_append("conc.nc", *ARGUMENTS, output_directory, "out.nc", "out.csv")
+    with open(f"{output_directory}/out.csv", "a") as f:
+        f.write("SPEC0,10,1,0.5\nSPEC0,11,")
+    write_hours(ds, f"{input_directory}/conc.nc", 24)
+    modifier.modify_conc_append("conc.nc", *ARGUMENTS, output_directory, "out.nc", "out.csv")
+    table = pd.read_csv(f"{output_directory}/out.csv", dtype={"layer": "Int64"})
+    assert not table.duplicated(["species", "hour", "layer"]).any()
+    assert len(table)==3*24*4
+
+def test_interrupted_first_call_is_done_again(running_conc, monkeypatch):
+    ds, input_directory, output_directory = running_conc
+    modifier = netcdf_modifier(input_directory)
+    write_hours(ds, f"{input_directory}/conc.nc", 10)
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+    with monkeypatch.context() as patch:
+        patch.setattr(modifier_module, "append_summary", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            modifier.modify_conc_append("conc.nc", *ARGUMENTS, output_directory, "out.nc", "out.csv")
+    with xr.open_dataset(f"{output_directory}/out.nc") as out:
+        assert out.attrs["MODIFIED_TSTEPS"]==0
+
+    excel = modifier.modify_conc_append("conc.nc", *ARGUMENTS, output_directory, "out.nc", "out.csv")
+    assert excel["SPEC0"]['hour\\layer'].tolist()==list(range(10))
+    expected_ds, _ = modifier.modify_conc("conc.nc", *ARGUMENTS)
+    with xr.open_dataset(f"{output_directory}/out.nc") as out:
+        assert out.attrs["MODIFIED_TSTEPS"]==10
+        for variable in expected_ds.variables:
+            np.testing.assert_array_equal(out[variable].values, expected_ds[variable].values, err_msg=variable)
+    table = pd.read_csv(f"{output_directory}/out.csv", dtype={"layer": "Int64"})
+    assert len(table)==3*10*4
+
+def test_append_refuses_other_arguments(running_conc):
+    ds, input_directory, output_directory = running_conc
+    modifier = netcdf_modifier(input_directory)
+    write_hours(ds, f"{input_directory}/conc.nc", 10)
+    modifier.modify_conc_append("conc.nc", *ARGUMENTS, output_directory, "out.nc")
+    with pytest.raises(ValueError, match="with these arguments"):
+        modifier.modify_conc_append("conc.nc", 2, 8, 3, 11, 0, 2, [4, 10], [5, 12], [0, 3], output_directory, "out.nc")
+    write_hours(ds, f"{input_directory}/conc.nc", 5)
+    with pytest.raises(ValueError, match="already has 10"):
+        modifier.modify_conc_append("conc.nc", *ARGUMENTS, output_directory, "out.nc")
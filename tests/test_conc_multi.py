@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from netcdf_modifier import netcdf_modifier, read_windows
+
+HEADER = "name,rowstart,rowend,colstart,colend,laystart,layend,rowindexavg,columnindexavg,layerindexavg\n"
+# overlapping and disjoint windows, of other clipped layers
+ROWS = [
+    'site1,2,8,3,10,0,2,"4,10","5,12","0,3"\n',
+    'site2,0,5,0,6,1,4,"0,3","1,4","0,4"\n',
+    'site3,6,12,8,14,0,1,"7,12","9,14","0,1"\n',
+]
+YAML = """
+- {name: site1, rowstart: 2, rowend: 8, colstart: 3, colend: 10, laystart: 0, layend: 2,
+   rowindexavg: [4, 10], columnindexavg: [5, 12], layerindexavg: [0, 3]}
+- {name: site2, rowstart: 0, rowend: 5, colstart: 0, colend: 6, laystart: 1, layend: 4,
+   rowindexavg: "0,3", columnindexavg: "1,4", layerindexavg: "0,4"}
+- {name: site3, rowstart: 6, rowend: 12, colstart: 8, colend: 14, laystart: 0, layend: 1,
+   rowindexavg: [7, 12], columnindexavg: [9, 14], layerindexavg: [0, 1]}
+"""
+
+@pytest.fixture
+def windows_file(tmp_path):
+    path = tmp_path/"windows.csv"
+    path.write_text(HEADER+"".join(ROWS))
+    return str(path)
+
+def test_read_windows(windows_file, tmp_path):
+    windows = read_windows(windows_file)
+    assert [window["Name"] for window in windows]==["site1", "site2", "site3"]
+    assert windows[0]=={
+        "Name": "site1", "RowStart": 2, "RowEnd": 8, "ColumnStart": 3, "ColumnEnd": 10, "LayerStart": 0,
+        "LayerEnd": 2, "RowIndexAvg": [4, 10], "ColumnIndexAvg": [5, 12], "LayerIndexAvg": [0, 3],
+    }
+    (tmp_path/"windows.yaml").write_text(YAML)
+    assert read_windows(str(tmp_path/"windows.yaml"))==windows
+    with pytest.raises(ValueError, match="csv"):
+        read_windows(str(tmp_path/"windows.txt"))
+
+def test_multi_matches_modify_conc_per_window(camx_inputs, windows_file):
+    directory, files = camx_inputs
+    modifier = netcdf_modifier(directory)
+    windows = read_windows(windows_file)
+    results = modifier.modify_conc_multi(files["conc"], windows)
+    assert len(results)==len(windows)
+    for window, (new_ds, excel) in zip(windows, results):
+        expected_ds, expected_excel = modifier.modify_conc(
+            files["conc"],
+            window["RowStart"],
+            window["RowEnd"],
+            window["ColumnStart"],
+            window["ColumnEnd"],
+            window["LayerStart"],
+            window["LayerEnd"],
+            window["RowIndexAvg"],
+            window["ColumnIndexAvg"],
+            window["LayerIndexAvg"],
+        )
+        assert sorted(new_ds.variables)==sorted(expected_ds.variables)
+        for variable in expected_ds.variables:
+            np.testing.assert_array_equal(new_ds[variable].values, expected_ds[variable].values, err_msg=variable)
+        assert new_ds.attrs==expected_ds.attrs
+        assert list(excel)==list(expected_excel)
+        for variable, df in expected_excel.items():
+            assert [str(column) for column in excel[variable].columns]==[str(column) for column in df.columns]
+            np.testing.assert_array_equal(excel[variable].values, df.values, err_msg=variable)
+
+def test_multi_refuses_a_bad_window(camx_inputs, windows_file):
+    directory, files = camx_inputs
+    windows = read_windows(windows_file)
+    windows[1]["ColumnEnd"] = windows[1]["ColumnStart"]
+    with pytest.raises(ValueError, match="ColumnEnd"):
+        netcdf_modifier(directory).modify_conc_multi(files["conc"], windows)
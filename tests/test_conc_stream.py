@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from netcdf_modifier import netcdf_modifier
+
+ARGUMENTS = (2, 8, 3, 10, 0, 2, [4, 10], [5, 12], [0, 3])
+
+@pytest.mark.parametrize("time_chunk", [1, 5, 24])
+def test_stream_matches_modify_conc(camx_inputs, tmp_path, time_chunk):
+    directory, files = camx_inputs
+    modifier = netcdf_modifier(directory)
+    expected_ds, expected_excel = modifier.modify_conc(files["conc"], *ARGUMENTS)
+    excel = modifier.modify_conc_stream(files["conc"], *ARGUMENTS, str(tmp_path), "stream.nc", time_chunk)
+
+    with xr.open_dataset(tmp_path/"stream.nc") as new_ds:
+        assert sorted(new_ds.variables)==sorted(expected_ds.variables)
+        for variable in expected_ds.variables:
+            np.testing.assert_array_equal(new_ds[variable].values, expected_ds[variable].values, err_msg=variable)
+        assert new_ds.attrs["NCOLS"]==7
+        assert new_ds.attrs["NLAYS"]==2
+    assert list(excel)==list(expected_excel)
+    for variable, df in expected_excel.items():
+        assert [str(column) for column in excel[variable].columns]==[str(column) for column in df.columns]
+        np.testing.assert_array_equal(excel[variable].values, df.values, err_msg=variable)
+
+def test_stream_refuses_an_empty_time_chunk(camx_inputs, tmp_path):
+    directory, files = camx_inputs
+    with pytest.raises(ValueError, match="TimeChunk"):
+        netcdf_modifier(directory).modify_conc_stream(files["conc"], *ARGUMENTS, str(tmp_path), "stream.nc", 0)
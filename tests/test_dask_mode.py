@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from netcdf_modifier import netcdf_modifier
+
+pytest.importorskip("dask")
+
+def assert_same_dataset(new_ds, expected_ds):
+    assert sorted(new_ds.variables)==sorted(expected_ds.variables)
+    for variable in expected_ds.variables:
+        np.testing.assert_array_equal(new_ds[variable].values, expected_ds[variable].values, err_msg=variable)
+
+def assert_same_excel(excel, expected_excel):
+    assert list(excel)==list(expected_excel)
+    for name, df in expected_excel.items():
+        assert [str(column) for column in df.columns]==[str(column) for column in excel[name].columns]
+        np.testing.assert_array_equal(excel[name].values, df.values, err_msg=name)
+
+def run_day(modifier, files, outputdir):
+    # the steps of modify_all, with their netCDF files written to outputdir
+    conc = modifier.modify_conc(files["conc"], 2, 8, 3, 10, 0, 2, [4, 10], [5, 12], [0, 3])
+    kv = modifier.modify_met_kv(files["kv"], 2, 8, 3, 10, 0, 2)
+    met2d = modifier.modify_met_2d(files["met2d"], 2, 8, 3, 10, [4, 10], [5, 12], True)
+    met3d = modifier.modify_met_3d(met2d[0], files["met3d"], 2, 8, 3, 10, 0, 2, [4, 10], [5, 12], [0, 3])
+    for name, ds in [("conc", conc[0]), ("kv", kv), ("met2d", met2d[0]), ("met3d", met3d[0])]:
+        modifier.to_netcdf(ds, outputdir, name+".nc")
+    return {"conc": conc, "met2d": met2d, "met3d": met3d}, kv
+
+@pytest.mark.parametrize("scheduler", ["threads", "synchronous"])
+def test_dask_mode_matches_the_eager_mode(camx_inputs, tmp_path, scheduler):
+    directory, files = camx_inputs
+    (tmp_path/"eager").mkdir()
+    (tmp_path/"dask").mkdir()
+    expected, expected_kv = run_day(netcdf_modifier(directory), files, str(tmp_path/"eager"))
+    results, kv = run_day(netcdf_modifier(directory, dask_scheduler=scheduler, dask_workers=2), files, str(tmp_path/"dask"))
+
+    assert_same_dataset(kv, expected_kv)
+    for name, (expected_ds, expected_excel) in expected.items():
+        new_ds, excel = results[name]
+        assert_same_dataset(new_ds, expected_ds)
+        assert_same_excel(excel, expected_excel)
+    for name in ["conc", "kv", "met2d", "met3d"]:
+        with xr.open_dataset(tmp_path/"eager"/f"{name}.nc") as expected_ds:
+            with xr.open_dataset(tmp_path/"dask"/f"{name}.nc") as new_ds:
+                xr.testing.assert_identical(new_ds.load(), expected_ds.load())
+
+def test_unknown_scheduler_is_refused(camx_inputs):
+    directory, _ = camx_inputs
+    with pytest.raises(ValueError, match="dask_scheduler"):
+        netcdf_modifier(directory, dask_scheduler="distributed")
@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+
+from dataset_pool import DatasetPool
+
+class FakeDataset:
+    # stands for an opened xr.Dataset, only its close matters to the pool
+    def __init__(self) -> None:
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+def slow_opener(opened):
+    def opener():
+        ds = FakeDataset()
+        opened.append(ds)
+        time.sleep(0.05)
+        return ds
+    return opener
+
+def test_concurrent_acquires_share_one_dataset(tmp_path):
+    path = tmp_path/"conc.nc"
+    path.write_bytes(b"conc")
+    pool = DatasetPool()
+    opened = []
+    acquired = []
+    barrier = threading.Barrier(8)
+    def request():
+        barrier.wait()
+        acquired.append(pool.acquire(str(path), "conc", slow_opener(opened)))
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    shared = acquired[0]
+    assert all(ds is shared for ds in acquired)
+    assert len(pool.datasets)==1
+    assert [ds for ds in opened if not ds.closed]==[shared]
+    for ds in acquired:
+        pool.release(ds)
+    pool.close()
+    assert shared.closed
+
+def test_changed_file_is_reopened_and_evicted_datasets_closed_once_released(tmp_path):
+    path = tmp_path/"conc.nc"
+    path.write_bytes(b"conc")
+    pool = DatasetPool(max_size=1)
+    first = pool.acquire(str(path), "conc", FakeDataset)
+    pool.release(first)
+    assert pool.acquire(str(path), "conc", FakeDataset) is first
+    assert (pool.hits, pool.misses)==(1, 1)
+
+    path.write_bytes(b"conc, one more hour")
+    os.utime(path, ns=(0, 0))
+    second = pool.acquire(str(path), "conc", FakeDataset)
+    assert second is not first
+    # the first one is still used, it is closed by its last release
+    assert not first.closed
+    pool.release(first)
+    assert first.closed
+
+    other = tmp_path/"met.nc"
+    other.write_bytes(b"met")
+    pool.release(pool.acquire(str(other), "met", FakeDataset))
+    assert not second.closed
+    pool.release(second)
+    assert second.closed
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from netcdf_modifier import fill_with_mean, netcdf_modifier
+from benchmarks.synthetic import camx_conc
+
+EXCLUDED_VARIABLE = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
+
+def fill_with_loops(new_ds, mean_ds, excluded_variable):
+    # the fill loops netcdf_modifier used before fill_with_mean, for a mean
+    # per hour or per hour and layer
+    for variable in new_ds.variables:
+        if variable not in excluded_variable:
+            for z in range(new_ds.sizes["LAY"]):
+                for t in range(new_ds[variable].shape[0]):
+                    if "LAY" in mean_ds[variable].dims:
+                        new_ds[variable][t,z,:,:] = mean_ds[variable][t,z]
+                    else:
+                        new_ds[variable][t,z,:,:] = mean_ds[variable][t]
+
+def modify_conc_baseline(directory, FileName, clip, window):
+    # modify_conc as it was before the fill engine
+    ds = xr.open_dataset(f"{directory}/{FileName}")
+    selected_ds = ds.isel(window)
+    mean_ds = selected_ds.mean(dim=["ROW", "COL", "LAY"])
+    mean_ds_noavglay = selected_ds.mean(dim=["ROW", "COL"])
+    new_ds = ds.isel(clip).load()
+    fill_with_loops(new_ds, mean_ds, EXCLUDED_VARIABLE)
+    excel_mean_noavglay = {}
+    for variable in mean_ds.variables:
+        if variable not in EXCLUDED_VARIABLE:
+            df = pd.DataFrame()
+            df['hour\\layer'] = [i for i in range(24)]
+            for z in mean_ds_noavglay["layer"].values:
+                df[z] = mean_ds_noavglay[variable][:,z-1]
+            df["averaged"] = mean_ds[variable][:].values.tolist()
+            excel_mean_noavglay[variable] = df
+    ds.close()
+    return new_ds, excel_mean_noavglay
+
+def test_fill_with_mean_per_hour():
+    ds = camx_conc(6, 3, 8, 9, 4)
+    mean_ds = ds.mean(dim=["ROW", "COL", "LAY"])
+    loop_ds = ds.copy(deep=True)
+    fill_ds = ds.copy(deep=True)
+    fill_with_loops(loop_ds, mean_ds, EXCLUDED_VARIABLE)
+    fill_with_mean(fill_ds, mean_ds, EXCLUDED_VARIABLE)
+    for variable in ds.variables:
+        np.testing.assert_array_equal(fill_ds[variable].values, loop_ds[variable].values)
+
+def test_fill_with_mean_per_layer():
+    ds = camx_conc(6, 4, 8, 9, 4)
+    # the clipped layers take the means from the first averaged layer on
+    mean_ds = ds.isel(LAY=slice(1, 4)).mean(dim=["ROW", "COL"])
+    loop_ds = ds.isel(LAY=slice(0, 2)).copy(deep=True)
+    fill_ds = ds.isel(LAY=slice(0, 2)).copy(deep=True)
+    fill_with_loops(loop_ds, mean_ds, EXCLUDED_VARIABLE)
+    fill_with_mean(fill_ds, mean_ds, EXCLUDED_VARIABLE)
+    for variable in loop_ds.variables:
+        np.testing.assert_array_equal(fill_ds[variable].values, loop_ds[variable].values)
+
+def test_fill_with_mean_compact():
+    ds = camx_conc(6, 3, 8, 9, 4)
+    mean_ds = ds.mean(dim=["ROW", "COL", "LAY"])
+    loop_ds = ds.copy(deep=True)
+    fill_ds = ds.copy(deep=True)
+    fill_with_loops(loop_ds, mean_ds, EXCLUDED_VARIABLE)
+    fill_with_mean(fill_ds, mean_ds, EXCLUDED_VARIABLE, Compact=True)
+    for variable in ds.variables:
+        np.testing.assert_array_equal(fill_ds[variable].values, loop_ds[variable].values)
+
+def test_modify_conc_matches_baseline(camx_inputs):
+    directory, files = camx_inputs
+    clip = {"ROW": slice(2, 8), "COL": slice(3, 10), "LAY": slice(0, 2)}
+    # the excel tables of the baseline only work from the first layer on
+    window = {"ROW": slice(4, 10), "COL": slice(5, 12), "LAY": slice(0, 3)}
+    expected_ds, expected_excel = modify_conc_baseline(directory, files["conc"], clip, window)
+
+    modifier = netcdf_modifier(directory)
+    new_ds, excel = modifier.modify_conc(
+        files["conc"], 2, 8, 3, 10, 0, 2, [4, 10], [5, 12], [0, 3],
+    )
+    for variable in expected_ds.variables:
+        np.testing.assert_array_equal(new_ds[variable].values, expected_ds[variable].values)
+    assert list(excel)==list(expected_excel)
+    for variable, df in expected_excel.items():
+        np.testing.assert_array_equal(excel[variable].values, df.values)
+        assert [str(column) for column in excel[variable].columns]==[str(column) for column in df.columns]
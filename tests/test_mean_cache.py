@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import xarray as xr
+
+from mean_cache import MeanCache
+from netcdf_modifier import netcdf_modifier
+from benchmarks.synthetic import write_camx_inputs
+
+WINDOW = {"ROW": slice(4, 10), "COL": slice(5, 12), "LAY": slice(0, 3)}
+
+def test_key_changes_with_the_file_and_the_window(camx_inputs, tmp_path):
+    directory, files = camx_inputs
+    path = f"{directory}/{files['conc']}"
+    cache = MeanCache(str(tmp_path/"cache"))
+    key = cache.key(path, "conc", WINDOW)
+    assert cache.key(path, "conc", dict(WINDOW))==key
+    assert cache.key(path, "conc/index", WINDOW)!=key
+    assert cache.key(path, "conc", {**WINDOW, "ROW": slice(4, 11)})!=key
+    os.utime(path, ns=(0, 0))
+    assert cache.key(path, "conc", WINDOW)!=key
+
+def test_get_returns_what_was_put(tmp_path):
+    cache = MeanCache(str(tmp_path))
+    mean = xr.Dataset({"O3": (("TSTEP", "LAY"), np.arange(6, dtype=np.float32).reshape(3, 2))})
+    assert cache.get("missing") is None
+    cache.put("key", {"mean": mean})
+    cached = cache.get("key")
+    xr.testing.assert_identical(cached["mean"], mean)
+    assert (cache.hits, cache.misses)==(1, 1)
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = MeanCache(str(tmp_path), max_bytes=10**9)
+    mean = xr.Dataset({"O3": ("TSTEP", np.random.default_rng(0).random(1000))})
+    for key in ["a", "b", "c"]:
+        cache.put(key, {"mean": mean})
+    os.utime(cache._path("a"), ns=(1, 1))
+    os.utime(cache._path("b"), ns=(2, 2))
+    cache.get("a")
+    cache.max_bytes = cache.size()-1
+    cache.evict()
+    assert cache.evictions==1
+    assert not os.path.exists(cache._path("b"))
+    assert os.path.exists(cache._path("a")) and os.path.exists(cache._path("c"))
+
+def test_modify_conc_hits_on_another_clip_and_misses_on_a_new_file(camx_inputs, tmp_path):
+    directory, files = camx_inputs
+    cache = MeanCache(str(tmp_path/"cache"))
+    window = ([4, 10], [5, 12], [0, 3])
+    expected_ds, expected_excel = netcdf_modifier(directory).modify_conc(files["conc"], 0, 6, 0, 7, 0, 2, *window)
+
+    modifier = netcdf_modifier(directory, mean_cache=cache)
+    modifier.modify_conc(files["conc"], 2, 8, 3, 10, 0, 2, *window)
+    new_ds, excel = modifier.modify_conc(files["conc"], 0, 6, 0, 7, 0, 2, *window)
+    assert (cache.hits, cache.misses)==(1, 1)
+    for variable in expected_ds.variables:
+        np.testing.assert_array_equal(new_ds[variable].values, expected_ds[variable].values)
+    for variable, df in expected_excel.items():
+        np.testing.assert_array_equal(excel[variable].values, df.values)
+
+    # the same file name with other values must not hit the cache
+    write_camx_inputs(directory, NumLayer=4, NumRow=12, NumColumn=14, NumSpecies=3, seed=5)
+    os.utime(f"{directory}/{files['conc']}", ns=(0, 0))
+    expected_ds, _ = netcdf_modifier(directory).modify_conc(files["conc"], 0, 6, 0, 7, 0, 2, *window)
+    new_ds, _ = modifier.modify_conc(files["conc"], 0, 6, 0, 7, 0, 2, *window)
+    assert (cache.hits, cache.misses)==(1, 2)
+    for variable in expected_ds.variables:
+        np.testing.assert_array_equal(new_ds[variable].values, expected_ds[variable].values)
+
+    # nor another averaging window
+    modifier.modify_conc(files["conc"], 0, 6, 0, 7, 0, 2, [4, 10], [5, 13], [0, 3])
+    assert (cache.hits, cache.misses)==(1, 3)
@@ -0,0 +1,119 @@
+from copy import deepcopy
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from netcdf_modifier import MET2D_RULES, MET3D_RULES, netcdf_modifier
+
+EXCLUDED_VARIABLE = ["X", "Y", "layer", "TFLAG", "ETFLAG", "topo", "z", "longitude", "latitude"]
+
+def fill_with_loops(new_ds, mean_ds, per_layer):
+    # the fill loops of the former met methods
+    for variable in new_ds.variables:
+        if variable not in EXCLUDED_VARIABLE:
+            for z in range(new_ds.sizes["LAY"]):
+                for t in range(new_ds[variable].shape[0]):
+                    new_ds[variable][t,z,:,:] = mean_ds[variable].values[t,z] if per_layer else mean_ds[variable].values[t]
+
+def modify_met_2d_baseline(directory, FileName, clip, window, pbl_windowavg):
+    # modify_met_2d as it was before the rule tables
+    ds = xr.open_dataset(f"{directory}/{FileName}")
+    mean_ds = ds.isel(window).mean(dim=["ROW", "COL"])
+    new_ds = ds.isel(clip).load()
+    fill_with_loops(new_ds, mean_ds, False)
+    for var in ['snowewd', 'snowage', 'tcloudod', 'preciprate', 'cloudtop']:
+        new_ds[var][:] = 0.0
+    if pbl_windowavg:
+        pbl = new_ds.variables['pblwrf'].values
+        new_pbl = deepcopy(pbl)
+        for i in range(2,13):
+            if i==2:
+                new_pbl[i-1] = np.nanmean(pbl[i-2:i], axis=0)
+            else:
+                new_pbl[i-1] = np.nanmean(pbl[i-3:i], axis=0)
+        new_ds.variables['pblwrf'].values = new_pbl
+    for var in ['pblwrf', 'pblcmaq', 'pblysu']:
+        new_ds.variables[var].values[new_ds.variables[var].values<30] = 30
+        new_ds.variables[var].values[new_ds.variables[var].values>2500] = 2500
+    df = pd.DataFrame()
+    df['hour\\layer'] = [i for i in range(25)]
+    for variable in mean_ds.variables:
+        if variable not in EXCLUDED_VARIABLE:
+            df[variable] = mean_ds[variable][:,0]
+    ds.close()
+    return new_ds, {'all': df}
+
+def modify_met_3d_baseline(Dataset2D, directory, FileName, clip, window):
+    # modify_met_3d as it was before the rule tables
+    ds = xr.open_dataset(f"{directory}/{FileName}")
+    mean_ds = ds.isel(window).mean(dim=["ROW", "COL"])
+    new_ds = ds.isel(clip).load()
+    fill_with_loops(new_ds, mean_ds, True)
+    for var in ['cloudwater', 'rainwater', 'grplwater', 'cloudod']:
+        new_ds[var][:] = 0.0
+    new_ds.variables['z'].values[:,1,:,:] = 3000.
+    new_ds.variables['z'].values[:,0,:,:] = Dataset2D.variables['pblwrf'].values[:,0,:,:]
+    new_ds.variables['uwind'].values[:] = 0
+    new_ds.variables['vwind'].values[:,1] = 0.0926
+    new_ds.variables['vwind'].values[:,0] = 0.0
+    excel_mean = {}
+    for variable in mean_ds.variables:
+        if variable not in EXCLUDED_VARIABLE:
+            df = pd.DataFrame()
+            df['hour\\layer'] = [i for i in range(25)]
+            for z in mean_ds["layer"].values:
+                z = int(z)
+                df[z] = mean_ds[variable].values[:,z-1]
+            df["averaged"] = np.nanmean(mean_ds[variable][:].values, axis=1).tolist()
+            excel_mean[variable] = df
+    ds.close()
+    return new_ds, excel_mean
+
+def assert_same_outputs(new_ds, excel, expected_ds, expected_excel):
+    assert sorted(new_ds.variables)==sorted(expected_ds.variables)
+    for variable in expected_ds.variables:
+        np.testing.assert_array_equal(new_ds[variable].values, expected_ds[variable].values, err_msg=variable)
+    assert list(excel)==list(expected_excel)
+    for name, df in expected_excel.items():
+        assert [str(column) for column in excel[name].columns]==[str(column) for column in df.columns]
+        np.testing.assert_array_equal(excel[name].values, df.values, err_msg=name)
+
+@pytest.mark.parametrize("pbl_windowavg", [False, True])
+@pytest.mark.parametrize("compact", [False, True])
+def test_met_rules_match_the_former_resets(camx_inputs, pbl_windowavg, compact):
+    directory, files = camx_inputs
+    clip2d = {"ROW": slice(2, 8), "COL": slice(3, 10)}
+    window2d = {"ROW": slice(4, 10), "COL": slice(5, 12)}
+    expected_2d, expected_excel_2d = modify_met_2d_baseline(directory, files["met2d"], clip2d, window2d, pbl_windowavg)
+    clip3d = {**clip2d, "LAY": slice(0, 3)}
+    window3d = {**window2d, "LAY": slice(0, 4)}
+    expected_3d, expected_excel_3d = modify_met_3d_baseline(expected_2d, directory, files["met3d"], clip3d, window3d)
+
+    modifier = netcdf_modifier(directory, compact=compact)
+    new_2d, excel_2d = modifier.modify_met_2d(files["met2d"], 2, 8, 3, 10, [4, 10], [5, 12], pbl_windowavg=pbl_windowavg)
+    assert_same_outputs(new_2d, excel_2d, expected_2d, expected_excel_2d)
+    new_3d, excel_3d = modifier.modify_met_3d(new_2d, files["met3d"], 2, 8, 3, 10, 0, 3, [4, 10], [5, 12], [0, 4])
+    assert_same_outputs(new_3d, excel_3d, expected_3d, expected_excel_3d)
+
+def test_default_rules_are_the_rule_tables(camx_inputs):
+    directory, files = camx_inputs
+    modifier = netcdf_modifier(directory)
+    default_2d, _ = modifier.modify_met_2d(files["met2d"], 2, 8, 3, 10, [4, 10], [5, 12])
+    new_2d, _ = modifier.modify_met_2d(files["met2d"], 2, 8, 3, 10, [4, 10], [5, 12], Rules=MET2D_RULES)
+    xr.testing.assert_identical(new_2d, default_2d)
+    default_3d, _ = modifier.modify_met_3d(new_2d, files["met3d"], 2, 8, 3, 10, 0, 3, [4, 10], [5, 12], [0, 4])
+    new_3d, _ = modifier.modify_met_3d(
+        new_2d, files["met3d"], 2, 8, 3, 10, 0, 3, [4, 10], [5, 12], [0, 4], Rules=MET3D_RULES,
+    )
+    xr.testing.assert_identical(new_3d, default_3d)
+
+def test_rule_set_variables_are_not_averaged_without_their_means(camx_inputs):
+    directory, files = camx_inputs
+    modifier = netcdf_modifier(directory)
+    new_2d, excel = modifier.modify_met_2d(files["met2d"], 2, 8, 3, 10, [4, 10], [5, 12], KeepRuleMeans=False)
+    expected_2d, _ = modifier.modify_met_2d(files["met2d"], 2, 8, 3, 10, [4, 10], [5, 12])
+    xr.testing.assert_identical(new_2d, expected_2d)
+    assert "snowewd" not in excel["all"].columns
+    assert "sfctemp" in excel["all"].columns
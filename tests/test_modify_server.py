@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from modify_server import ModifyServer
+
+@pytest.fixture
+def server(camx_inputs, tmp_path):
+    directory, files = camx_inputs
+    os.makedirs(tmp_path/"out")
+    server = ModifyServer(2, 1, [directory, str(tmp_path/"out")])
+    yield server
+    server.pool.close()
+
+def conc_request(directory, outputdir, arguments=None):
+    request = {
+        "task": "conc", "directory": directory, "filename": "conc.nc",
+        "rowstart": 2, "rowend": 8, "colstart": 3, "colend": 10, "laystart": 0, "layend": 2,
+        "rowindexavg": [4, 10], "columnindexavg": [5, 12], "layerindexavg": [0, 3],
+        "outputdir": outputdir, "outputname": "out", "summaryformat": "csv",
+    }
+    request.update(arguments or {})
+    return request
+
+def test_requests_under_the_allowed_roots_are_run(server, camx_inputs, tmp_path):
+    directory, files = camx_inputs
+    status, answer = server.run(conc_request(directory, str(tmp_path/"out"), {"filename": files["conc"]}))
+    assert status==200, answer
+    assert all(os.path.exists(path) for path in answer["outputs"])
+
+@pytest.mark.parametrize("outside", [
+    {"outputdir": "/tmp"},
+    {"outputname": "../../out"},
+    {"filename": "/etc/passwd"},
+    {"filename": "../conc.nc"},
+    {"meancache": "/tmp/cache"},
+])
+def test_paths_outside_of_the_allowed_roots_are_refused(server, camx_inputs, tmp_path, outside):
+    directory, files = camx_inputs
+    status, answer = server.run(conc_request(directory, str(tmp_path/"out"), outside))
+    assert status==403
+    assert "allowed roots" in answer["error"]
+    assert server.status()["failures"]==1
+
+def test_symbolic_links_out_of_the_roots_are_refused(server, camx_inputs, tmp_path):
+    directory, files = camx_inputs
+    os.symlink("/tmp", tmp_path/"out"/"link")
+    status, _ = server.run(conc_request(directory, str(tmp_path/"out"/"link"), {"filename": files["conc"]}))
+    assert status==403
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from netcdf_modifier import camx_chunksizes, netcdf_encoding, netcdf_modifier
+from benchmarks.synthetic import camx_conc
+
+@pytest.fixture
+def conc():
+    ds = camx_conc(6, 3, 8, 9, 2)
+    ds["SPEC0"][:] = 0.5
+    # exact in float32, or not
+    ds["exact"] = ("COL", np.arange(9, dtype=np.float64)/4)
+    ds["inexact"] = ("COL", np.arange(9, dtype=np.float64)/3)
+    ds["count"] = ("ROW", np.arange(8, dtype=np.int64))
+    return ds
+
+def test_camx_chunksizes(conc):
+    assert camx_chunksizes(conc["SPEC0"].variable)==(1, 1, 8, 9)
+    assert camx_chunksizes(conc["TFLAG"].variable)==(1, 2, 2)
+    assert camx_chunksizes(conc["topo"].variable)==(8, 9)
+    assert camx_chunksizes(conc["layer"].variable)==(3,)
+
+def test_netcdf_encoding(conc):
+    encoding = netcdf_encoding(conc, "NETCDF4", 4, Downcast=True, Encoding={"SPEC1": {"complevel": 9}})
+    assert encoding["SPEC0"]=={"zlib": True, "complevel": 4, "shuffle": True, "chunksizes": (1, 1, 8, 9)}
+    assert encoding["SPEC1"]["complevel"]==9
+    assert encoding["exact"]["dtype"]==np.float32
+    assert "dtype" not in encoding["inexact"]
+    assert encoding["count"]["dtype"]==np.int32
+    assert netcdf_encoding(conc)["SPEC0"]=={}
+    with pytest.raises(ValueError, match="Format"):
+        netcdf_encoding(conc, "NETCDF5")
+    with pytest.raises(ValueError, match="compressed"):
+        netcdf_encoding(conc, "NETCDF3_64BIT", 4)
+    with pytest.raises(ValueError, match="between"):
+        netcdf_encoding(conc, "NETCDF4", 10)
+
+@pytest.mark.parametrize("netcdf_format", ["NETCDF4", "NETCDF4_CLASSIC"])
+def test_compressed_downcast_round_trip(conc, tmp_path, netcdf_format):
+    modifier = netcdf_modifier(str(tmp_path))
+    modifier.to_netcdf(conc, str(tmp_path), "packed.nc", Format=netcdf_format, Compression=4, Downcast=True)
+    with xr.open_dataset(tmp_path/"packed.nc") as ds:
+        assert ds.attrs==conc.attrs
+        for variable in conc.variables:
+            np.testing.assert_array_equal(ds[variable].values, conc[variable].values, err_msg=variable)
+        assert ds["SPEC0"].encoding["zlib"]
+        assert ds["SPEC0"].encoding["chunksizes"]==(1, 1, 8, 9)
+        assert ds["exact"].encoding["dtype"]==np.float32
+        assert ds["inexact"].encoding["dtype"]==np.float64
+        assert ds["count"].encoding["dtype"]==np.int32
@@ -0,0 +1,47 @@
+import json
+import time
+
+from netcdf_modifier import netcdf_modifier
+from profiler import StageProfiler, rss_bytes
+
+def test_stages_are_recorded_per_method():
+    profiler = StageProfiler(interval=0.001)
+    with profiler.method("modify_conc"):
+        with profiler.stage("read"):
+            grown = bytearray(32*2**20)
+            time.sleep(0.02)
+        with profiler.stage("read"):
+            pass
+        profiler.count("O3", 100, 0.5)
+        profiler.count("O3", 20, 0.25)
+    with profiler.stage("write"):
+        pass
+    profiler.close()
+    report = profiler.report()
+    read = report["stages"]["modify_conc"]["read"]
+    assert read["calls"]==2
+    assert read["seconds"]>=0.02
+    assert read["peak_rss_mib"]>=len(grown)/2**20
+    assert report["stages"]["modify_conc"]["total"]["calls"]==1
+    assert report["stages"]["modify_conc"]["total"]["seconds"]>=read["seconds"]
+    # outside of a method the stages are recorded as "other"
+    assert report["stages"]["other"]["write"]["calls"]==1
+    assert report["variables"]["modify_conc"]["O3"]=={"calls": 2, "cells": 120, "seconds": 0.75}
+    assert report["peak_rss_mib"]>=read["peak_rss_mib"]
+    assert rss_bytes()>0
+
+def test_modifier_methods_are_profiled(camx_inputs, tmp_path):
+    directory, files = camx_inputs
+    profiler = StageProfiler()
+    modifier = netcdf_modifier(directory, profiler=profiler)
+    new_ds, _ = modifier.modify_conc(files["conc"], 2, 8, 3, 10, 0, 2, [4, 10], [5, 12], [0, 3])
+    modifier.to_netcdf(new_ds, str(tmp_path), "out.nc")
+    profiler.close()
+    profiler.write_json(str(tmp_path/"profile.json"))
+    with open(tmp_path/"profile.json") as f:
+        report = json.load(f)
+    stages = report["stages"]["modify_conc"]
+    assert {"total", "open", "read", "fill"}<=set(stages)
+    assert "write" in report["stages"]["to_netcdf"]
+    assert set(report["variables"]["modify_conc"])=={"SPEC0", "SPEC1", "SPEC2"}
+    assert all(stats["cells"]==24*2*6*7 for stats in report["variables"]["modify_conc"].values())
@@ -0,0 +1,50 @@
+import os
+
+import xarray as xr
+
+from netcdf_modifier import netcdf_modifier, plan_reads, read_report
+
+SPECIES = ["SPEC0", "SPEC1", "SPEC2"]
+CLIP = {"ROW": slice(2, 8), "COL": slice(3, 10), "LAY": slice(0, 2)}
+WINDOW = {"ROW": slice(4, 10), "COL": slice(5, 12), "LAY": slice(0, 3)}
+
+def reads_of(plan):
+    return {(read["variable"], read["region"]): read["nbytes"] for read in plan}
+
+def test_plan_reads_byte_counts(camx_inputs):
+    directory, files = camx_inputs
+    with xr.open_dataset(f"{directory}/{files['conc']}") as ds:
+        plan = plan_reads(ds, CLIP, WINDOW, SPECIES)
+    reads = reads_of(plan)
+    # the filled species are only read over their averaging window
+    for variable in SPECIES:
+        assert reads[variable, "window"]==24*3*6*7*4
+        assert (variable, "clip") not in reads
+    # the others are read over the clipped domain, and the variables
+    # without hours over the window as well
+    assert reads["z", "clip"]==24*2*6*7*4
+    assert ("z", "window") not in reads
+    assert reads["X", "clip"]==reads["X", "window"]==7*8
+    assert reads["topo", "clip"]==reads["topo", "window"]==6*7*4
+    assert reads["TFLAG", "clip"]==24*3*2*4
+    assert ("TFLAG", "window") not in reads
+    assert [read["index"] for read in plan if read["variable"]=="SPEC0"]==[WINDOW]
+
+def test_plan_reads_without_a_window(camx_inputs):
+    directory, files = camx_inputs
+    with xr.open_dataset(f"{directory}/{files['kv']}") as ds:
+        reads = reads_of(plan_reads(ds, CLIP, None, ["kv"]))
+    assert ("kv", "clip") not in reads and ("kv", "window") not in reads
+    assert reads["z", "clip"]==25*2*6*7*4
+
+def test_read_report_of_modify_conc(camx_inputs):
+    directory, files = camx_inputs
+    modifier = netcdf_modifier(directory)
+    modifier.modify_conc(files["conc"], 2, 8, 3, 10, 0, 2, [4, 10], [5, 12], [0, 3])
+    report = modifier.read_reports[files["conc"]]
+    path = f"{directory}/{files['conc']}"
+    assert report["file_size"]==os.path.getsize(path)
+    with xr.open_dataset(path) as ds:
+        expected = read_report(path, plan_reads(ds, CLIP, WINDOW, SPECIES))
+    assert report["bytes_read"]==expected["bytes_read"]==sum(read["nbytes"] for read in expected["reads"])
+    assert report["bytes_read"]<report["file_size"]
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from netcdf_modifier import MET2D_RULES, MET3D_RULES, netcdf_modifier, plan_sources
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_plan_sources():
+    unread, skip_layers = plan_sources(MET2D_RULES)
+    assert unread==["snowewd", "snowage", "tcloudod", "preciprate", "cloudtop"]
+    assert skip_layers=={}
+    unread, skip_layers = plan_sources(MET3D_RULES, NumLayer=3)
+    assert unread==["cloudwater", "rainwater", "grplwater", "cloudod", "uwind"]
+    assert skip_layers=={"z": 2, "vwind": 2}
+    # every clipped layer is set by the layer rules
+    unread, skip_layers = plan_sources(MET3D_RULES, NumLayer=2)
+    assert "z" in unread and "vwind" in unread
+    assert skip_layers=={}
+    # a clip rule alone needs the values
+    assert plan_sources({"pblwrf": [{"clip": [30, 2500]}]})==([], {})
+
+def run_met(modifier, files):
+    met2d = modifier.modify_met_2d(files["met2d"], 2, 8, 3, 10, [4, 10], [5, 12], KeepRuleMeans=False)
+    met3d = modifier.modify_met_3d(
+        met2d[0], files["met3d"], 2, 8, 3, 10, 0, 3, [4, 10], [5, 12], [0, 4], KeepRuleMeans=False,
+    )
+    return met2d, met3d
+
+def test_rule_set_variables_are_not_read(camx_inputs, tmp_path):
+    directory, files = camx_inputs
+    modifier = netcdf_modifier(directory)
+    (met2d, _), (met3d, excel3d) = run_met(modifier, files)
+    reads = {
+        name: {(read["variable"], read["region"]): read for read in modifier.read_reports[files[name]]["reads"]}
+        for name in ["met2d", "met3d"]
+    }
+    for variable in ["snowewd", "snowage", "tcloudod", "preciprate", "cloudtop"]:
+        assert not [read for read in reads["met2d"] if read[0]==variable]
+    for variable in ["cloudwater", "rainwater", "grplwater", "cloudod", "uwind"]:
+        assert not [read for read in reads["met3d"] if read[0]==variable]
+        assert variable not in excel3d
+    # only the third clipped layer of z is read
+    assert reads["met3d"]["z", "clip"]["index"]["LAY"]==slice(2, 3)
+
+    # and the written files are the ones of a run that reads them
+    expected = netcdf_modifier(directory)
+    expected2d, _ = expected.modify_met_2d(files["met2d"], 2, 8, 3, 10, [4, 10], [5, 12])
+    expected3d, _ = expected.modify_met_3d(expected2d, files["met3d"], 2, 8, 3, 10, 0, 3, [4, 10], [5, 12], [0, 4])
+    for name, ds, expected_ds in [("met2d", met2d, expected2d), ("met3d", met3d, expected3d)]:
+        modifier.to_netcdf(ds, str(tmp_path), name+"_new.nc")
+        expected.to_netcdf(expected_ds, str(tmp_path), name+"_expected.nc")
+        with xr.open_dataset(tmp_path/f"{name}_new.nc") as new, xr.open_dataset(tmp_path/f"{name}_expected.nc") as old:
+            xr.testing.assert_identical(new.load(), old.load())
+
+@pytest.mark.parametrize("norulemeans", [False, True])
+def test_norulemeans_run(camx_inputs, tmp_path, norulemeans):
+    directory, files = camx_inputs
+    arguments = [
+        sys.executable, os.path.join(ROOT, "modify_all_netcdf.py"), "-d", directory, "-fc", files["conc"],
+        "-fkv", files["kv"], "-fm2", files["met2d"], "-fm3", files["met3d"], "-rs", "2", "-re", "8", "-cs", "3",
+        "-ce", "10", "-ls", "0", "-le", "3", "-ra", "4,10", "-ca", "5,12", "-la", "0,4", "-od", str(tmp_path),
+        "-on", "day", "-sf", "csv",
+    ]
+    subprocess.run(arguments+(["-rm"] if norulemeans else []), check=True, capture_output=True)
+    table = pd.read_csv(tmp_path/"day_met3d.csv")
+    assert ("cloudwater" in set(table["species"]))!=norulemeans
+    assert "tempk" in set(table["species"])
+    with xr.open_dataset(tmp_path/"day_met3d.nc") as ds:
+        np.testing.assert_array_equal(ds["cloudwater"].values, 0)
+        np.testing.assert_array_equal(ds["z"].values[:, 1], 3000)
@@ -0,0 +1,125 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+import xarray as xr
+
+import ingest_zarr
+import modify_all_netcdf
+import modify_batch_netcdf
+import modify_client
+import modify_conc_netcdf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WINDOW = ["-rs", "2", "-re", "8", "-cs", "3", "-ce", "10", "-ls", "0", "-le", "2", "-ra", "4,10", "-ca", "5,12", "-la", "0,3"]
+
+@pytest.fixture
+def dated_inputs(camx_inputs):
+    # the inputs of camx_inputs as the files of the day 20190723
+    directory, files = camx_inputs
+    for name, filename in files.items():
+        os.rename(f"{directory}/{filename}", f"{directory}/{name}.20190723.nc")
+    return directory
+
+@pytest.mark.parametrize("main", [
+    modify_conc_netcdf.main, modify_all_netcdf.main, modify_batch_netcdf.main, ingest_zarr.main, modify_client.main,
+])
+def test_help_and_missing_arguments(main, capsys):
+    with pytest.raises(SystemExit) as exit:
+        main(["--help"])
+    assert exit.value.code==0
+    assert "usage" in capsys.readouterr().out
+    if main is not modify_client.main:
+        with pytest.raises(SystemExit) as exit:
+            main([])
+        assert exit.value.code==2
+
+def test_modify_conc_netcdf(camx_inputs, tmp_path):
+    directory, files = camx_inputs
+    modify_conc_netcdf.main(["-d", directory, "-f", files["conc"], *WINDOW, "-od", directory, "-on", "out", "-sf", "csv"])
+    with xr.open_dataset(f"{directory}/out.nc") as ds:
+        assert (ds.sizes["ROW"], ds.sizes["COL"], ds.sizes["LAY"])==(6, 7, 2)
+    assert os.path.exists(f"{directory}/out.csv")
+
+@pytest.mark.parametrize("flag", [["-wi"], ["-mc", "cache"], ["-cp"]])
+def test_modify_conc_netcdf_refuses_flags_of_one_window(camx_inputs, tmp_path, flag, capsys):
+    directory, files = camx_inputs
+    (tmp_path/"windows.csv").write_text("name,rowstart\n")
+    with pytest.raises(SystemExit) as exit:
+        modify_conc_netcdf.main([
+            "-d", directory, "-f", files["conc"], "-w", str(tmp_path/"windows.csv"), "-od", str(tmp_path), "-on", "out", *flag,
+        ])
+    assert exit.value.code==2
+    assert "can not be used with --windows" in capsys.readouterr().err
+
+def test_modify_all_netcdf(camx_inputs, tmp_path):
+    directory, files = camx_inputs
+    os.makedirs(tmp_path/"out")
+    modify_all_netcdf.main([
+        "-d", directory, "-fc", files["conc"], "-fkv", files["kv"], "-fm2", files["met2d"], "-fm3", files["met3d"],
+        *WINDOW, "-od", str(tmp_path/"out"), "-on", "day", "-sf", "csv", "-p",
+    ])
+    assert sorted(os.listdir(tmp_path/"out"))==sorted(modify_all_netcdf.modify_all_outputs("day", summaryformat="csv"))
+
+def test_modify_batch_netcdf(dated_inputs, tmp_path, capsys):
+    os.makedirs(tmp_path/"out")
+    arguments = [
+        "-d", dated_inputs, "-fc", "conc.{date}.nc", "-fkv", "kv.{date}.nc", "-fm2", "met2d.{date}.nc",
+        "-fm3", "met3d.{date}.nc", *WINDOW, "-od", str(tmp_path/"out"), "-w", "2", "-sm", str(tmp_path/"summary.json"),
+    ]
+    modify_batch_netcdf.main(arguments)
+    with open(tmp_path/"summary.json") as f:
+        assert [day["status"] for day in json.load(f)["days"]]==["done"]
+    # a day without its files fails the batch
+    with pytest.raises(SystemExit) as exit:
+        modify_batch_netcdf.main(arguments+["-sd", "20190723", "-ed", "20190724"])
+    assert exit.value.code==1
+    with open(tmp_path/"summary.json") as f:
+        assert [day["success"] for day in json.load(f)["days"]]==[True, False]
+    assert "20190724 failed" in capsys.readouterr().out
+
+def test_ingest_zarr(dated_inputs):
+    pytest.importorskip("zarr")
+    ingest_zarr.main(["-d", dated_inputs, "-f", "conc.{date}.nc", "-st", "conc.zarr"])
+    with xr.open_zarr(f"{dated_inputs}/conc.zarr") as store, xr.open_dataset(f"{dated_inputs}/conc.20190723.nc") as ds:
+        assert store.sizes["TSTEP"]==ds.sizes["TSTEP"]
+
+def test_modify_server_and_client(camx_inputs, tmp_path, capsys):
+    directory, files = camx_inputs
+    socket = str(tmp_path/"camx.sock")
+    server = subprocess.Popen(
+        [sys.executable, "-c", f"import modify_server; modify_server.main(['-so', {socket!r}, '-ar', {directory!r}])"],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    try:
+        for _ in range(300):
+            if os.path.exists(socket) or server.poll() is not None:
+                break
+            time.sleep(0.1)
+        assert os.path.exists(socket), server.communicate()
+        request = {
+            "task": "conc", "directory": directory, "filename": files["conc"], "rowstart": 2, "rowend": 8,
+            "colstart": 3, "colend": 10, "laystart": 0, "layend": 2, "rowindexavg": [4, 10],
+            "columnindexavg": [5, 12], "layerindexavg": [0, 3], "outputdir": directory, "outputname": "out",
+            "summaryformat": "csv",
+        }
+        (tmp_path/"request.json").write_text(json.dumps(request))
+        modify_client.main(["-so", socket, str(tmp_path/"request.json")])
+        assert os.path.exists(f"{directory}/out.nc")
+        capsys.readouterr()
+        modify_client.main(["-so", socket])
+        status = json.loads(capsys.readouterr().out)
+        assert (status["requests"], status["failures"])==(1, 0)
+        # a request out of the allowed roots fails the client
+        request["outputdir"] = str(tmp_path.parent)
+        (tmp_path/"request.json").write_text(json.dumps(request))
+        with pytest.raises(SystemExit) as exit:
+            modify_client.main(["-so", socket, str(tmp_path/"request.json")])
+        assert exit.value.code==1
+    finally:
+        server.terminate()
+        server.wait(30)
+    assert not os.path.exists(socket)
@@ -0,0 +1,116 @@
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from shard_claims import ClaimDirectory, shard_items
+
+NAMES = [f"2019-07-{day:02d}" for day in range(1, 21)]
+
+def claim_all(directory, barrier, results):
+    # claims every name at the same time as the other processes, and
+    # keeps the locks until every process is done
+    claims = ClaimDirectory(directory)
+    barrier.wait()
+    won = [name for name in NAMES if claims.claim(name) is not None]
+    results.put((os.getpid(), won))
+    barrier.wait()
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+def write_lock(claims, name, host, pid, age=0):
+    with open(claims.lock_path(name), "w") as f:
+        json.dump({"token": "other", "host": host, "pid": pid, "claimed": time.time()-age}, f)
+    os.utime(claims.lock_path(name), (time.time()-age, time.time()-age))
+
+def test_shard_items():
+    items = list(range(10))
+    shards = [shard_items(items, index, 3) for index in range(3)]
+    assert shards==[[0, 3, 6, 9], [1, 4, 7], [2, 5, 8]]
+    with pytest.raises(ValueError):
+        shard_items(items, 3, 3)
+    with pytest.raises(ValueError):
+        shard_items(items, 0, 0)
+
+def test_concurrent_claims_have_one_winner(tmp_path):
+    workers = 6
+    barrier = multiprocessing.Barrier(workers)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=claim_all, args=(str(tmp_path), barrier, results)) for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    won = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode==0
+    winners = [name for _, names in won for name in names]
+    assert sorted(winners)==sorted(NAMES)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp") or name.endswith(".broken")]
+
+def test_stale_locks_are_taken_over(tmp_path):
+    claims = ClaimDirectory(str(tmp_path), stale_seconds=60, heartbeat_seconds=1)
+    # a live job of another host
+    write_lock(claims, "fresh", "other-host", 1)
+    assert claims.claim("fresh") is None
+    # a job of another host that stopped touching its lock
+    write_lock(claims, "old", "other-host", 1, age=120)
+    assert claims.claim("old") is not None
+    # a job of this host that died
+    write_lock(claims, "dead", claims.host, dead_pid())
+    token = claims.claim("dead")
+    assert token is not None
+    with open(claims.lock_path("dead")) as f:
+        assert json.load(f)["token"]==token
+    # a job of this host that still runs
+    write_lock(claims, "alive", claims.host, os.getpid())
+    assert claims.claim("alive") is None
+
+def test_release_only_removes_its_own_lock(tmp_path):
+    claims = ClaimDirectory(str(tmp_path))
+    token = claims.claim("day")
+    claims.release("day", "not-the-token")
+    assert os.path.exists(claims.lock_path("day"))
+    assert claims.claim("day") is None
+    claims.release("day", token)
+    assert not os.path.exists(claims.lock_path("day"))
+
+def test_completed_items_are_done_until_their_files_change(tmp_path):
+    claims = ClaimDirectory(str(tmp_path/"claims"))
+    source, output = tmp_path/"conc.nc", tmp_path/"out.nc"
+    source.write_bytes(b"input")
+    output.write_bytes(b"output")
+    token = claims.claim("day")
+    with pytest.raises(FileNotFoundError):
+        claims.complete("day", token, [str(tmp_path/"missing.nc")], [str(source)])
+    claims.complete("day", token, [str(output)], [str(source)])
+    assert claims.is_done("day")
+    assert not os.path.exists(claims.lock_path("day"))
+    assert claims.claim("day") is None
+
+    # a newer input file makes the item due again
+    os.utime(source, ns=(0, 0))
+    assert not claims.is_done("day")
+    claims.complete("day", claims.claim("day"), [str(output)], [str(source)])
+    assert claims.is_done("day")
+    # and so does a truncated output file
+    output.write_bytes(b"out")
+    assert not claims.is_done("day")
+
+def test_heartbeat_keeps_the_lock_fresh(tmp_path):
+    claims = ClaimDirectory(str(tmp_path), stale_seconds=1, heartbeat_seconds=0.05)
+    token = claims.claim("day")
+    os.utime(claims.lock_path("day"), (0, 0))
+    with claims.heartbeat("day", token):
+        time.sleep(0.3)
+    assert time.time()-os.stat(claims.lock_path("day")).st_mtime<1
+    with pytest.raises(ValueError):
+        ClaimDirectory(str(tmp_path), stale_seconds=1, heartbeat_seconds=1)
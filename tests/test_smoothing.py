@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from netcdf_modifier import smooth_in_time
+from benchmarks.synthetic import camx_met2d
+
+def smooth_with_loops(values, window, hour_start, hour_end):
+    # each hour is the NaN-mean of the original values of the window hours
+    # that end at it, cut at hour 0
+    smoothed = values.copy()
+    for hour in range(hour_start, hour_end):
+        smoothed[hour] = np.nanmean(values[max(hour-window+1, 0):hour+1], axis=0)
+    return smoothed
+
+@pytest.fixture
+def met2d():
+    ds = camx_met2d(25, 5, 6)
+    ds["pblwrf"][3, 0, 2, 2] = np.nan
+    return ds
+
+# a window of one hour keeps the NaN as the mean of nothing
+@pytest.mark.filterwarnings("ignore:Mean of empty slice")
+@pytest.mark.parametrize("window, hour_start, hour_end", [(3, 1, 12), (3, 0, 25), (1, 1, 12), (5, 2, 4), (30, 20, 25)])
+def test_smooth_in_time_matches_the_loops(met2d, window, hour_start, hour_end):
+    expected = {variable: smooth_with_loops(met2d[variable].values, window, hour_start, hour_end) for variable in ["pblwrf", "sfctemp"]}
+    untouched = met2d["snowage"].values.copy()
+    smooth_in_time(met2d, ["pblwrf", "sfctemp", "missing"], window, hour_start, hour_end)
+    for variable, values in expected.items():
+        np.testing.assert_array_equal(met2d[variable].values, values, err_msg=variable)
+        assert met2d[variable].dtype==np.float32
+    np.testing.assert_array_equal(met2d["snowage"].values, untouched)
+
+def test_smooth_in_time_window_edges(met2d):
+    values = met2d["pblwrf"].values.copy()
+    smooth_in_time(met2d, ["pblwrf"], 3, 1, 12)
+    smoothed = met2d["pblwrf"].values
+    np.testing.assert_array_equal(smoothed[0], values[0])
+    np.testing.assert_allclose(smoothed[1], (values[0]+values[1])/2, rtol=1e-6)
+    np.testing.assert_allclose(smoothed[11], (values[9]+values[10]+values[11])/3, rtol=1e-6)
+    np.testing.assert_array_equal(smoothed[12:], values[12:])
+    # the NaN of hour 3 is left out of the windows that have it
+    np.testing.assert_allclose(smoothed[4, 0, 2, 2], (values[2, 0, 2, 2]+values[4, 0, 2, 2])/2, rtol=1e-6)
+
+def test_smooth_in_time_lazily(met2d):
+    dask = pytest.importorskip("dask")
+    expected = met2d.copy(deep=True)
+    smooth_in_time(expected, ["pblwrf"], 3, 1, 12)
+    lazy = met2d.chunk({"TSTEP": 1})
+    smooth_in_time(lazy, ["pblwrf"], 3, 1, 12)
+    assert isinstance(lazy["pblwrf"].data, dask.array.Array)
+    assert lazy["pblwrf"].chunks==met2d.chunk({"TSTEP": 1})["pblwrf"].chunks
+    xr.testing.assert_identical(lazy.compute(), expected)
+
+@pytest.mark.parametrize("window, hour_start, hour_end", [(0, 1, 12), (3, -1, 12), (3, 5, 5), (3, 6, 2), (3, 1, 26)])
+def test_smooth_in_time_refuses_bad_hours(met2d, window, hour_start, hour_end):
+    with pytest.raises(ValueError, match="Window|HourStart"):
+        smooth_in_time(met2d, ["pblwrf"], window, hour_start, hour_end)
+
+def test_smooth_in_time_refuses_integer_variables(met2d):
+    met2d["count"] = met2d["pblwrf"].fillna(0).astype(np.int32)
+    with pytest.raises(ValueError, match="float"):
+        smooth_in_time(met2d, ["count"])
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from mean_cache import MeanCache
+from netcdf_modifier import netcdf_modifier
+from species_selection import NOT_SPECIES, SPECIES_GROUPS, expand_patterns, select_species
+from benchmarks.synthetic import camx_conc
+
+NAMES = ["O3", "NO", "NO2", "SOA1", "SOA2", "PAN"]
+
+@pytest.fixture
+def conc_directory(tmp_path):
+    ds = camx_conc(4, 3, 9, 11, len(NAMES))
+    ds = ds.rename({f"SPEC{i}": name for i, name in enumerate(NAMES)})
+    ds.to_netcdf(tmp_path/"conc.nc")
+    return str(tmp_path)
+
+def test_expand_patterns():
+    assert expand_patterns(["O3", "@nox", "SOA*"])==["O3", "NO", "NO2", "SOA*"]
+    with pytest.raises(ValueError, match="unknown species group @nope"):
+        expand_patterns(["@nope"])
+
+@pytest.mark.parametrize("include, exclude, expected", [
+    (None, None, NAMES),
+    (["O3"], None, ["O3"]),
+    (["SOA*"], None, ["SOA1", "SOA2"]),
+    (["NO?"], None, ["NO2"]),
+    (["@nox", "O3"], None, ["O3", "NO", "NO2"]),
+    (None, ["@ozone"], ["SOA1", "SOA2"]),
+    (["@ozone"], ["PAN", "NO*"], ["O3"]),
+    (["o3"], None, []),
+])
+def test_select_species(include, exclude, expected):
+    assert select_species(NOT_SPECIES + NAMES, include, exclude)==expected
+
+def test_groups_have_no_duplicates():
+    for group, species in SPECIES_GROUPS.items():
+        assert len(set(species))==len(species), group
+
+def test_unknown_group_is_refused_before_any_file_is_read(tmp_path):
+    with pytest.raises(ValueError, match="unknown species group"):
+        netcdf_modifier(str(tmp_path/"missing"), species=["@nope"])
+    with pytest.raises(ValueError, match="unknown species group"):
+        netcdf_modifier(str(tmp_path/"missing"), exclude_species=["@nope"])
+
+def test_modify_conc_drops_the_other_species(conc_directory):
+    arguments = ("conc.nc", 2, 8, 3, 10, 0, 2, [4, 9], [5, 11], [0, 3])
+    expected_ds, expected_excel = netcdf_modifier(conc_directory).modify_conc(*arguments)
+    modifier = netcdf_modifier(conc_directory, species=["@nox", "SOA*"], exclude_species=["SOA2"])
+    new_ds, excel = modifier.modify_conc(*arguments)
+    assert [variable for variable in new_ds.variables if variable not in NOT_SPECIES]==["NO", "NO2", "SOA1"]
+    assert all(variable in new_ds.variables for variable in ["X", "Y", "layer", "TFLAG", "ETFLAG", "z"])
+    assert list(excel)==["NO", "NO2", "SOA1"]
+    for variable in new_ds.variables:
+        np.testing.assert_array_equal(new_ds[variable].values, expected_ds[variable].values, err_msg=variable)
+    for variable, df in excel.items():
+        np.testing.assert_array_equal(df.values, expected_excel[variable].values)
+
+def test_modify_conc_refuses_an_empty_selection(conc_directory):
+    modifier = netcdf_modifier(conc_directory, species=["CO"])
+    with pytest.raises(ValueError, match="no species"):
+        modifier.modify_conc("conc.nc", 2, 8, 3, 10, 0, 2, [4, 9], [5, 11], [0, 3])
+
+def test_cached_means_are_kept_per_selection(conc_directory, tmp_path):
+    cache = MeanCache(str(tmp_path/"cache"))
+    arguments = ("conc.nc", 2, 8, 3, 10, 0, 2, [4, 9], [5, 11], [0, 3])
+    netcdf_modifier(conc_directory, mean_cache=cache, species=["O3"]).modify_conc(*arguments)
+    new_ds, excel = netcdf_modifier(conc_directory, mean_cache=cache).modify_conc(*arguments)
+    assert (cache.hits, cache.misses)==(0, 2)
+    assert list(excel)==NAMES
+    assert all(name in new_ds.variables for name in NAMES)
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from summary_writer import SUMMARY_FORMATS, summary_table, write_summary
+
+@pytest.fixture
+def excel():
+    df = pd.DataFrame({"hour\\layer": [0, 1, 2]})
+    df[1] = [0.1, np.nan, 1/3]
+    df[2] = [np.inf, -np.inf, 2.5]
+    df["averaged"] = [1e-30, 12345.678, np.nan]
+    return {"O3": df}
+
+def test_summary_table(excel):
+    table = summary_table(excel)
+    assert list(table.columns)==["species", "hour", "layer", "value"]
+    assert table["hour"].tolist()==[0, 1, 2]*3
+    assert table["layer"].tolist()==[1]*3 + [2]*3 + [pd.NA]*3
+    np.testing.assert_array_equal(table["value"].to_numpy(), excel["O3"][[1, 2, "averaged"]].to_numpy().ravel("F"))
+
+@pytest.mark.parametrize("summary_format", SUMMARY_FORMATS)
+def test_summary_files_read_back(excel, tmp_path, summary_format):
+    table = summary_table(excel)
+    path = str(tmp_path/f"summary.{summary_format}")
+    write_summary(table, path, summary_format)
+    if summary_format=="parquet":
+        read = pd.read_parquet(path)
+    elif summary_format=="csv":
+        read = pd.read_csv(path, dtype={"layer": "Int64"})
+    else:
+        import openpyxl
+        rows = list(openpyxl.load_workbook(path, read_only=True).active.values)
+        assert list(rows[0])==list(table.columns)
+        read = pd.DataFrame(rows[1:], columns=rows[0])
+        # the non-finite values are empty cells, Excel has no value for them
+        expected = table["value"].where(np.isfinite(table["value"]), np.nan)
+        np.testing.assert_array_equal(read["value"].astype(float).to_numpy(), expected.to_numpy())
+        assert [row[2] for row in rows[1:]]==[1]*3 + [2]*3 + [None]*3
+        return
+    pd.testing.assert_frame_equal(read, table, check_dtype=False)
@@ -0,0 +1,60 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from task_graph import InlineExecutor, TaskGraph, TaskResult
+
+def pair(a, b):
+    return a, b
+
+def test_results_are_passed_to_the_tasks_that_depend_on_them():
+    graph = TaskGraph()
+    graph.add("first", pair, 1, 2)
+    graph.add("second", pair, TaskResult("first", 1), b=TaskResult("first"))
+    graph.add("third", pair, 3, 4, after=["second"])
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = graph.run(executor)
+    assert results=={"first": (1, 2), "second": (2, (1, 2)), "third": (3, 4)}
+    assert set(graph.timings)=={"first", "second", "third"}
+
+def test_add_refuses_unknown_and_duplicate_tasks():
+    graph = TaskGraph()
+    graph.add("first", pair, 1, 2)
+    with pytest.raises(ValueError, match="already exists"):
+        graph.add("first", pair, 1, 2)
+    with pytest.raises(ValueError, match="unknown task"):
+        graph.add("second", pair, TaskResult("missing"), 2)
+    with pytest.raises(ValueError, match="unknown task"):
+        graph.add("third", pair, 1, 2, after=["missing"])
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_an_error_stops_the_dependent_tasks_without_deadlock(parallel):
+    ran = []
+    release = threading.Event()
+    def failing():
+        raise RuntimeError("broken met 2D")
+    def slow():
+        # an independent task that is still running when the error comes
+        release.wait(5)
+        ran.append("slow")
+    def dependent(value):
+        ran.append("dependent")
+    graph = TaskGraph()
+    graph.add("met2d", failing)
+    graph.add("conc", slow)
+    graph.add("met3d", dependent, TaskResult("met2d"))
+    graph.add("excel", dependent, 1, after=["met3d"])
+    if parallel:
+        executor = ThreadPoolExecutor(max_workers=4)
+    else:
+        release.set()
+        executor = InlineExecutor()
+    with executor:
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        with pytest.raises(RuntimeError, match="broken met 2D"):
+            graph.run(executor)
+        timer.cancel()
+    # the running task was waited for, the dependent ones never started
+    assert ran==["slow"]
@@ -0,0 +1,186 @@
+import numpy as np
+import pytest
+
+from netcdf_modifier import netcdf_modifier
+from modify_all_netcdf import modify_all, modify_all_outputs
+from uamiv import GRID_DIMS, MET_NAMES, MET_VARIABLES, UAMIV_HEADER, _words, is_uamiv, open_uamiv_dataset, write_uamiv
+from benchmarks.synthetic import camx_conc, camx_kv, camx_met2d, camx_met3d
+
+SPECIES = ["SPEC0", "SPEC1", "SPEC2"]
+# the variables of the netCDF files that the UAM-IV files do not have
+NOT_UAMIV = ["longitude", "latitude", "topo"]
+
+@pytest.fixture
+def conc():
+    # a conc dataset with the variables a UAM-IV file has
+    ds = camx_conc(4, 3, 9, 11, 3)[["X", "Y", "layer", "TFLAG", "ETFLAG"] + SPECIES]
+    ds.attrs.update({"XCELL": 4000., "YCELL": 4000., "XORIG": -2000., "YORIG": -2000.})
+    return ds
+
+@pytest.mark.parametrize("order", [">", "<"])
+def test_round_trip(conc, tmp_path, order):
+    path = str(tmp_path/"conc.bin")
+    size = write_uamiv(conc, path, order)
+    assert size==(tmp_path/"conc.bin").stat().st_size
+    assert is_uamiv(path)
+    ds = open_uamiv_dataset(path)
+    assert ds.encoding["byteorder"]==order
+    assert ds.attrs["UAMIV_NAME"]=="AVERAGE"
+    assert [variable for variable in ds.data_vars if ds[variable].dims==GRID_DIMS]==SPECIES
+    for variable in ["X", "Y", "layer", "TFLAG", "ETFLAG"] + SPECIES:
+        np.testing.assert_array_equal(ds[variable].values, conc[variable].values, err_msg=variable)
+
+def test_clipped_grid_keeps_its_origin(conc, tmp_path):
+    path = str(tmp_path/"clip.bin")
+    clipped = conc.isel(ROW=slice(3, 7), COL=slice(5, 10))
+    write_uamiv(clipped, path)
+    ds = open_uamiv_dataset(path)
+    assert (ds.attrs["XORIG"], ds.attrs["YORIG"])==(18000., 10000.)
+    assert (ds.attrs["NCOLS"], ds.attrs["NROWS"])==(5, 4)
+    np.testing.assert_array_equal(ds["X"].values, clipped["X"].values)
+    np.testing.assert_array_equal(ds["Y"].values, clipped["Y"].values)
+    for variable in SPECIES:
+        np.testing.assert_array_equal(ds[variable].values, clipped[variable].values)
+
+def test_clipped_grid_origin_in_km(conc, tmp_path):
+    path = str(tmp_path/"clip.bin")
+    clipped = conc.isel(ROW=slice(3, 7), COL=slice(5, 10))
+    for coordinate in ["X", "Y"]:
+        clipped[coordinate] = clipped[coordinate]/1000.
+        clipped[coordinate].attrs["units"] = "km"
+    write_uamiv(clipped, path)
+    ds = open_uamiv_dataset(path)
+    assert (ds.attrs["XORIG"], ds.attrs["YORIG"])==(18000., 10000.)
+
+def test_unknown_files_are_refused(conc, tmp_path):
+    path = str(tmp_path/"height.bin")
+    with pytest.raises(ValueError, match="concentration"):
+        write_uamiv(conc.assign_attrs(UAMIV_NAME="HEIGHT"), path)
+    write_uamiv(conc, path)
+    # a binary file of another kind has the same first header record with
+    # another name
+    with open(path, "r+b") as f:
+        f.seek(4)
+        f.write(_words("HEIGHT", 10))
+    with pytest.raises(ValueError, match="neither"):
+        open_uamiv_dataset(path)
+
+def assert_same_variables(ds, expected):
+    assert sorted(ds.data_vars)==sorted(expected.data_vars)
+    for variable in expected.variables:
+        values, expected_values = ds[variable].values, expected[variable].values
+        if variable in ["TFLAG", "ETFLAG"]:
+            # the synthetic files do not count z in their flags
+            values, expected_values = values[:, 0], expected_values[:, 0]
+        np.testing.assert_array_equal(values, expected_values, err_msg=variable)
+
+@pytest.fixture
+def met_inputs(tmp_path):
+    # the kv and met files of one day as netCDF and as UAM-IV files
+    datasets = {
+        "kv": camx_kv(25, 4, 12, 14, 1).drop_vars(NOT_UAMIV+["z"]),
+        "met2d": camx_met2d(25, 12, 14, 2).drop_vars(NOT_UAMIV+["z"]),
+        "met3d": camx_met3d(25, 4, 12, 14, 3).drop_vars(NOT_UAMIV),
+    }
+    for name, ds in datasets.items():
+        ds.to_netcdf(tmp_path/f"{name}.nc")
+        write_uamiv(ds, str(tmp_path/f"{name}.bin"))
+    return datasets, str(tmp_path)
+
+@pytest.mark.parametrize("kind", ["kv", "met2d", "met3d"])
+def test_met_and_kv_headers_and_names(met_inputs, kind):
+    datasets, directory = met_inputs
+    ds = open_uamiv_dataset(f"{directory}/{kind}.bin")
+    assert ds.attrs["UAMIV_NAME"]==MET_NAMES[kind]
+    assert_same_variables(ds, datasets[kind])
+    # the records have the CAMx names
+    with open(f"{directory}/{kind}.bin", "rb") as f:
+        raw = f.read()
+    for name in MET_VARIABLES[kind]:
+        assert (_words(name, 10) in raw)==(MET_VARIABLES[kind][name] in ds)
+    assert _words(ds.attrs["UAMIV_NAME"], 10) in raw
+
+def test_met2d_has_one_record_per_variable_whatever_its_layers(met_inputs, tmp_path):
+    datasets, directory = met_inputs
+    met2d = datasets["met2d"].assign_attrs(NLAYS=4)
+    size = write_uamiv(met2d, str(tmp_path/"layers.bin"))
+    assert size==(tmp_path/"met2d.bin").stat().st_size
+    ds = open_uamiv_dataset(str(tmp_path/"layers.bin"))
+    assert ds.attrs["NLAYS"]==4
+    assert ds.sizes["LAY"]==1
+    np.testing.assert_array_equal(ds["pblwrf"].values, met2d["pblwrf"].values)
+    with pytest.raises(ValueError, match="single layer"):
+        write_uamiv(camx_met3d(2, 3, 4, 5).drop_vars("z").assign_attrs(UAMIV_NAME="2D_MET"), str(tmp_path/"x.bin"))
+
+def test_met_files_without_a_known_name_are_read_by_their_variables(met_inputs, tmp_path):
+    datasets, directory = met_inputs
+    write_uamiv(datasets["met2d"].assign_attrs(UAMIV_NAME="CAMx 2D"), str(tmp_path/"named.bin"))
+    ds = open_uamiv_dataset(str(tmp_path/"named.bin"))
+    assert ds.attrs["UAMIV_NAME"]=="CAMx 2D"
+    np.testing.assert_array_equal(ds["sfctemp"].values, datasets["met2d"]["sfctemp"].values)
+
+def test_modify_met_reads_uamiv_like_netcdf(met_inputs):
+    _, directory = met_inputs
+    modifier = netcdf_modifier(directory)
+    results = {}
+    for extension in [".nc", ".bin"]:
+        kv = modifier.modify_met_kv("kv"+extension, 2, 8, 3, 10, 0, 3)
+        met2d, excel2d = modifier.modify_met_2d("met2d"+extension, 2, 8, 3, 10, [4, 10], [5, 12], pbl_windowavg=True)
+        met3d, excel3d = modifier.modify_met_3d(
+            met2d, "met3d"+extension, 2, 8, 3, 10, 0, 3, [4, 10], [5, 12], [0, 4],
+        )
+        results[extension] = [kv, met2d, met3d, excel2d, excel3d]
+    for expected, new in zip(results[".nc"][:3], results[".bin"][:3]):
+        assert_same_variables(new, expected)
+    for expected, new in zip(results[".nc"][3:], results[".bin"][3:]):
+        assert list(new)==list(expected)
+        for name, df in expected.items():
+            np.testing.assert_array_equal(new[name].values, df.values, err_msg=name)
+
+def test_modify_all_writes_every_file_as_uamiv(met_inputs, conc):
+    datasets, directory = met_inputs
+    conc.to_netcdf(f"{directory}/conc.nc")
+    modify_all(
+        directory, "conc.nc", "kv.bin", "met2d.bin", "met3d.bin", 2, 8, 3, 10, 0, 2, [4, 9], [5, 11], [0, 3],
+        directory, "out", outputformat="UAMIV", summaryformat="csv",
+    )
+    outputs = modify_all_outputs("out", outputformat="UAMIV", summaryformat="csv")
+    assert [output for output in outputs if output.endswith(".bin")]==[
+        "out_conc.bin", "out_kv.bin", "out_met2d.bin", "out_met3d.bin",
+    ]
+    for output, kind in zip(["out_kv.bin", "out_met2d.bin", "out_met3d.bin"], ["kv", "met2d", "met3d"]):
+        ds = open_uamiv_dataset(f"{directory}/{output}")
+        assert ds.attrs["UAMIV_NAME"]==MET_NAMES[kind]
+        assert (ds.sizes["ROW"], ds.sizes["COL"])==(6, 7)
+    assert open_uamiv_dataset(f"{directory}/out_conc.bin").attrs["UAMIV_NAME"]=="AVERAGE"
+
+def test_is_uamiv(conc, tmp_path):
+    conc.to_netcdf(tmp_path/"conc.nc")
+    assert not is_uamiv(str(tmp_path/"conc.nc"))
+    assert not is_uamiv(str(tmp_path))
+    with open(tmp_path/"marker.bin", "wb") as f:
+        f.write(UAMIV_HEADER.to_bytes(4, "little"))
+    assert is_uamiv(str(tmp_path/"marker.bin"))
+
+def test_modify_conc_reads_uamiv_like_netcdf(conc, tmp_path):
+    conc.to_netcdf(tmp_path/"conc.nc")
+    write_uamiv(conc, str(tmp_path/"conc.bin"))
+    modifier = netcdf_modifier(str(tmp_path))
+    arguments = (2, 8, 3, 10, 0, 2, [4, 9], [5, 11], [0, 3])
+    expected_ds, expected_excel = modifier.modify_conc("conc.nc", *arguments)
+    new_ds, excel = modifier.modify_conc("conc.bin", *arguments)
+    for variable in ["X", "Y", "TFLAG"] + SPECIES:
+        np.testing.assert_array_equal(new_ds[variable].values, expected_ds[variable].values, err_msg=variable)
+    for variable, df in expected_excel.items():
+        np.testing.assert_array_equal(excel[variable].values, df.values)
+
+def test_modified_conc_written_as_uamiv(conc, tmp_path):
+    conc.to_netcdf(tmp_path/"conc.nc")
+    modifier = netcdf_modifier(str(tmp_path))
+    new_ds, _ = modifier.modify_conc("conc.nc", 2, 8, 3, 10, 0, 2, [4, 9], [5, 11], [0, 3])
+    write_uamiv(new_ds, str(tmp_path/"out.bin"))
+    ds = open_uamiv_dataset(str(tmp_path/"out.bin"))
+    np.testing.assert_array_equal(ds["X"].values, new_ds["X"].values)
+    np.testing.assert_array_equal(ds["Y"].values, new_ds["Y"].values)
+    for variable in SPECIES:
+        np.testing.assert_array_equal(ds[variable].values, new_ds[variable].values)
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from netcdf_modifier import netcdf_modifier
+from window_index import WindowMeanIndex
+from benchmarks.synthetic import camx_conc
+
+WINDOWS = [
+    {"ROW": slice(0, 12), "COL": slice(0, 14), "LAY": slice(0, 4)},
+    {"ROW": slice(4, 10), "COL": slice(5, 12), "LAY": slice(1, 3)},
+    {"ROW": slice(7, 8), "COL": slice(13, 14), "LAY": slice(2, 3)},
+]
+
+@pytest.fixture
+def conc_with_nan(tmp_path):
+    ds = camx_conc(5, 4, 12, 14, 2)
+    ds["SPEC1"][2, 1, 3:6, 4:9] = np.nan
+    path = str(tmp_path/"conc.nc")
+    ds.to_netcdf(path)
+    return path
+
+@pytest.mark.parametrize("window", WINDOWS)
+@pytest.mark.parametrize("dims", [["ROW", "COL"], ["ROW", "COL", "LAY"]])
+def test_summed_area_means_match_direct_means(conc_with_nan, window, dims):
+    index = WindowMeanIndex(conc_with_nan)
+    index.build(["SPEC0", "SPEC1"])
+    with xr.open_dataset(conc_with_nan) as ds:
+        direct = ds[["SPEC0", "SPEC1"]].isel(window).mean(dim=dims)
+        means = index.mean_dataset(["SPEC0", "SPEC1"], window, dims)
+        for variable in ["SPEC0", "SPEC1"]:
+            assert means[variable].dims==direct[variable].dims
+            assert means[variable].dtype==direct[variable].dtype
+            np.testing.assert_allclose(means[variable].values, direct[variable].values, rtol=1e-6)
+
+def test_index_is_rebuilt_when_the_file_changes(conc_with_nan):
+    WindowMeanIndex(conc_with_nan).build(["SPEC0"])
+    camx_conc(5, 4, 12, 14, 2, seed=1).to_netcdf(conc_with_nan)
+    os.utime(conc_with_nan, ns=(0, 0))
+    index = WindowMeanIndex(conc_with_nan)
+    assert not index.meta["variables"]
+    with pytest.raises(KeyError):
+        index.window_sum("SPEC0", WINDOWS[1])
+    index.build(["SPEC0"])
+    with xr.open_dataset(conc_with_nan) as ds:
+        direct = ds["SPEC0"].isel(WINDOWS[1]).mean(dim=["ROW", "COL"])
+        means = index.mean_dataset(["SPEC0"], WINDOWS[1], ["ROW", "COL"])
+        np.testing.assert_allclose(means["SPEC0"].values, direct.values, rtol=1e-6)
+
+def test_modify_conc_with_the_index_matches_direct_means(camx_inputs):
+    directory, files = camx_inputs
+    window = ([4, 10], [5, 12], [0, 3])
+    modifier = netcdf_modifier(directory)
+    direct_ds, direct_excel = modifier.modify_conc(files["conc"], 2, 8, 3, 10, 0, 2, *window)
+    index_ds, index_excel = modifier.modify_conc(files["conc"], 2, 8, 3, 10, 0, 2, *window, WindowIndex=True)
+    assert os.path.isdir(f"{directory}/{files['conc']}.sat")
+    for variable in direct_ds.variables:
+        np.testing.assert_allclose(index_ds[variable].values, direct_ds[variable].values, rtol=1e-6)
+    for variable, df in direct_excel.items():
+        np.testing.assert_allclose(index_excel[variable].values, df.values, rtol=1e-6)
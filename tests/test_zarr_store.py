@@ -0,0 +1,109 @@
+import json
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from classic_netcdf import is_classic_netcdf
+from netcdf_modifier import netcdf_modifier
+from uamiv import is_uamiv
+from zarr_store import STORE_FORMAT, append_zarr_store, flag_seconds, is_zarr_store, open_zarr_store, store_sources
+from benchmarks.synthetic import camx_conc, camx_met2d
+
+def on_day(ds, first_date):
+    # ds with its hours counted from 000000 of the julian day first_date
+    ds = ds.copy(deep=True)
+    hours = np.arange(ds.sizes["TSTEP"])
+    for variable, shift in [("TFLAG", 0), ("ETFLAG", 1)]:
+        ds[variable].values[:, :, 0] = (first_date + (hours+shift)//24)[:, np.newaxis]
+        ds[variable].values[:, :, 1] = ((hours+shift)%24*10000)[:, np.newaxis]
+    return ds
+
+@pytest.fixture
+def conc_days(tmp_path):
+    # three consecutive days of conc files
+    days = [on_day(camx_conc(24, 3, 9, 11, 2, seed=i), 2019204+i) for i in range(3)]
+    names = [f"conc.{2019204+i}.nc" for i in range(3)]
+    for ds, name in zip(days, names):
+        ds.to_netcdf(tmp_path/name)
+    return str(tmp_path), names, days
+
+def test_flag_seconds():
+    flags = np.array([[2019204, 230000], [2019204, 240000], [2019205, 0], [2019365, 240000], [2020001, 10000]])
+    seconds = flag_seconds(flags)
+    assert seconds[1]==seconds[2]
+    assert seconds[4]-seconds[3]==3600
+    assert seconds[1]-seconds[0]==3600
+
+def test_ingest_then_append_equals_the_concatenated_files(conc_days):
+    directory, names, days = conc_days
+    modifier = netcdf_modifier(directory)
+    assert modifier.ingest_zarr(names[:2], "conc.zarr", Chunks={"ROW": 4, "COL": 4})==names[:2]
+    assert modifier.ingest_zarr(names, "conc.zarr")==names[2:]
+    assert modifier.ingest_zarr(names, "conc.zarr")==[]
+    path = f"{directory}/conc.zarr"
+    assert is_zarr_store(path)
+    assert store_sources(path)==[[name, 24] for name in names]
+
+    # the variables without TSTEP are the ones of the first file
+    expected = xr.concat(days, dim="TSTEP", data_vars="minimal", coords="minimal", compat="override")
+    with open_zarr_store(path) as store:
+        assert list(store.variables)==list(days[0].variables)
+        for variable in expected.variables:
+            np.testing.assert_array_equal(store[variable].values, expected[variable].values, err_msg=variable)
+
+    expected.to_netcdf(f"{directory}/conc.nc")
+    arguments = (2, 8, 3, 10, 0, 2, [4, 9], [5, 11], [0, 3])
+    expected_ds, _ = modifier.modify_conc("conc.nc", *arguments)
+    new_ds, _ = modifier.modify_conc("conc.zarr", *arguments)
+    for variable in expected_ds.variables:
+        np.testing.assert_array_equal(new_ds[variable].values, expected_ds[variable].values, err_msg=variable)
+
+def test_ingest_refuses_files_out_of_order(conc_days):
+    directory, names, _ = conc_days
+    modifier = netcdf_modifier(directory)
+    modifier.ingest_zarr(names[1:2], "conc.zarr")
+    with pytest.raises(ValueError, match="not the first ones"):
+        modifier.ingest_zarr(names, "conc.zarr")
+    assert modifier.ingest_zarr(names, "conc.zarr", Overwrite=True)==names
+
+def test_boundary_hour_of_met_days_is_stored_once(tmp_path):
+    # met days have 25 hours, the last one is the first hour of the next day
+    days = [on_day(camx_met2d(25, 6, 7, seed=i), 2019204+i) for i in range(3)]
+    path = str(tmp_path/"met2d.zarr")
+    for i, ds in enumerate(days):
+        append_zarr_store(ds, path, f"met2d.{i}.nc")
+    assert store_sources(path)==[["met2d.0.nc", 25], ["met2d.1.nc", 24], ["met2d.2.nc", 24]]
+    with open_zarr_store(path) as store:
+        assert store.sizes["TSTEP"]==73
+        seconds = flag_seconds(store["TFLAG"].values[:, 0])
+        np.testing.assert_array_equal(np.diff(seconds), 3600)
+        # the first file keeps the boundary hour
+        np.testing.assert_array_equal(store["pblwrf"].values[24], days[0]["pblwrf"].values[24])
+        np.testing.assert_array_equal(store["pblwrf"].values[25], days[1]["pblwrf"].values[1])
+    with pytest.raises(ValueError, match="already in"):
+        append_zarr_store(days[1], path, "met2d.1.nc")
+
+def test_interrupted_append_is_detected(conc_days, tmp_path):
+    directory, names, days = conc_days
+    path = str(tmp_path/"conc.zarr")
+    append_zarr_store(days[0], path, names[0])
+    # hours written without their SOURCE_FILES entry
+    days[1].drop_vars(["X", "Y", "layer", "longitude", "latitude", "topo"]).to_zarr(
+        path, append_dim="TSTEP", consolidated=True, **STORE_FORMAT,
+    )
+    with pytest.raises(ValueError, match="ingest it again"):
+        open_zarr_store(path)
+
+def test_store_markers(tmp_path):
+    assert not is_zarr_store(str(tmp_path))
+    assert not is_zarr_store(str(tmp_path/"missing"))
+    v3 = tmp_path/"v3.zarr"
+    v3.mkdir()
+    with open(v3/"zarr.json", "w") as f:
+        json.dump({"zarr_format": 3, "node_type": "group", "attributes": {"SOURCE_FILES": '[["a.nc", 24]]'}}, f)
+    assert is_zarr_store(str(v3))
+    assert store_sources(str(v3))==[["a.nc", 24]]
+    # the file checks of the other formats do not open directories
+    assert not is_uamiv(str(v3))
+    assert not is_classic_netcdf(str(v3))
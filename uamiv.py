@@ -0,0 +1,354 @@
+import os
+import numpy as np
+import xarray as xr
+from xarray.core import indexing
+from classic_netcdf import MemmapArray
+
+# length of the first header record of a UAM-IV file, which starts the file
+UAMIV_HEADER = 304
+GRID_DIMS = ("TSTEP", "LAY", "ROW", "COL")
+# names of the UAM-IV concentration files
+CONC_NAMES = ["AVERAGE", "INSTANT", "AIRQUALITY"]
+# names of the UAM-IV met and kv files by their kind
+MET_NAMES = {"met3d": "3D_MET", "met2d": "2D_MET", "kv": "KV"}
+# netCDF names of the variables of the UAM-IV met and kv files by their
+# kind, the other variables are lower-cased when read and upper-cased when
+# written
+MET_VARIABLES = {
+    "met3d": {
+        "ZGRID_M": "z",
+        "PRESS_MB": "press",
+        "TEMP_K": "tempk",
+        "HUMID_PPM": "humidity",
+        "UWIND_MpS": "uwind",
+        "VWIND_MpS": "vwind",
+        "CLDWTR_GM3": "cloudwater",
+        "RNWTR_GM3": "rainwater",
+        "SNWTR_GM3": "snowwater",
+        "GRWTR_GM3": "grplwater",
+        "CLDOD": "cloudod",
+    },
+    "met2d": {
+        "TSURF_K": "sfctemp",
+        "SNOWEW_M": "snowewd",
+        "SNOWAGE_HR": "snowage",
+        "PRATE_MMpH": "preciprate",
+        "CLDTOP_KM": "cloudtop",
+        "TCLDOD": "tcloudod",
+        "PBL_WRF_M": "pblwrf",
+        "PBL_CMAQ_M": "pblcmaq",
+        "PBL_YSU_M": "pblysu",
+    },
+    "kv": {"KV": "kv"},
+}
+
+def _byte_order(first:bytes) -> str:
+    # byte order of a UAM-IV file from its first record marker, or None
+    if int.from_bytes(first, "big")==UAMIV_HEADER:
+        return ">"
+    if int.from_bytes(first, "little")==UAMIV_HEADER:
+        return "<"
+    return None
+
+def is_uamiv(path:str) -> bool:
+    """
+    Returns True if the file at path is a CAMx concentration, met or kv
+    file in the UAM-IV binary format (Fortran unformatted records), in
+    either byte order.
+    """
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return _byte_order(f.read(4)) is not None
+
+def _characters(raw:bytes) -> str:
+    # CAMx writes each character in its own 4-byte word
+    return raw[0::4].decode("ascii", errors="replace").strip()
+
+def _words(text:str, size:int) -> bytes:
+    # the inverse of _characters, padded with spaces to size characters
+    return b"".join(c.encode("ascii")+b"   " for c in text.ljust(size)[:size])
+
+def _file_kind(file_name:str, names:list) -> str:
+    # "conc", "met3d", "met2d" or "kv" from the name of a UAM-IV file, or
+    # from its variables if the name is not a known one, or None
+    if file_name in CONC_NAMES:
+        return "conc"
+    for kind, name in MET_NAMES.items():
+        if file_name==name:
+            return kind
+    for kind in ["met3d", "met2d"]:
+        if set(names) & set(MET_VARIABLES[kind]):
+            return kind
+    if names==["KV"]:
+        return "kv"
+    return None
+
+def _dataset_kind(ds:xr.Dataset) -> str:
+    # the kind of UAM-IV file ds is written as, from its UAMIV_NAME
+    # attribute or else from its variables, or None
+    kind = None
+    if "kv" in ds.variables:
+        kind = "kv"
+    for met in ["met3d", "met2d"]:
+        if kind is None and set(ds.variables) & (set(MET_VARIABLES[met].values())-{"z"}):
+            kind = met
+    if "UAMIV_NAME" in ds.attrs:
+        named = _file_kind(str(ds.attrs["UAMIV_NAME"]), [])
+        return kind if named is None else named
+    return kind or "conc"
+
+def _header_dtype(order:str, nspec:int) -> np.dtype:
+    # the four header records of a single-segment UAM-IV file
+    i4, f4 = order+"i4", order+"f4"
+    return np.dtype([
+        ("l1", i4), ("name", "S40"), ("note", "S240"), ("nseg", i4), ("nspec", i4),
+        ("ibdate", i4), ("btime", f4), ("iedate", i4), ("etime", f4), ("t1", i4),
+        ("l2", i4), ("plon", f4), ("plat", f4), ("iutm", i4), ("xorg", f4), ("yorg", f4),
+        ("delx", f4), ("dely", f4), ("nx", i4), ("ny", i4), ("nz", i4), ("iproj", i4),
+        ("istag", i4), ("tlat1", f4), ("tlat2", f4), ("rdum", f4), ("t2", i4),
+        ("l3", i4), ("segment", i4, (4,)), ("t3", i4),
+        ("l4", i4), ("species", "S40", (nspec,)), ("t4", i4),
+    ])
+
+def _hour_dtype(order:str, nspec:int, nz:int, ny:int, nx:int) -> np.dtype:
+    # the time record and the nspec*nz species records of one hour
+    i4, f4 = order+"i4", order+"f4"
+    record = np.dtype([("l", i4), ("ione", i4), ("name", "S40"), ("data", f4, (ny, nx)), ("t", i4)])
+    return np.dtype([
+        ("l", i4), ("ibdate", i4), ("btime", f4), ("iedate", i4), ("etime", f4), ("t", i4),
+        ("records", record, (nspec*nz,)),
+    ])
+
+def open_uamiv_dataset(path:str) -> xr.Dataset:
+    """
+    Opens a CAMx UAM-IV binary concentration file (AVERAGE, INSTANT or
+    AIRQUALITY), met file or kv file through a read-only memory map and
+    returns it laid out like the CAMx netCDF files, so the modify methods
+    read either format.
+    ...
+    Parameters
+    ----------
+    path : str
+        path of the UAM-IV file, see is_uamiv
+
+    Returns
+    -------
+    xr.Dataset
+        that is lazy: each species is a (TSTEP, LAY, ROW, COL) strided view
+        of the records of the file, and only the records of the windows
+        that are indexed are read. It has X and Y (the cell centres), layer,
+        TFLAG and ETFLAG like the netCDF files, and the header in its
+        attributes. The met and kv variables have the netCDF names of
+        MET_VARIABLES, e.g. TEMP_K is tempk.
+
+    Raises
+    ------
+    ValueError
+        if the file is neither a UAM-IV concentration, met nor kv file, or
+        has more than one segment
+
+    Caveat
+    -------
+    The hours are counted from the size of the file, and an hour that is
+    still being written is left out, so a file that CAMx is still writing
+    can be read. The file has no longitude, latitude or topo. The kind
+    of file is taken from its name (CONC_NAMES or MET_NAMES), or else from
+    its variables. A 2D met file has a single layer of records whatever
+    the number of layers of its header, which is kept in NLAYS.
+    """
+    memmap = np.memmap(path, dtype=np.uint8, mode="r")
+    order = _byte_order(bytes(memmap[:4]))
+    if order is None:
+        raise ValueError(f"{path} is not a UAM-IV file")
+    nspec = int(np.frombuffer(memmap, dtype=order+"i4", count=1, offset=4+280+4)[0])
+    header = np.frombuffer(memmap, dtype=_header_dtype(order, nspec), count=1)[0]
+    file_name = _characters(header["name"])
+    if header["nseg"]!=1:
+        raise ValueError(f"{path} has {header['nseg']} segments, only one is supported")
+    if header["l4"]!=40*nspec:
+        raise ValueError(f"{path} is not a UAM-IV file of a single grid")
+    names = [_characters(name) for name in header["species"]]
+    kind = _file_kind(file_name, names)
+    if kind is None:
+        raise ValueError(f"{path} is a CAMx {file_name or 'unnamed'} file, neither a concentration, met nor kv file")
+    nx, ny, nz = int(header["nx"]), int(header["ny"]), int(header["nz"])
+    # a 2D met file has one record of each variable
+    layers = 1 if kind=="met2d" else nz
+    hour = _hour_dtype(order, nspec, layers, ny, nx)
+    begin = header.dtype.itemsize
+    ntime = (memmap.size-begin)//hour.itemsize
+    hours = np.ndarray((ntime,), dtype=hour, buffer=memmap, offset=begin)
+
+    record = hour["records"].base
+    raw = {}
+    raw["X"] = xr.Variable("COL", float(header["xorg"]) + float(header["delx"])*(np.arange(nx)+0.5))
+    raw["Y"] = xr.Variable("ROW", float(header["yorg"]) + float(header["dely"])*(np.arange(ny)+0.5))
+    raw["layer"] = xr.Variable("LAY", np.arange(1, layers+1, dtype=np.int32))
+    for variable, date, time in [("TFLAG", "ibdate", "btime"), ("ETFLAG", "iedate", "etime")]:
+        # times are stored as HHMM, the netCDF files have HHMMSS
+        flag = np.stack([hours[date], np.round(hours[time]*100)], axis=-1).astype(np.int32)
+        raw[variable] = xr.Variable(
+            ("TSTEP", "VAR", "DATE-TIME"), np.repeat(flag[:, None, :], nspec, axis=1),
+        )
+    for s, name in enumerate(names):
+        # species records are ordered by species then layer within each hour
+        offset = begin + hour.fields["records"][1] + s*layers*record.itemsize + record.fields["data"][1]
+        strides = (hour.itemsize, record.itemsize, 4*nx, 4)
+        data = MemmapArray(memmap, (ntime, layers, ny, nx), np.dtype(order+"f4"), offset, strides)
+        if kind!="conc":
+            name = MET_VARIABLES[kind].get(name, name.lower())
+        raw[name] = xr.Variable(GRID_DIMS, indexing.LazilyIndexedArray(data))
+
+    attrs = {
+        "UAMIV_NAME": file_name,
+        "NOTE": _characters(header["note"]),
+        "XORIG": float(header["xorg"]),
+        "YORIG": float(header["yorg"]),
+        "XCELL": float(header["delx"]),
+        "YCELL": float(header["dely"]),
+        "NCOLS": nx,
+        "NROWS": ny,
+        "NLAYS": nz,
+        "NVARS": nspec,
+        "PLON": float(header["plon"]),
+        "PLAT": float(header["plat"]),
+        "IUTM": int(header["iutm"]),
+        "IPROJ": int(header["iproj"]),
+        "ISTAG": int(header["istag"]),
+        "TLAT1": float(header["tlat1"]),
+        "TLAT2": float(header["tlat2"]),
+    }
+    ds = xr.Dataset(raw, attrs=attrs)
+    ds.encoding["source"] = path
+    ds.encoding["unlimited_dims"] = {"TSTEP"}
+    ds.encoding["byteorder"] = order
+    return ds
+
+def write_uamiv(ds:xr.Dataset, path:str, ByteOrder:str=">") -> int:
+    """
+    Writes the (TSTEP, LAY, ROW, COL) variables of ds to path as a CAMx
+    UAM-IV binary concentration, met or kv file, one hour at a time, and
+    returns the number of bytes written.
+    ...
+    Parameters
+    ----------
+    ds : xr.Dataset
+        like the ones returned by the modify methods or open_uamiv_dataset.
+        It is written as the file named by its UAMIV_NAME attribute (one of
+        CONC_NAMES or MET_NAMES), or else as a kv, 3D met or 2D met file if
+        it has their variables (see MET_VARIABLES), or as an AVERAGE file
+    path : str
+        path of the UAM-IV file
+    ByteOrder : str
+        ">" for big-endian like CAMx writes by default, or "<"
+
+    Raises
+    ------
+    ValueError
+        if ds has no (TSTEP, LAY, ROW, COL) variable, or one whose name is
+        longer than 10 characters, or its UAMIV_NAME is not one of
+        CONC_NAMES or MET_NAMES, or it is a 2D met file of more than one
+        layer
+
+    Caveat
+    -------
+    The times are taken from TFLAG and ETFLAG. The origin of the grid is
+    the first cell centre of X and Y less half a cell, so a clipped ds
+    keeps its place, and the cell size is XCELL and YCELL, or the spacing
+    of X and Y if ds does not have them. Only one hour of the variables is
+    in memory at a time. The layer heights z are only written to a 3D met
+    file, and the header of a 2D met file has the number of layers of its
+    NLAYS attribute.
+    """
+    kind = _dataset_kind(ds)
+    species = [
+        variable for variable in ds.data_vars
+        if ds[variable].dims==GRID_DIMS and not (kind in ["met2d", "kv"] and variable=="z")
+    ]
+    if kind in MET_VARIABLES:
+        names = {netcdf: binary for binary, netcdf in MET_VARIABLES[kind].items()}
+        names = [names.get(variable, variable.upper()) for variable in species]
+    else:
+        names = species
+    # ----------------------------------------------------------------------
+    # Error checking
+    if (kind is None):
+        raise ValueError(
+            "only the UAM-IV concentration ("+", ".join(CONC_NAMES)+"), met and kv ("+
+            ", ".join(MET_NAMES.values())+") files are written"
+        )
+    if (not species):
+        raise ValueError("ds has no (TSTEP, LAY, ROW, COL) variable to write")
+    if (max(len(name) for name in names)>10):
+        raise ValueError("the variables of a UAM-IV file have at most 10 characters")
+    if (kind=="met2d" and ds[species[0]].shape[1]!=1):
+        raise ValueError("a 2D met file has a single layer")
+    if (ByteOrder not in [">", "<"]):
+        raise ValueError("ByteOrder must be '>' or '<'")
+    # -----------------------------------------------------------------------
+
+    ntime, layers, ny, nx = ds[species[0]].shape
+    nspec = len(species)
+    attrs = ds.attrs
+    nz = int(attrs.get("NLAYS", layers)) if kind=="met2d" else layers
+    file_name = str(attrs.get("UAMIV_NAME", "AVERAGE" if kind=="conc" else MET_NAMES.get(kind)))
+    def cell(coordinate, size_attr):
+        # cell size and origin of the grid from the cell centres
+        if size_attr in attrs:
+            return float(attrs[size_attr])
+        values = ds[coordinate].values if coordinate in ds else [0.]
+        return float(values[1]-values[0]) if len(values)>1 else 1.
+    def origin(coordinate, origin_attr, size):
+        # origin of the (clipped) grid from its first cell centre, in the
+        # units of the cell size, since the attributes keep the one of the
+        # whole domain
+        if coordinate not in ds:
+            return float(attrs.get(origin_attr, 0.))
+        values = ds[coordinate].values
+        scale = 1000. if ds[coordinate].attrs.get("units")=="km" else 1.
+        if len(values)>1:
+            scale = size/float(values[1]-values[0])
+        return float(values[0])*scale - size/2
+    delx, dely = cell("X", "XCELL"), cell("Y", "YCELL")
+    xorg, yorg = origin("X", "XORIG", delx), origin("Y", "YORIG", dely)
+
+    flags = {}
+    for variable in ["TFLAG", "ETFLAG"]:
+        source = variable if variable in ds else "TFLAG"
+        flags[variable] = ds[source].values[:, 0, :] if source in ds else np.zeros((ntime, 2), dtype=np.int32)
+
+    header = np.zeros(1, dtype=_header_dtype(ByteOrder, nspec))
+    header["l1"] = header["t1"] = UAMIV_HEADER
+    header["l2"] = header["t2"] = 60
+    header["l3"] = header["t3"] = 16
+    header["l4"] = header["t4"] = 40*nspec
+    header["name"] = _words(file_name, 10)
+    header["note"] = _words(str(attrs.get("NOTE", "")), 60)
+    header["nseg"] = 1
+    header["nspec"] = nspec
+    if ntime:
+        header["ibdate"], header["btime"] = flags["TFLAG"][0, 0], flags["TFLAG"][0, 1]/100
+        header["iedate"], header["etime"] = flags["ETFLAG"][-1, 0], flags["ETFLAG"][-1, 1]/100
+    for key in ["plon", "plat", "iutm", "iproj", "istag", "tlat1", "tlat2"]:
+        header[key] = attrs.get(key.upper(), 0)
+    header["xorg"], header["yorg"], header["delx"], header["dely"] = xorg, yorg, delx, dely
+    header["nx"], header["ny"], header["nz"] = nx, ny, nz
+    header["segment"] = [0, 0, nx, ny]
+    header["species"] = [_words(name, 10) for name in names]
+
+    hour = np.zeros(1, dtype=_hour_dtype(ByteOrder, nspec, layers, ny, nx))
+    records = hour["records"][0]
+    hour["l"] = hour["t"] = 16
+    records["l"] = records["t"] = 4 + 40 + 4*nx*ny
+    records["ione"] = 1
+    records["name"] = np.repeat([_words(name, 10) for name in names], layers)
+    with open(path, "wb") as f:
+        header.tofile(f)
+        for t in range(ntime):
+            hour["ibdate"], hour["btime"] = flags["TFLAG"][t, 0], flags["TFLAG"][t, 1]/100
+            hour["iedate"], hour["etime"] = flags["ETFLAG"][t, 0], flags["ETFLAG"][t, 1]/100
+            for s, variable in enumerate(species):
+                records["data"][s*layers:(s+1)*layers] = ds[variable][t].values
+            hour.tofile(f)
+        return f.tell()
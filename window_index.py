@@ -0,0 +1,170 @@
+import json
+import os
+
+import numpy as np
+import xarray as xr
+
+class WindowMeanIndex:
+    """
+    Summed-area table (integral image) index of the (TSTEP, LAY, ROW, COL)
+    variables of a CAMx netCDF file. Once built, the mean over any
+    rectangular ROW x COL window (and any range of layers) is answered from
+    four corners of the table per hour and layer, whatever the size of the
+    window.
+    ...
+    Parameters
+    ----------
+    FilePath : str
+        path of the netCDF file
+    IndexDirectory : str
+        directory where the index is kept, by default FilePath followed
+        by .sat
+
+    Caveat
+    -------
+    The sums are kept in float64 and the means are returned in the dtype
+    of each variable, so they agree with the xarray means to the float32
+    rounding, not bit for bit. NaN values are skipped like xarray does,
+    through a table of the number of valid values that is only kept for
+    the variables that have NaN values. The index is rebuilt when the size
+    or the modification time of the file changes.
+    """
+    def __init__(self, FilePath:str, IndexDirectory:str=None) -> None:
+        self.path = FilePath
+        self.directory = IndexDirectory if IndexDirectory is not None else FilePath+".sat"
+        self.meta = self._load_meta()
+        pass
+
+    def _fingerprint(self) -> dict:
+        stat = os.stat(self.path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _load_meta(self) -> dict:
+        fingerprint = self._fingerprint()
+        try:
+            with open(os.path.join(self.directory, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+        if meta is None or meta["fingerprint"]!=fingerprint:
+            # the file changed since the index was built (or there is none)
+            meta = {"fingerprint": fingerprint, "variables": {}}
+        return meta
+
+    def _save_meta(self) -> None:
+        with open(os.path.join(self.directory, "meta.json"), "w") as f:
+            json.dump(self.meta, f, indent=2)
+        pass
+
+    def is_valid(self) -> bool:
+        return self.meta["fingerprint"]==self._fingerprint()
+
+    def build(self, Variables:list, ds:xr.Dataset=None) -> None:
+        """
+        Adds the tables of Variables that are not in the index yet,
+        reading one hour at a time. ds is the opened file if the caller
+        already has it.
+        """
+        if not self.is_valid():
+            self.meta = {"fingerprint": self._fingerprint(), "variables": {}}
+        missing = [variable for variable in Variables if variable not in self.meta["variables"]]
+        if not missing:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+
+        close = ds is None
+        if close:
+            ds = xr.open_dataset(self.path)
+        try:
+            for variable in missing:
+                var = ds[variable]
+                ntime, nlay, nrow, ncol = var.shape
+                sums = np.lib.format.open_memmap(
+                    os.path.join(self.directory, f"{variable}.sum.npy"),
+                    mode="w+", dtype=np.float64, shape=(ntime, nlay, nrow+1, ncol+1),
+                )
+                counts = None
+                for t in range(ntime):
+                    values = var[t].values.astype(np.float64)
+                    valid = ~np.isnan(values)
+                    if counts is None and not valid.all():
+                        counts = np.lib.format.open_memmap(
+                            os.path.join(self.directory, f"{variable}.count.npy"),
+                            mode="w+", dtype=np.int32, shape=(ntime, nlay, nrow+1, ncol+1),
+                        )
+                        # the hours before had no NaN value
+                        counts[:t] = self._full_counts(nlay, nrow, ncol)
+                    sums[t] = 0.
+                    sums[t, :, 1:, 1:] = np.where(valid, values, 0.).cumsum(axis=1).cumsum(axis=2)
+                    if counts is not None:
+                        counts[t] = 0
+                        counts[t, :, 1:, 1:] = valid.cumsum(axis=1, dtype=np.int32).cumsum(axis=2, dtype=np.int32)
+                sums.flush()
+                if counts is not None:
+                    counts.flush()
+                self.meta["variables"][variable] = {
+                    # the dtype of the mean, as xarray gives it
+                    "dtype": str(var.dtype if np.issubdtype(var.dtype, np.floating) else np.float64),
+                    "count": counts is not None,
+                }
+                self._save_meta()
+        finally:
+            if close:
+                ds.close()
+        pass
+
+    @staticmethod
+    def _full_counts(nlay:int, nrow:int, ncol:int) -> np.ndarray:
+        counts = np.zeros((nlay, nrow+1, ncol+1), dtype=np.int32)
+        counts[:, 1:, 1:] = np.arange(1, nrow+1)[:, np.newaxis] * np.arange(1, ncol+1)
+        return counts
+
+    def _corners(self, table:np.ndarray, rows:slice, columns:slice, layers:slice) -> np.ndarray:
+        # sum over the window from the four corners of the table
+        r0, r1, _ = rows.indices(table.shape[2]-1)
+        c0, c1, _ = columns.indices(table.shape[3]-1)
+        table = table[:, layers]
+        return table[:, :, r1, c1] - table[:, :, r0, c1] - table[:, :, r1, c0] + table[:, :, r0, c0]
+
+    def window_sum(self, Variable:str, Window:dict):
+        """
+        Returns the (TSTEP, LAY) sum and number of valid values of Variable
+        over the ROW, COL (and LAY) slices of Window.
+        """
+        if not self.is_valid():
+            raise ValueError(f"the index of {self.path} is out of date, build it again")
+        info = self.meta["variables"][Variable]
+        rows = Window.get("ROW", slice(None))
+        columns = Window.get("COL", slice(None))
+        layers = Window.get("LAY", slice(None))
+
+        sums = np.load(os.path.join(self.directory, f"{Variable}.sum.npy"), mmap_mode="r")
+        total = self._corners(sums, rows, columns, layers)
+        if info["count"]:
+            counts = np.load(os.path.join(self.directory, f"{Variable}.count.npy"), mmap_mode="r")
+            count = self._corners(counts, rows, columns, layers)
+        else:
+            r0, r1, _ = rows.indices(sums.shape[2]-1)
+            c0, c1, _ = columns.indices(sums.shape[3]-1)
+            count = np.full(total.shape, max(r1-r0, 0)*max(c1-c0, 0))
+        return total, count
+
+    def mean_dataset(self, Variables:list, Window:dict, Dims:list) -> xr.Dataset:
+        """
+        Returns the mean of Variables over the slices of Window, reduced
+        along Dims (["ROW", "COL"] or ["ROW", "COL", "LAY"]) like
+        xr.Dataset.mean does.
+        """
+        mean = {}
+        for variable in Variables:
+            total, count = self.window_sum(variable, Window)
+            if "LAY" in Dims:
+                total = total.sum(axis=1)
+                count = count.sum(axis=1)
+                dims = ("TSTEP",)
+            else:
+                dims = ("TSTEP", "LAY")
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values = total/count
+            mean[variable] = (dims, values.astype(self.meta["variables"][variable]["dtype"]))
+        return xr.Dataset(mean)
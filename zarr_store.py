@@ -0,0 +1,175 @@
+from datetime import datetime
+import inspect
+import json
+import os
+import numpy as np
+import xarray as xr
+
+# chunks of the stores: one day of every layer, in tiles of ROW x COL, so
+# a window slab only reads and decompresses the tiles it covers
+STORE_CHUNKS = {"TSTEP": 24, "ROW": 64, "COL": 64}
+
+# the encoding of the input files that is kept in the stores
+KEPT_ENCODING = ["_FillValue", "dtype", "scale_factor", "add_offset", "units", "calendar"]
+
+# the stores are always written in the version 2 format, which xarray
+# names zarr_format since 2024.10 and zarr_version before
+if "zarr_format" in inspect.signature(xr.Dataset.to_zarr).parameters:
+    STORE_FORMAT = {"zarr_format": 2}
+else:
+    STORE_FORMAT = {"zarr_version": 2}
+
+def flag_seconds(Flags:np.ndarray) -> np.ndarray:
+    """
+    Returns the seconds since 1970 of the [YYYYDDD, HHMMSS] rows of Flags
+    (e.g. TFLAG[:, 0]), so that the 240000 of a day and the 000000 of the
+    next day are the same time.
+    """
+    days = [(datetime.strptime(str(int(date)), "%Y%j")-datetime(1970, 1, 1)).days for date in Flags[:, 0]]
+    hms = Flags[:, 1].astype(np.int64)
+    return np.array(days, dtype=np.int64)*86400 + hms//10000*3600 + hms//100%100*60 + hms%100
+
+def is_zarr_store(path:str) -> bool:
+    """
+    Returns True if path is a consolidated Zarr store, in the version 2
+    format written by append_zarr_store (.zmetadata) or in the version 3
+    format (zarr.json).
+    """
+    return os.path.isdir(path) and (
+        os.path.isfile(os.path.join(path, ".zmetadata")) or os.path.isfile(os.path.join(path, "zarr.json"))
+    )
+
+def _store_attributes(path:str) -> dict:
+    # attributes of the root group of a version 2 or version 3 store
+    if os.path.isfile(os.path.join(path, "zarr.json")):
+        with open(os.path.join(path, "zarr.json")) as f:
+            return json.load(f).get("attributes", {})
+    if not os.path.isfile(os.path.join(path, ".zattrs")):
+        return {}
+    with open(os.path.join(path, ".zattrs")) as f:
+        return json.load(f)
+
+def store_sources(path:str) -> list:
+    """
+    Returns the [name, hours] of the input files appended to the store at
+    path, in order, or an empty list if there is no store.
+    """
+    if not is_zarr_store(path):
+        return []
+    return json.loads(_store_attributes(path).get("SOURCE_FILES", "[]"))
+
+def open_zarr_store(path:str) -> xr.Dataset:
+    """
+    Opens the Zarr store at path lazily, with one dask chunk per chunk of
+    the store, so the tiles of a window slab are read and decompressed in
+    parallel by dask, and each of them only once.
+    ...
+    Parameters
+    ----------
+    path : str
+        path of the store, see is_zarr_store
+
+    Raises
+    ------
+    ValueError
+        if the store has hours that are not in SOURCE_FILES, left by an
+        append that was interrupted
+
+    Caveat
+    -------
+    The variables are in the order of the input files, and SOURCE_FILES
+    is moved to encoding["source_files"], so the datasets of the store
+    give the same outputs as the input files.
+    """
+    store = xr.open_zarr(path, chunks={}, consolidated=True)
+    sources = json.loads(store.attrs.pop("SOURCE_FILES", "[]"))
+    variables = json.loads(store.attrs.pop("VARIABLES", "[]"))
+    hours = sum(source[1] for source in sources)
+    if "TSTEP" in store.dims and store.sizes["TSTEP"]!=hours:
+        store.close()
+        raise ValueError(f"{path} has {store.sizes['TSTEP']} hours but its files have {hours}, ingest it again")
+    ds = store[[variable for variable in variables if variable in store.variables]]
+    ds.set_close(store.close)
+    ds.encoding["source"] = path
+    ds.encoding["source_files"] = sources
+    ds.encoding["unlimited_dims"] = {"TSTEP"}
+    return ds
+
+def append_zarr_store(
+    ds:xr.Dataset,
+    path:str,
+    Source:str,
+    Chunks:dict=None,
+    Compression:int=5,
+) -> None:
+    """
+    Appends ds, the dataset of the input file Source, to the Zarr store at
+    path along TSTEP, and creates the store with ds if there is none.
+    ...
+    Parameters
+    ----------
+    ds : xr.Dataset
+        one input file, opened lazily, see netcdf_modifier.ingest_zarr
+    path : str
+        path of the store
+    Source : str
+        name of the input file, recorded in the SOURCE_FILES attribute
+    Chunks : dict
+        chunks of the store that replace the ones of STORE_CHUNKS, only
+        used when the store is created
+    Compression : int
+        Blosc lz4 level (1 to 9, or 0 for none) of the chunks, only used
+        when the store is created. lz4 decompresses several times faster
+        than zstd or zlib, for a slightly bigger store.
+
+    Raises
+    ------
+    ValueError
+        if every hour of ds is already in the store
+
+    Caveat
+    -------
+    The hours of ds that are not after the last hour of the store (by
+    TFLAG) are dropped, so the 25th hour of a met day, which is the first
+    hour of the next day, is only stored once. SOURCE_FILES records the
+    hours that were appended. The variables without TSTEP are written by
+    the first file only. The SOURCE_FILES attribute is written last, and
+    the modification time of the store is updated, so the mean cache, the
+    window indexes and the dataset pool see the new hours.
+    """
+    import numcodecs
+    import zarr
+
+    sources = store_sources(path)
+    ds = ds.copy()
+    for var in ds.variables.values():
+        var.encoding = {key: value for key, value in var.encoding.items() if key in KEPT_ENCODING}
+    # the attributes of the store are replaced by every append, and
+    # SOURCE_FILES is only written back once the hours are written
+    ds.attrs.pop("SOURCE_FILES", None)
+    ds.attrs["VARIABLES"] = json.dumps(list(ds.variables))
+    if not sources:
+        chunks = {**STORE_CHUNKS, **(Chunks or {})}
+        compressor = None
+        if Compression:
+            compressor = numcodecs.Blosc("lz4", Compression, shuffle=numcodecs.Blosc.SHUFFLE)
+        for var in ds.variables.values():
+            var.encoding["chunks"] = tuple(min(chunks.get(dim, size), size) for dim, size in zip(var.dims, var.shape))
+            var.encoding["compressor"] = compressor
+        ds.to_zarr(path, mode="w", consolidated=True, **STORE_FORMAT)
+    else:
+        if "TFLAG" in ds:
+            with xr.open_zarr(path, consolidated=True) as store:
+                last = flag_seconds(store["TFLAG"][-1:, 0].values)[0]
+            stored = int(np.searchsorted(flag_seconds(ds["TFLAG"].values[:, 0]), last, side="right"))
+            if stored==ds.sizes["TSTEP"]:
+                raise ValueError(f"every hour of {Source} is already in {path}")
+            ds = ds.isel(TSTEP=slice(stored, None))
+        ds = ds.drop_vars([variable for variable in ds.variables if "TSTEP" not in ds.variables[variable].dims])
+        ds.to_zarr(path, append_dim="TSTEP", consolidated=True, **STORE_FORMAT)
+
+    hours = ds.sizes.get("TSTEP", 0)
+    zarr.open_group(path, mode="r+").attrs["SOURCE_FILES"] = json.dumps(sources+[[Source, hours]])
+    zarr.consolidate_metadata(path)
+    os.utime(path)
+    pass